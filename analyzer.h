@@ -0,0 +1,48 @@
+#ifndef ANALYZER_H
+#define ANALYZER_H
+
+#include <stddef.h>
+#include "ast.h"
+
+/*
+ * analyzer.h
+ * ----------
+ * Embedding API of an analyzer generated with `generator.py --reentrant` and
+ * built as libanalyzer.so (`make library`). The scanner and parser of such an
+ * analyzer keep all of their state in per-call objects, so any number of
+ * threads may call analyzer_parse() at the same time.
+ *
+ * Each result owns its parse tree, allocated from an arena private to that
+ * result; analyzer_free() releases both, from any thread.
+ */
+
+typedef struct AnalyzerResult AnalyzerResult;
+
+/* Parse `length` bytes of `data`. Always returns a result to be released with
+ * analyzer_free(), except NULL when out of memory.
+ */
+AnalyzerResult* analyzer_parse(const char* data, size_t length);
+
+/* 0 on success, otherwise the yyparse() status (1 syntax error, 2 out of
+ * memory) or 3 if the input could not be scanned.
+ */
+int analyzer_status(const AnalyzerResult* result);
+
+/* Message of the first parse error, or "" on success. */
+const char* analyzer_error(const AnalyzerResult* result);
+
+/* Root of the parse tree; NULL unless the status is 0. */
+Node* analyzer_root(const AnalyzerResult* result);
+
+/* Serialize the tree in the binary format of write_ast_binary() (see
+ * tree_binary.py) into a malloc'd buffer for bindings that would rather copy
+ * one flat block than walk Node pointers. Returns 0 on success and -1 if
+ * there is no tree or no memory. Release the buffer with
+ * analyzer_free_buffer().
+ */
+int analyzer_write_binary(const AnalyzerResult* result, char** data, size_t* size);
+void analyzer_free_buffer(char* data);
+
+void analyzer_free(AnalyzerResult* result);
+
+#endif
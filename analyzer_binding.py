@@ -0,0 +1,136 @@
+#!/usr/bin/env python3
+"""
+analyzer_binding.py
+-------------------
+Parse in-process through an analyzer's ``libanalyzer.so`` (ctypes).
+
+Analyzers generated with ``--reentrant`` are also built as a shared library
+exporting the API of ``analyzer.h``. Loading it removes the fork/exec and the
+text serialization of running ``custom_compiler``: a document goes straight
+into ``analyzer_parse`` and the tree comes back as one flat buffer in the
+binary tree format, which `tree_binary.BinaryTree` and `TreeModel` read
+without further parsing.
+
+The parser keeps no global state and ctypes releases the GIL during foreign
+calls, so one `Analyzer` may be used from many threads at once.
+
+Important functions:
+- `load_analyzer(def_file)` - build (or fetch from the cache) and load
+- `Analyzer(library).parse(data)` - ``BinaryTree`` for one document
+- `Analyzer.parse_model(data)` - the same as a `TreeModel`
+"""
+
+import ctypes
+import sys
+from pathlib import Path
+from typing import Union
+
+import build_cache
+import tree_binary
+from tree_model import TreeModel
+
+
+class ParseError(ValueError):
+    """Raised when a document does not parse; ``status`` is the parser status."""
+
+    def __init__(self, message: str, status: int):
+        super().__init__(message)
+        self.status = status
+
+
+class Analyzer:
+    """A loaded ``libanalyzer.so``."""
+
+    def __init__(self, library: Union[str, Path]):
+        self.path = Path(library)
+        lib = ctypes.CDLL(str(self.path.resolve()))
+
+        lib.analyzer_parse.argtypes = [ctypes.c_char_p, ctypes.c_size_t]
+        lib.analyzer_parse.restype = ctypes.c_void_p
+        lib.analyzer_status.argtypes = [ctypes.c_void_p]
+        lib.analyzer_status.restype = ctypes.c_int
+        lib.analyzer_error.argtypes = [ctypes.c_void_p]
+        lib.analyzer_error.restype = ctypes.c_char_p
+        lib.analyzer_write_binary.argtypes = [
+            ctypes.c_void_p,
+            ctypes.POINTER(ctypes.c_void_p),
+            ctypes.POINTER(ctypes.c_size_t),
+        ]
+        lib.analyzer_write_binary.restype = ctypes.c_int
+        lib.analyzer_free_buffer.argtypes = [ctypes.c_void_p]
+        lib.analyzer_free_buffer.restype = None
+        lib.analyzer_free.argtypes = [ctypes.c_void_p]
+        lib.analyzer_free.restype = None
+        self.lib = lib
+
+    def parse_binary(self, data: Union[bytes, str]) -> bytes:
+        """Parse ``data`` and return the tree in the binary tree format.
+
+        Raises `ParseError` if the document does not parse.
+        """
+
+        if isinstance(data, str):
+            data = data.encode('utf-8')
+        lib = self.lib
+        result = lib.analyzer_parse(data, len(data))
+        if not result:
+            raise MemoryError('analyzer_parse failed')
+        try:
+            status = lib.analyzer_status(result)
+            if status != 0:
+                message = lib.analyzer_error(result).decode('utf-8', 'replace').strip()
+                raise ParseError(message, status)
+
+            buffer = ctypes.c_void_p()
+            size = ctypes.c_size_t()
+            if lib.analyzer_write_binary(result, ctypes.byref(buffer), ctypes.byref(size)) != 0:
+                raise ParseError('document produced no tree', status)
+            try:
+                return ctypes.string_at(buffer, size.value)
+            finally:
+                lib.analyzer_free_buffer(buffer)
+        finally:
+            lib.analyzer_free(result)
+
+    def parse(self, data: Union[bytes, str]) -> tree_binary.BinaryTree:
+        """Parse ``data`` into a `tree_binary.BinaryTree`."""
+
+        return tree_binary.BinaryTree(self.parse_binary(data))
+
+    def parse_model(self, data: Union[bytes, str]) -> TreeModel:
+        """Parse ``data`` into a `TreeModel`."""
+
+        return TreeModel.from_binary(self.parse_binary(data))
+
+
+def load_analyzer(def_file: str) -> Analyzer:
+    """Load the library for ``def_file``, building it through the build cache."""
+
+    return Analyzer(build_cache.ensure_library(def_file))
+
+
+def main():
+    import argparse
+
+    parser = argparse.ArgumentParser(description='Parse files in-process with libanalyzer.so')
+    parser.add_argument('def_file', help='Analyzer .def file')
+    parser.add_argument('inputs', nargs='+', help='Input documents')
+    parser.add_argument('--library', help='Use this libanalyzer.so instead of building one')
+
+    args = parser.parse_args()
+
+    analyzer = Analyzer(args.library) if args.library else load_analyzer(args.def_file)
+    failures = 0
+    for path in args.inputs:
+        try:
+            tree = analyzer.parse(Path(path).read_bytes())
+        except ParseError as exc:
+            failures += 1
+            print(f'{path}: {exc}', file=sys.stderr)
+            continue
+        print(f'{path}: {len(tree)} nodes')
+    return 1 if failures else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
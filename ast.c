@@ -4,51 +4,253 @@
  * Implementation of the small AST (parse tree) helper library used by the
  * generated parser. Functions here allocate, print and free Node structures.
  * The generated parser (parser.y) depends on these symbols to construct the
- * in-memory parse tree.
+ * in-memory parse tree, and in turn provides the node type name table.
  */
 
 #include <stdio.h>
 #include <stdlib.h>
 #include <string.h>
 #include <stdarg.h>
+#include <pthread.h>
 #include "ast.h"
 
 /*
- * create_leaf_node
- * -----------------
- * Allocate and return a Node representing a terminal (leaf) with a textual
- * `node_type` and `value`. Both strings are duplicated using `strdup` so the
- * caller may free the originals.
+ * Arena allocator
+ * ---------------
+ * Blocks of AST_ARENA_BLOCK_SIZE bytes are chained together and allocations
+ * are bumped out of the newest block. Requests larger than a block get a
+ * dedicated block. Nothing is freed individually; ast_arena_release() drops
+ * every block at once.
+ *
+ * Each thread allocates from its own current arena (NULL means plain
+ * malloc), so concurrent parses never share allocator state.
+ * ast_arena_enable() selects a per-thread default arena; reentrant parsers
+ * select an arena of their own that travels with the finished tree.
  */
-Node* create_leaf_node(const char* node_type, const char* value) {
-    Node* node = (Node*)malloc(sizeof(Node));
-    node->node_type = strdup(node_type);
-    node->value = value ? strdup(value) : NULL;
+#define AST_ARENA_BLOCK_SIZE (1 << 20)
+
+typedef struct ArenaBlock {
+    struct ArenaBlock* next;
+    size_t used;
+    size_t size;
+    char* data;
+} ArenaBlock;
+
+struct AstArena {
+    ArenaBlock* head;
+};
+
+static _Thread_local AstArena thread_arena;
+static _Thread_local AstArena* current_arena = NULL;
+
+static void* arena_alloc(AstArena* arena, size_t size, size_t align) {
+    ArenaBlock* block = arena->head;
+    size_t offset = block ? (block->used + align - 1) & ~(align - 1) : 0;
+
+    if (!block || offset + size > block->size) {
+        size_t block_size = size > AST_ARENA_BLOCK_SIZE ? size : AST_ARENA_BLOCK_SIZE;
+        block = (ArenaBlock*)malloc(sizeof(ArenaBlock) + block_size);
+        if (!block) {
+            perror("ast arena");
+            exit(1);
+        }
+        /* malloc alignment covers any `align` used by this file */
+        block->data = (char*)(block + 1);
+        block->size = block_size;
+        block->next = arena->head;
+        arena->head = block;
+        offset = 0;
+    }
+
+    block->used = offset + size;
+    return block->data + offset;
+}
+
+static void arena_clear(AstArena* arena) {
+    while (arena->head) {
+        ArenaBlock* next = arena->head->next;
+        free(arena->head);
+        arena->head = next;
+    }
+}
+
+/* Allocate `size` bytes for a Node or pointer array. */
+static void* ast_alloc(size_t size) {
+    if (current_arena) return arena_alloc(current_arena, size, sizeof(void*));
+    return malloc(size);
+}
+
+/* Copy `length` bytes of text plus a NUL, from the arena when one is selected. */
+static char* ast_strndup(const char* text, size_t length) {
+    char* copy = current_arena ? (char*)arena_alloc(current_arena, length + 1, 1)
+                               : (char*)malloc(length + 1);
+    if (!copy) return NULL;
+    memcpy(copy, text, length);
+    copy[length] = '\0';
+    return copy;
+}
+
+void ast_arena_enable(void) {
+    current_arena = &thread_arena;
+}
+
+void ast_arena_release(void) {
+    if (current_arena) arena_clear(current_arena);
+}
+
+AstArena* ast_arena_create(void) {
+    return (AstArena*)calloc(1, sizeof(AstArena));
+}
+
+void ast_arena_destroy(AstArena* arena) {
+    if (!arena) return;
+    arena_clear(arena);
+    free(arena);
+}
+
+AstArena* ast_arena_select(AstArena* arena) {
+    AstArena* previous = current_arena;
+    current_arena = arena;
+    return previous;
+}
+
+/*
+ * Type names
+ * ----------
+ * Ids below ast_type_count index the generator-emitted table. Names that are
+ * not in it (e.g. computed at runtime by a hand-written action) are appended
+ * to a small growable table the first time they are seen. The table is
+ * shared by all threads, so it is guarded by a mutex.
+ */
+static char** extra_type_names = NULL;
+static int extra_type_count = 0;
+static int extra_type_capacity = 0;
+static pthread_mutex_t extra_type_lock = PTHREAD_MUTEX_INITIALIZER;
+
+const char* ast_type_name(int type) {
+    if (type < ast_type_count) return ast_type_names[type];
+    pthread_mutex_lock(&extra_type_lock);
+    const char* name = extra_type_names[type - ast_type_count];
+    pthread_mutex_unlock(&extra_type_lock);
+    return name;
+}
+
+/* Number of known type ids, generated and registered. */
+static int ast_type_total(void) {
+    pthread_mutex_lock(&extra_type_lock);
+    int total = ast_type_count + extra_type_count;
+    pthread_mutex_unlock(&extra_type_lock);
+    return total;
+}
+
+int ast_type_id(const char* name) {
+    for (int i = 0; i < ast_type_count; i++) {
+        if (strcmp(ast_type_names[i], name) == 0) return i;
+    }
+
+    pthread_mutex_lock(&extra_type_lock);
+    for (int i = 0; i < extra_type_count; i++) {
+        if (strcmp(extra_type_names[i], name) == 0) {
+            pthread_mutex_unlock(&extra_type_lock);
+            return ast_type_count + i;
+        }
+    }
+
+    if (extra_type_count == extra_type_capacity) {
+        extra_type_capacity = extra_type_capacity ? extra_type_capacity * 2 : 16;
+        extra_type_names = (char**)realloc(extra_type_names, sizeof(char*) * extra_type_capacity);
+    }
+    extra_type_names[extra_type_count] = strdup(name);
+    int type = ast_type_count + extra_type_count++;
+    pthread_mutex_unlock(&extra_type_lock);
+    return type;
+}
+
+/*
+ * create_leaf_node_id
+ * -------------------
+ * Allocate and return a Node representing a terminal (leaf) with a type id
+ * and textual `value`. The value is duplicated (into the arena when it is
+ * enabled) so the caller may free the original.
+ */
+Node* create_leaf_node_id(int type, const char* value) {
+    return create_leaf_text(type, value, value ? strlen(value) : 0);
+}
+
+/*
+ * Shared input. While enabled, create_leaf_text() points leaf values into
+ * the caller's text instead of copying it; the scanner input (e.g. a memory
+ * mapping) must then outlive every use of the tree. Borrowed values are not
+ * NUL-terminated: always use value_len.
+ */
+static _Thread_local int share_input = 0;
+
+void ast_share_input(int enabled) {
+    share_input = enabled;
+}
+
+/*
+ * create_leaf_text
+ * ----------------
+ * Leaf constructor used by generated scanners: `text` is `length` bytes
+ * (typically yytext/yyleng), so no strlen() is needed. A NULL `text` makes a
+ * leaf without a value.
+ */
+Node* create_leaf_text(int type, const char* text, size_t length) {
+    Node* node = (Node*)ast_alloc(sizeof(Node));
+    node->type = type;
     node->num_children = 0;
     node->children = NULL;
+    node->value_len = text ? (unsigned int)length : 0;
+    node->value_owned = text && !share_input;
+
+    if (!text) {
+        node->value = NULL;
+    } else if (share_input) {
+        node->value = (char*)text;
+    } else {
+        node->value = ast_strndup(text, length);
+    }
     return node;
 }
 
 /*
- * create_node
- * -----------
- * Allocate a non-terminal node with a variable number of child Node* values.
- * Usage in grammar actions looks like: create_node("expr", 2, $1, $2);
+ * Collapse mode. Streaming parsers detach every record subtree as soon as it
+ * is emitted, which leaves the enclosing list rules combining nothing but
+ * NULLs. With collapsing enabled such nodes are not allocated at all, so the
+ * spine above the records does not grow with the input.
  */
-Node* create_node(const char* node_type, int num_children, ...) {
-    Node* node = (Node*)malloc(sizeof(Node));
-    node->node_type = strdup(node_type);
+static _Thread_local int collapse_empty = 0;
+
+void ast_collapse_empty(int enabled) {
+    collapse_empty = enabled;
+}
+
+/* Shared body of the variadic node constructors. */
+static Node* make_node(int type, int num_children, va_list args) {
+    if (collapse_empty && num_children > 0) {
+        va_list scan;
+        int present = 0;
+        va_copy(scan, args);
+        for (int i = 0; i < num_children && !present; i++) {
+            present = va_arg(scan, Node*) != NULL;
+        }
+        va_end(scan);
+        if (!present) return NULL;
+    }
+
+    Node* node = (Node*)ast_alloc(sizeof(Node));
+    node->type = type;
     node->value = NULL;
+    node->value_len = 0;
+    node->value_owned = 0;
     node->num_children = num_children;
 
     if (num_children > 0) {
-        node->children = (Node**)malloc(sizeof(Node*) * num_children);
-        va_list args;
-        va_start(args, num_children);
+        node->children = (Node**)ast_alloc(sizeof(Node*) * num_children);
         for (int i = 0; i < num_children; i++) {
             node->children[i] = va_arg(args, Node*);
         }
-        va_end(args);
     } else {
         node->children = NULL;
     }
@@ -56,45 +258,292 @@ Node* create_node(const char* node_type, int num_children, ...) {
     return node;
 }
 
+/*
+ * create_node_id
+ * --------------
+ * Allocate a non-terminal node with a variable number of child Node* values.
+ * Generated actions look like: create_node_id(AST_expr, 2, $1, $2);
+ */
+Node* create_node_id(int type, int num_children, ...) {
+    va_list args;
+    va_start(args, num_children);
+    Node* node = make_node(type, num_children, args);
+    va_end(args);
+    return node;
+}
+
+/*
+ * create_leaf_node / create_node
+ * ------------------------------
+ * Name-based constructors: resolve the label to a type id and delegate.
+ * Usage in hand-written actions: create_node("expr", 2, $1, $2);
+ */
+Node* create_leaf_node(const char* node_type, const char* value) {
+    return create_leaf_node_id(ast_type_id(node_type), value);
+}
+
+Node* create_node(const char* node_type, int num_children, ...) {
+    va_list args;
+    va_start(args, num_children);
+    Node* node = make_node(ast_type_id(node_type), num_children, args);
+    va_end(args);
+    return node;
+}
+
+/*
+ * Preorder walk
+ * -------------
+ * Trees built from left-recursive list rules are as deep as the input is
+ * long, so every traversal below uses an explicit heap-allocated stack
+ * instead of C recursion. walk_next() pops a node and pushes its non-NULL
+ * children in reverse order, yielding nodes in preorder with their depth.
+ */
+typedef struct {
+    Node* node;
+    int depth;
+} WalkFrame;
+
+typedef struct {
+    WalkFrame* frames;
+    size_t count;
+    size_t capacity;
+} Walk;
+
+static void walk_push(Walk* walk, Node* node, int depth) {
+    if (walk->count == walk->capacity) {
+        walk->capacity = walk->capacity ? walk->capacity * 2 : 256;
+        walk->frames = (WalkFrame*)realloc(walk->frames, sizeof(WalkFrame) * walk->capacity);
+        if (!walk->frames) {
+            perror("ast walk");
+            exit(1);
+        }
+    }
+    walk->frames[walk->count].node = node;
+    walk->frames[walk->count].depth = depth;
+    walk->count++;
+}
+
+static void walk_start(Walk* walk, Node* root, int depth) {
+    walk->frames = NULL;
+    walk->count = 0;
+    walk->capacity = 0;
+    if (root) walk_push(walk, root, depth);
+}
+
+static int walk_next(Walk* walk, Node** node, int* depth) {
+    if (walk->count == 0) return 0;
+    WalkFrame frame = walk->frames[--walk->count];
+    for (int i = frame.node->num_children - 1; i >= 0; i--) {
+        if (frame.node->children[i]) walk_push(walk, frame.node->children[i], frame.depth + 1);
+    }
+    *node = frame.node;
+    *depth = frame.depth;
+    return 1;
+}
+
+static void walk_end(Walk* walk) {
+    free(walk->frames);
+}
+
+/*
+ * Output buffer
+ * -------------
+ * Printing goes through a buffer that is handed to fwrite() when full,
+ * instead of several stdio calls per node. The buffer lives on the caller's
+ * stack so that printing many small record trees costs no allocation.
+ */
+#define AST_OUTPUT_BUFFER_SIZE (64 * 1024)
+
+typedef struct {
+    FILE* out;
+    size_t used;
+    char data[AST_OUTPUT_BUFFER_SIZE];
+} OutBuf;
+
+static void out_open(OutBuf* buf, FILE* out) {
+    buf->out = out;
+    buf->used = 0;
+}
+
+static void out_flush(OutBuf* buf) {
+    if (buf->used) fwrite(buf->data, 1, buf->used, buf->out);
+    buf->used = 0;
+}
+
+static void out_write(OutBuf* buf, const char* bytes, size_t length) {
+    if (buf->used + length > AST_OUTPUT_BUFFER_SIZE) {
+        out_flush(buf);
+        if (length > AST_OUTPUT_BUFFER_SIZE) {
+            fwrite(bytes, 1, length, buf->out);
+            return;
+        }
+    }
+    memcpy(buf->data + buf->used, bytes, length);
+    buf->used += length;
+}
+
+static void out_close(OutBuf* buf) {
+    out_flush(buf);
+}
+
+static void out_indent(OutBuf* buf, int indent) {
+    static const char spaces[] =
+        "                                                                "
+        "                                                                ";
+    size_t remaining = (size_t)indent * 2;
+    while (remaining > 0) {
+        size_t chunk = remaining < sizeof(spaces) - 1 ? remaining : sizeof(spaces) - 1;
+        out_write(buf, spaces, chunk);
+        remaining -= chunk;
+    }
+}
+
+static void out_u32(OutBuf* buf, unsigned int value) {
+    char bytes[4] = {
+        (char)value, (char)(value >> 8), (char)(value >> 16), (char)(value >> 24)
+    };
+    out_write(buf, bytes, 4);
+}
+
 /*
  * print_ast
  * ---------
- * Recursively print the AST in a simple indented format. This output is the
- * format consumed by `visualize_tree.py` and `streamlit_visualizer.py`.
+ * Print the AST in a simple indented format. This output is the format
+ * consumed by `visualize_tree.py` and `streamlit_visualizer.py`.
  */
 void print_ast(Node* node, int indent) {
-    if (!node) return;
+    print_ast_to(stdout, node, indent);
+}
 
-    for (int i = 0; i < indent; i++) {
-        printf("  ");
-    }
+void print_ast_to(FILE* out, Node* root, int indent) {
+    OutBuf buf;
+    Walk walk;
+    Node* node;
+    int depth;
 
-    printf("%s", node->node_type);
-    if (node->value) {
-        printf(": %s", node->value);
+    out_open(&buf, out);
+    walk_start(&walk, root, indent);
+    while (walk_next(&walk, &node, &depth)) {
+        const char* name = ast_type_name(node->type);
+        out_indent(&buf, depth);
+        out_write(&buf, name, strlen(name));
+        if (node->value) {
+            out_write(&buf, ": ", 2);
+            out_write(&buf, node->value, node->value_len);
+        }
+        out_write(&buf, "\n", 1);
     }
-    printf("\n");
+    walk_end(&walk);
+    out_close(&buf);
+}
 
+/*
+ * Binary tree format
+ * ------------------
+ * A compact alternative to print_ast() for machine consumers. All integers
+ * are little-endian u32:
+ *
+ *   header   "CFGT", version, type_count, node_count, strings_size
+ *   nodes    node_count x (type, num_children, value_offset, value_length),
+ *            in preorder; value_offset is AST_BINARY_NO_VALUE for nodes
+ *            without a value
+ *   types    type_count x (offset, length) of each type name
+ *   strings  strings_size bytes: every type name, then every value
+ *
+ * Offsets index the strings section and nothing is NUL-terminated, so a
+ * reader can decode the whole tree from one buffer without per-node parsing.
+ * NULL children are skipped and not counted in num_children.
+ */
+static int count_children(Node* node) {
+    int count = 0;
     for (int i = 0; i < node->num_children; i++) {
-        print_ast(node->children[i], indent + 1);
+        if (node->children[i]) count++;
+    }
+    return count;
+}
+
+void write_ast_binary(Node* root, FILE* out) {
+    int type_total = ast_type_total();
+    unsigned int node_count = 0, value_bytes = 0, name_bytes = 0;
+    OutBuf buf;
+    Walk walk;
+    Node* node;
+    int depth;
+
+    walk_start(&walk, root, 0);
+    while (walk_next(&walk, &node, &depth)) {
+        node_count++;
+        if (node->value) value_bytes += node->value_len;
+    }
+    walk_end(&walk);
+    for (int i = 0; i < type_total; i++) {
+        name_bytes += strlen(ast_type_name(i));
+    }
+
+    out_open(&buf, out);
+    out_write(&buf, AST_BINARY_MAGIC, 4);
+    out_u32(&buf, AST_BINARY_VERSION);
+    out_u32(&buf, type_total);
+    out_u32(&buf, node_count);
+    out_u32(&buf, name_bytes + value_bytes);
+
+    /* Node records; values are laid out after the type names */
+    unsigned int value_offset = name_bytes;
+    walk_start(&walk, root, 0);
+    while (walk_next(&walk, &node, &depth)) {
+        out_u32(&buf, node->type);
+        out_u32(&buf, count_children(node));
+        if (node->value) {
+            unsigned int length = node->value_len;
+            out_u32(&buf, value_offset);
+            out_u32(&buf, length);
+            value_offset += length;
+        } else {
+            out_u32(&buf, AST_BINARY_NO_VALUE);
+            out_u32(&buf, 0);
+        }
+    }
+    walk_end(&walk);
+
+    /* Type table followed by the string section */
+    unsigned int name_offset = 0;
+    for (int i = 0; i < type_total; i++) {
+        unsigned int length = strlen(ast_type_name(i));
+        out_u32(&buf, name_offset);
+        out_u32(&buf, length);
+        name_offset += length;
     }
+    for (int i = 0; i < type_total; i++) {
+        const char* name = ast_type_name(i);
+        out_write(&buf, name, strlen(name));
+    }
+    walk_start(&walk, root, 0);
+    while (walk_next(&walk, &node, &depth)) {
+        if (node->value) out_write(&buf, node->value, node->value_len);
+    }
+    walk_end(&walk);
+    out_close(&buf);
 }
 
 /*
  * free_ast
  * --------
- * Recursively free all memory owned by the tree. Safe to call with NULL.
+ * Free all memory owned by the tree without recursing. Safe to call with
+ * NULL. Arena-allocated trees are released by ast_arena_release() instead.
  */
-void free_ast(Node* node) {
-    if (!node) return;
+void free_ast(Node* root) {
+    Walk walk;
+    Node* node;
+    int depth;
 
-    free(node->node_type);
-    if (node->value) free(node->value);
+    if (!root || current_arena) return;
 
-    for (int i = 0; i < node->num_children; i++) {
-        free_ast(node->children[i]);
+    /* walk_next() has already queued the children when a node is returned */
+    walk_start(&walk, root, 0);
+    while (walk_next(&walk, &node, &depth)) {
+        if (node->value && node->value_owned) free(node->value);
+        if (node->children) free(node->children);
+        free(node);
     }
-
-    if (node->children) free(node->children);
-    free(node);
+    walk_end(&walk);
 }
@@ -2,6 +2,7 @@
 #define AST_H
 
 #include <stddef.h>
+#include <stdio.h>
 
 /*
  * ast.h
@@ -9,35 +10,110 @@
  * Defines the in-memory AST (parse tree) Node structure and the public
  * functions used by the generated parser to build and manipulate the tree.
  *
- * The Node structure is intentionally simple: each node stores a textual
- * `node_type` label, an optional `value` (for terminals), and an array of
- * child pointers.
+ * The Node structure is intentionally simple: each node stores a small
+ * integer `type` tag, an optional `value` (for terminals), and an array of
+ * child pointers. Type names live in a static table emitted by the generator
+ * (`ast_type_names`), so no per-node string is allocated for the label.
  */
 
 typedef struct Node {
-    char* node_type;       /* e.g. "expression", or token name like "NUMBER" */
-    char* value;           /* textual value for terminals (NULL for non-terminals) */
+    int type;              /* index into the type name table, see ast_type_name() */
     int num_children;      /* number of children */
+    char* value;           /* textual value for terminals (NULL for non-terminals) */
     struct Node** children;/* array of child Node* pointers */
+    unsigned int value_len;/* length of value in bytes */
+    int value_owned;       /* nonzero if value is a private copy, see ast_share_input() */
 } Node;
 
-/* Create a leaf node with a given node_type and textual value. The
- * implementation duplicates strings; caller owns the returned Node and must
- * call free_ast() to release memory.
+/* Type name table. The generated parser defines both symbols: one entry per
+ * token and per node label used in grammar actions, indexed by the AST_*
+ * constants it also emits.
  */
-Node* create_leaf_node(const char* node_type, const char* value);
+extern const char* const ast_type_names[];
+extern const int ast_type_count;
+
+/* Map between type ids and names. Names missing from the generated table are
+ * registered on first use and receive ids past ast_type_count.
+ */
+const char* ast_type_name(int type);
+int ast_type_id(const char* name);
+
+/* Create a leaf node with a given type id and textual value. The value is
+ * duplicated; caller owns the returned Node and must call free_ast() to
+ * release memory.
+ */
+Node* create_leaf_node_id(int type, const char* value);
+
+/* Create a leaf from `length` bytes of `text` (yytext/yyleng in generated
+ * scanners); NULL text makes a leaf without a value. The text is copied
+ * unless input sharing is enabled.
+ */
+Node* create_leaf_text(int type, const char* text, size_t length);
 
-/* Create an internal node with `num_children` children passed as variadic
- * arguments (Node*...). This mirrors the style used in grammar actions.
+/* Zero-copy leaves. While enabled on the calling thread, create_leaf_text()
+ * stores a pointer into the scanner's input instead of a copy, so that input
+ * (e.g. the memory-mapped file of `--mmap`) must stay mapped as long as the
+ * tree is used. Shared values are not NUL-terminated; read them with
+ * value_len. Off by default.
  */
+void ast_share_input(int enabled);
+
+/* Create an internal node of type `type` with `num_children` children passed
+ * as variadic arguments (Node*...). The generator rewrites literal
+ * create_node("label", ...) calls in grammar actions into this form.
+ */
+Node* create_node_id(int type, int num_children, ...);
+
+/* Name-based variants kept for hand-written actions; they look the name up
+ * with ast_type_id() on every call.
+ */
+Node* create_leaf_node(const char* node_type, const char* value);
 Node* create_node(const char* node_type, int num_children, ...);
 
 /* Print the AST in an indented textual form. Useful for debugging and for
- * the terminal visualizer which consumes the same format.
+ * the terminal visualizer which consumes the same format. Printing walks the
+ * tree with an explicit stack, so arbitrarily deep trees are safe, and output
+ * is written through an output buffer. print_ast() writes to stdout.
  */
 void print_ast(Node* node, int indent);
+void print_ast_to(FILE* out, Node* node, int indent);
+
+/* Write the tree in the compact binary format read by tree_binary.py: a
+ * preorder node stream of (type, child count, value span) records followed by
+ * a string table. See ast.c for the exact layout.
+ */
+#define AST_BINARY_MAGIC "CFGT"
+#define AST_BINARY_VERSION 1
+#define AST_BINARY_NO_VALUE 0xFFFFFFFFu
+void write_ast_binary(Node* root, FILE* out);
 
-/* Free the entire AST recursively. Safe to call on NULL. */
+/* Free the entire AST (iteratively). Safe to call on NULL. Does nothing
+ * while an arena is selected; use ast_arena_release() instead.
+ */
 void free_ast(Node* node);
 
+/* Arena mode. After ast_arena_enable(), nodes, child arrays and strings are
+ * carved from large blocks instead of individual malloc/strdup calls, which
+ * removes allocator overhead on big inputs. The whole tree is then released
+ * in one shot by ast_arena_release(); arena mode stays enabled afterwards.
+ *
+ * Arena selection is per thread. ast_arena_enable() selects the calling
+ * thread's default arena; ast_arena_select() installs any arena created with
+ * ast_arena_create() (or NULL for malloc) and returns the previous one, so a
+ * tree can be built on one thread and destroyed on another.
+ */
+typedef struct AstArena AstArena;
+
+void ast_arena_enable(void);
+void ast_arena_release(void);
+AstArena* ast_arena_create(void);
+void ast_arena_destroy(AstArena* arena);
+AstArena* ast_arena_select(AstArena* arena);
+
+/* Collapse mode (per thread). While enabled, create_node()/create_node_id()
+ * return NULL instead of a node when every child passed in is NULL. Used by
+ * streaming parsers whose record subtrees have already been emitted and freed.
+ */
+void ast_collapse_empty(int enabled);
+
 #endif
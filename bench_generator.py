@@ -0,0 +1,180 @@
+#!/usr/bin/env python3
+"""
+bench_generator.py
+------------------
+Time generator.py on large synthetic grammars.
+
+Machine-generated analyzers can have thousands of tokens and tens of
+thousands of productions. This script writes such grammars in a few shapes
+and times every step ``generator.py`` takes before flex and bison run:
+
+- ``wide``: a statement list over many keyword statements with a handful of
+  alternatives each; the number of tokens grows with the grammar
+- ``deep``: a chain of nonterminals, each deriving the next, over three
+  tokens; every set computed by the analysis depends on the whole chain
+- ``multiline``: ``wide`` with its actions spread over several lines, with
+  comments and nested braces
+
+Every size is timed for reading the ``.def`` (`generator.parse_def_text`),
+assigning node types, the grammar analysis (`grammar_report.analyze`) and
+writing ``lexer.l`` and ``parser.y``. Times are also given per rule: a
+constant figure as the size grows means generation scales linearly.
+``--bison`` times bison on the generated parser for comparison.
+
+Usage:
+    python3 bench_generator.py                          # all shapes, 1k to 20k rules
+    python3 bench_generator.py --shape deep --sizes 10000 40000 --bison
+
+Important functions:
+- `synthetic_def(shape, rules)` - text of a generated ``.def``
+- `time_generation(def_text, output_dir)` - seconds per step
+"""
+
+import contextlib
+import io
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+from typing import Dict
+
+import generator
+import grammar_report
+
+SHAPES = ('wide', 'deep', 'multiline')
+DEFAULT_SIZES = (1000, 2000, 5000, 10000, 20000)
+
+# Alternatives per keyword statement of the wide shapes
+ALTERNATIVES = 8
+
+STEPS = ('read', 'types', 'analyze', 'emit')
+
+
+def synthetic_def(shape: str, rules: int) -> str:
+    """Text of a ``.def`` of the given shape with about ``rules`` productions."""
+
+    if shape == 'deep':
+        lines = ['%%LEX', r'NUMBER [0-9]+', r'PLUS \+', r'WHITESPACE [ \t\n]+', '', '%%YACC']
+        levels = max(rules // 2, 1)
+        for level in range(levels - 1):
+            lines.append(f'n{level} -> n{level + 1} PLUS NUMBER '
+                         f'{{ $$ = create_node("n{level}", 3, $1, $2, $3); }}')
+            lines.append(f'    | n{level + 1} {{ $$ = $1; }}')
+        lines.append(f'n{levels - 1} -> NUMBER {{ $$ = create_node("n{levels - 1}", 1, $1); }}')
+        return '\n'.join(lines) + '\n'
+
+    if shape not in SHAPES:
+        raise ValueError(f'unknown shape {shape}')
+    keywords = max(rules // (ALTERNATIVES + 2), 1)
+    lines = ['%%LEX', r'NUMBER [0-9]+', r'SEMI ;']
+    lines += [f'KW{index} kw{index}' for index in range(keywords)]
+    lines += [r'WHITESPACE [ \t\n]+', '', '%%YACC']
+    lines.append('program -> program statement { $$ = create_node("program", 2, $1, $2); }')
+    lines.append('    | statement { $$ = create_node("program", 1, $1); }')
+    lines.append('statement -> s0 { $$ = $1; }')
+    lines += [f'    | s{index} {{ $$ = $1; }}' for index in range(1, keywords)]
+    for index in range(keywords):
+        for alternative in range(ALTERNATIVES):
+            numbers = ' NUMBER' * (alternative + 1)
+            refs = ', '.join(f'${position}' for position in range(1, alternative + 4))
+            head = f's{index} ->' if not alternative else '    |'
+            label = f's{index}_{alternative}'
+            if shape == 'multiline':
+                lines += [f'{head} KW{index}{numbers} SEMI',
+                          '    {',
+                          f'        /* {label}: {{ braces }} in comments do not count */',
+                          '        if (1) {',
+                          f'            $$ = create_node("{label}", {alternative + 3},',
+                          f'                             {refs});',
+                          '        }',
+                          '    }']
+            else:
+                lines.append(f'{head} KW{index}{numbers} SEMI '
+                             f'{{ $$ = create_node("{label}", {alternative + 3}, {refs}); }}')
+    return '\n'.join(lines) + '\n'
+
+
+def time_generation(def_text: str, output_dir: Path) -> Dict[str, float]:
+    """Run the generator steps on ``def_text``, writing into ``output_dir``.
+
+    Returns the seconds each step in `STEPS` took. Warnings the steps print
+    are discarded.
+    """
+
+    times = {}
+    with contextlib.redirect_stdout(io.StringIO()):
+        started = time.perf_counter()
+        lex_rules, grammar_rules, options = generator.parse_def_text(def_text)
+        times['read'] = time.perf_counter() - started
+
+        started = time.perf_counter()
+        node_types = generator.collect_node_types(lex_rules, grammar_rules)
+        times['types'] = time.perf_counter() - started
+
+        started = time.perf_counter()
+        grammar_report.analyze(lex_rules, grammar_rules, options)
+        times['analyze'] = time.perf_counter() - started
+
+        started = time.perf_counter()
+        generator.generate_lexer(lex_rules, str(output_dir / 'lexer.l'), node_types, False, options)
+        generator.generate_parser(lex_rules, grammar_rules, str(output_dir / 'parser.y'),
+                                  node_types, options)
+        times['emit'] = time.perf_counter() - started
+    return times
+
+
+def time_bison(output_dir: Path) -> float:
+    """Seconds bison takes on ``output_dir/parser.y``, as the Makefile runs it."""
+
+    started = time.perf_counter()
+    subprocess.run(['bison', '-d', '-y', 'parser.y'], cwd=output_dir,
+                   capture_output=True, check=True)
+    return time.perf_counter() - started
+
+
+def main():
+    import argparse
+
+    parser = argparse.ArgumentParser(description='Time generator.py on large synthetic grammars')
+    parser.add_argument('--shape', action='append', choices=SHAPES,
+                        help='Grammar shape (repeatable; default: all)')
+    parser.add_argument('--sizes', type=int, nargs='+', default=list(DEFAULT_SIZES),
+                        metavar='RULES', help='Approximate numbers of rules')
+    parser.add_argument('--bison', action='store_true',
+                        help='Also time bison on each generated parser.y')
+    parser.add_argument('--keep', metavar='DIR',
+                        help='Write the grammars and generated files under DIR and keep them')
+
+    args = parser.parse_args()
+    if args.bison and not shutil.which('bison'):
+        parser.error('bison is not installed')
+
+    header = f'{"shape":<10} {"rules":>7} {"tokens":>6}' + ''.join(f' {step:>8}' for step in STEPS)
+    header += f' {"total":>8} {"us/rule":>8}' + (f' {"bison":>8}' if args.bison else '')
+    print(header)
+
+    with tempfile.TemporaryDirectory() as scratch:
+        root = Path(args.keep or scratch)
+        for shape in args.shape or SHAPES:
+            for size in args.sizes:
+                output_dir = root / f'{shape}_{size}'
+                output_dir.mkdir(parents=True, exist_ok=True)
+                def_text = synthetic_def(shape, size)
+                (output_dir / f'{shape}_{size}.def').write_text(def_text)
+
+                times = time_generation(def_text, output_dir)
+                lex_rules, grammar_rules, _ = generator.parse_def_text(def_text)
+                total = sum(times.values())
+                row = f'{shape:<10} {len(grammar_rules):>7} {len(lex_rules) - 1:>6}'
+                row += ''.join(f' {times[step]:>8.3f}' for step in STEPS)
+                row += f' {total:>8.3f} {total / len(grammar_rules) * 1e6:>8.1f}'
+                if args.bison:
+                    row += f' {time_bison(output_dir):>8.3f}'
+                print(row, flush=True)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,118 @@
+#!/usr/bin/env python3
+"""
+build_all.py
+------------
+Build many analyzers at once, each in its own directory.
+
+Every analyzer is generated and compiled out of tree in ``build/<name>/`` so
+that the builds never share ``lexer.l``, ``parser.y`` or object files. The
+builds are independent ``make`` invocations, which this driver runs
+concurrently across all cores. Binaries already present in the build cache
+(see ``build_cache.py``) are restored instead of rebuilt.
+
+Usage:
+    python3 build_all.py                       # every samples/*/*_analyzer.def
+    python3 build_all.py a.def b.def -j 4      # an explicit list of analyzers
+"""
+
+import os
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from pathlib import Path
+from typing import List, Tuple
+
+import build_cache
+
+
+DEFAULT_PATTERN = 'samples/*/*_analyzer.def'
+
+
+def find_def_files(pattern: str = DEFAULT_PATTERN) -> List[str]:
+    """Return the analyzer ``.def`` files matching ``pattern`` under the repo."""
+
+    return sorted(str(path) for path in build_cache.REPO_ROOT.glob(pattern))
+
+
+def build_one(def_file: str, with_tokens: bool = False) -> Tuple[str, Path, bool, float]:
+    """Build a single analyzer into its build directory.
+
+    Returns ``(def_file, binary, cache_hit, seconds)``. Token example files are
+    skipped by default because analyzers sharing a sample directory would
+    otherwise race on the same ``*_tokens.txt`` files.
+    """
+
+    start = time.perf_counter()
+    binary = build_cache.build_dir_for(def_file) / build_cache.TARGET
+    gen_flags = () if with_tokens else ('--no-tokens',)
+    _, hit = build_cache.ensure_compiler(def_file, binary, gen_flags)
+    return def_file, binary, hit, time.perf_counter() - start
+
+
+def build_all(def_files: List[str], jobs: int = 0, with_tokens: bool = False):
+    """Build ``def_files`` concurrently and yield results as builds finish.
+
+    Each job is a separate ``make`` process, so a thread pool is enough to keep
+    ``jobs`` compilers busy. Yields ``(def_file, binary, hit, seconds)`` or
+    ``(def_file, BuildError, False, seconds)`` for failed builds.
+    """
+
+    stems = {}
+    for def_file in def_files:
+        stem = Path(def_file).stem
+        if stem in stems:
+            raise ValueError(f'{def_file} and {stems[stem]} would share build/{stem}/')
+        stems[stem] = def_file
+
+    # Resolve toolchain versions once instead of racing to do it per worker
+    build_cache.toolchain_versions()
+
+    jobs = jobs or os.cpu_count() or 1
+    with ThreadPoolExecutor(max_workers=jobs) as pool:
+        futures = {pool.submit(build_one, def_file, with_tokens): def_file for def_file in def_files}
+        for future in as_completed(futures):
+            def_file = futures[future]
+            try:
+                yield future.result()
+            except build_cache.BuildError as exc:
+                yield def_file, exc, False, 0.0
+
+
+def main():
+    import argparse
+
+    parser = argparse.ArgumentParser(description='Build several analyzers in parallel')
+    parser.add_argument('def_files', nargs='*',
+                        help=f'Analyzer .def files (default: {DEFAULT_PATTERN})')
+    parser.add_argument('-j', '--jobs', type=int, default=0,
+                        help='Number of concurrent builds (default: number of cores)')
+    parser.add_argument('--tokens', action='store_true',
+                        help='Also regenerate *_tokens.txt example files')
+
+    args = parser.parse_args()
+    def_files = args.def_files or find_def_files()
+    if not def_files:
+        print('No .def files to build')
+        return 1
+
+    start = time.perf_counter()
+    failures = 0
+    try:
+        for def_file, result, hit, seconds in build_all(def_files, args.jobs, args.tokens):
+            if isinstance(result, build_cache.BuildError):
+                failures += 1
+                print(f'FAILED  {def_file}\n{result}', file=sys.stderr)
+            else:
+                status = 'cached' if hit else 'built '
+                print(f'{status}  {result}  ({seconds:.2f}s)')
+    except ValueError as exc:
+        print(f'Error: {exc}', file=sys.stderr)
+        return 1
+
+    elapsed = time.perf_counter() - start
+    print(f'{len(def_files) - failures}/{len(def_files)} analyzers ready in {elapsed:.2f}s')
+    return 1 if failures else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,297 @@
+#!/usr/bin/env python3
+"""
+build_cache.py
+--------------
+Content-addressed cache for built ``custom_compiler`` executables.
+
+Building an analyzer runs ``generator.py``, Flex, Bison and GCC even when
+nothing relevant has changed. This module hashes everything that determines
+the resulting binary (the ``.def`` file, the generator, the AST library, the
+Makefile and the toolchain versions) and keeps finished binaries under
+``.build_cache/<key>/``. A cache hit only copies the stored binary into place,
+so switching between analyzers no longer pays for a full rebuild.
+
+Misses are built out of tree in ``build/<analyzer>/`` (see `build_dir_for`),
+so building one analyzer never disturbs another and builds can run in
+parallel (see ``build_all.py``).
+
+Important functions:
+- `compute_build_key(def_file, gen_flags)` - hash identifying one analyzer build
+- `key_gen_flags(gen_flags)` - the generator arguments that are part of the key
+- `build_analyzer(def_file)` - run the Makefile for one analyzer out of tree
+- `ensure_compiler(def_file)` - restore a cached binary or build and store it
+- `ensure_library(def_file)` - cached ``libanalyzer.so`` of a reentrant build
+"""
+
+import fcntl
+import hashlib
+import os
+import shlex
+import shutil
+import subprocess
+import sys
+import threading
+from contextlib import contextmanager
+from functools import lru_cache
+from pathlib import Path
+from typing import Iterable, List, Optional, Tuple
+
+
+REPO_ROOT = Path(__file__).resolve().parent
+CACHE_DIR = Path(os.environ.get('CFG2YACC_CACHE_DIR', REPO_ROOT / '.build_cache'))
+BUILD_ROOT = REPO_ROOT / 'build'
+TARGET = 'custom_compiler'
+LIBRARY = 'libanalyzer.so'
+
+# Repository files whose contents feed into every generated analyzer
+BUILD_INPUTS = ('generator.py', 'ast.c', 'ast.h', 'analyzer.h', 'Makefile')
+
+# Generator flags that never change the binary and so stay out of the key:
+# switches, and options whose value goes with them (they only affect the
+# token sample files)
+NEUTRAL_GEN_FLAGS = ('--no-tokens', '--report', '--strict')
+NEUTRAL_GEN_OPTIONS = ('--harvest', '-j', '--jobs')
+
+# Tools whose version can change the produced binary
+TOOLCHAIN = ('flex', 'bison', 'gcc')
+
+
+class BuildError(RuntimeError):
+    """Raised when an analyzer cannot be built; carries the tool output."""
+
+
+@lru_cache(maxsize=None)
+def toolchain_versions() -> Tuple[str, ...]:
+    """Return the first ``--version`` line of each toolchain program.
+
+    Missing tools are recorded as such rather than raising so that the key can
+    still be computed; the build itself will report the real error.
+    """
+
+    versions = []
+    for tool in TOOLCHAIN:
+        try:
+            result = subprocess.run([tool, '--version'], capture_output=True, text=True)
+            first_line = (result.stdout or result.stderr).splitlines()[0]
+        except (OSError, IndexError):
+            first_line = 'unavailable'
+        versions.append(f'{tool}: {first_line}')
+    return tuple(versions)
+
+
+def key_gen_flags(gen_flags: Iterable[str]) -> List[str]:
+    """The generator arguments that shape the binary, in their given order.
+
+    `NEUTRAL_GEN_FLAGS` are dropped, as are `NEUTRAL_GEN_OPTIONS` together
+    with their values (``--harvest PATTERN``, ``--harvest=PATTERN``, ``-j4``).
+    """
+
+    kept = []
+    arguments = iter(gen_flags)
+    for argument in arguments:
+        if argument in NEUTRAL_GEN_FLAGS:
+            continue
+        if argument in NEUTRAL_GEN_OPTIONS:
+            next(arguments, None)
+            continue
+        if argument.split('=', 1)[0] in NEUTRAL_GEN_OPTIONS or (
+                argument.startswith('-j') and not argument.startswith('--')):
+            continue
+        kept.append(argument)
+    return kept
+
+
+def compute_build_key(def_file: str, gen_flags: Iterable[str] = ()) -> str:
+    """Hash the inputs that determine the binary built from ``def_file``.
+
+    ``gen_flags`` that change the generated code (e.g. ``--reentrant`` or
+    ``--tables full``) are part of the key, each option with its value in
+    argv order (see `key_gen_flags`).
+    """
+
+    digest = hashlib.sha256()
+    digest.update(Path(def_file).read_bytes())
+    flags = key_gen_flags(gen_flags)
+    if flags:
+        digest.update(b'\0flags:' + shlex.join(flags).encode())
+    for name in BUILD_INPUTS:
+        path = REPO_ROOT / name
+        digest.update(b'\0' + name.encode())
+        if path.exists():
+            digest.update(path.read_bytes())
+    for version in toolchain_versions():
+        digest.update(b'\0' + version.encode())
+    return digest.hexdigest()
+
+
+def cached_binary(key: str, name: str = TARGET) -> Optional[Path]:
+    """Return the cached file ``name`` for ``key`` or ``None`` on a cache miss."""
+
+    path = CACHE_DIR / key / name
+    return path if path.exists() else None
+
+
+def store_binary(key: str, binary: Path) -> Path:
+    """Copy a freshly built binary (or library) into the cache under ``key``.
+
+    The copy is written to a temporary name and renamed so that concurrent
+    readers never observe a partially written executable.
+    """
+
+    entry = CACHE_DIR / key
+    entry.mkdir(parents=True, exist_ok=True)
+    destination = entry / binary.name
+    temporary = entry / f'.{binary.name}.{os.getpid()}.{threading.get_ident()}'
+    shutil.copy2(binary, temporary)
+    os.replace(temporary, destination)
+    return destination
+
+
+def build_dir_for(def_file: str) -> Path:
+    """Return the out-of-tree build directory used for ``def_file``."""
+
+    return BUILD_ROOT / Path(def_file).stem
+
+
+@contextmanager
+def build_lock(def_file: str):
+    """Hold an exclusive lock on the build directory of ``def_file``.
+
+    Every build of one ``.def`` uses the same ``build/<analyzer>/``, so two
+    misses at once (two web UI sessions, or ``make run`` during a UI
+    rebuild) would delete each other's files halfway. The lock is a
+    ``flock`` on ``build/<analyzer>.lock`` and so holds across processes
+    and threads alike.
+    """
+
+    BUILD_ROOT.mkdir(parents=True, exist_ok=True)
+    with open(BUILD_ROOT / f'{Path(def_file).stem}.lock', 'w') as lock:
+        fcntl.flock(lock, fcntl.LOCK_EX)
+        yield
+
+
+def build_analyzer(def_file: str, gen_flags: Iterable[str] = ()) -> Path:
+    """Build ``def_file`` from scratch in its own build directory via ``make``.
+
+    Returns the path of the linked binary. The build directory is emptied
+    first: a cache miss means some input changed, and make's timestamps do
+    not track the toolchain versions that are part of the key. Callers hold
+    `build_lock` until the result is stored.
+    """
+
+    build_dir = build_dir_for(def_file)
+    shutil.rmtree(build_dir, ignore_errors=True)
+    build_dir.mkdir(parents=True)
+
+    command = ['make', f'DEF_FILE={Path(def_file).resolve()}', f'BUILD_DIR={build_dir}']
+    flags = shlex.join(gen_flags)
+    if flags:
+        command.append(f'GEN_FLAGS={flags}')
+    # When called from make (``make cached``), variables given on the outer
+    # command line reach the inner make through MAKEFLAGS; only the flags
+    # that are part of the key may shape the binary stored under it
+    env = {name: value for name, value in os.environ.items()
+           if name not in ('MAKEFLAGS', 'MAKEOVERRIDES', 'MFLAGS')}
+
+    try:
+        subprocess.run(command, cwd=REPO_ROOT, env=env, capture_output=True, text=True, check=True)
+    except subprocess.CalledProcessError as exc:
+        raise BuildError(exc.stderr or exc.stdout or str(exc)) from exc
+
+    return build_dir / TARGET
+
+
+def ensure_compiler(def_file: str, target: Optional[Path] = None,
+                    gen_flags: Iterable[str] = ()) -> Tuple[str, bool]:
+    """Make ``target`` (default ``./custom_compiler``) the binary for ``def_file``.
+
+    Returns ``(key, hit)`` where ``hit`` tells whether the binary came from the
+    cache. On a miss the analyzer is built with `build_analyzer` and the
+    result stored for next time. Raises ``BuildError`` if the build fails.
+    """
+
+    target = Path(target) if target else REPO_ROOT / TARGET
+    target.parent.mkdir(parents=True, exist_ok=True)
+    key = compute_build_key(def_file, gen_flags)
+
+    binary = cached_binary(key)
+    hit = binary is not None
+    if not hit:
+        with build_lock(def_file):
+            # Another process may have built it while we waited
+            binary = cached_binary(key)
+            hit = binary is not None
+            if not hit:
+                binary = store_binary(key, build_analyzer(def_file, gen_flags))
+
+    temporary = target.with_name(f'.{target.name}.{os.getpid()}.{threading.get_ident()}')
+    shutil.copy2(binary, temporary)
+    os.replace(temporary, target)
+    return key, hit
+
+
+def ensure_library(def_file: str, gen_flags: Iterable[str] = ()) -> Path:
+    """Return the cached ``libanalyzer.so`` for ``def_file``, building on a miss.
+
+    The analyzer is generated with ``--reentrant`` (added to ``gen_flags``),
+    so the library exports the thread-safe API of ``analyzer.h``. The path
+    points into the cache and stays valid while the cache entry exists.
+    """
+
+    gen_flags = tuple(gen_flags)
+    if '--reentrant' not in gen_flags:
+        gen_flags += ('--reentrant',)
+    key = compute_build_key(def_file, gen_flags)
+
+    library = cached_binary(key, LIBRARY)
+    if library is None:
+        with build_lock(def_file):
+            library = cached_binary(key, LIBRARY)
+            if library is None:
+                binary = build_analyzer(def_file, gen_flags)
+                store_binary(key, binary)
+                library = store_binary(key, binary.with_name(LIBRARY))
+    return library
+
+
+def clear_cache():
+    """Delete every cached binary."""
+
+    shutil.rmtree(CACHE_DIR, ignore_errors=True)
+
+
+def main():
+    import argparse
+
+    parser = argparse.ArgumentParser(description='Build an analyzer, reusing cached binaries')
+    parser.add_argument('def_file', nargs='?', help='Analyzer .def file to build')
+    parser.add_argument('-o', '--target', type=str, default=None,
+                        help=f'Where to place the binary (default: ./{TARGET})')
+    parser.add_argument('--gen-flags', type=str, default='', metavar='FLAGS',
+                        help='Generator flags, as one string (e.g. "--tables full")')
+    parser.add_argument('--clear', action='store_true',
+                        help='Remove all cached binaries and exit')
+
+    args = parser.parse_args()
+
+    if args.clear:
+        clear_cache()
+        print(f'Cleared build cache {CACHE_DIR}')
+        return 0
+
+    if not args.def_file:
+        parser.error('a .def file is required')
+
+    try:
+        key, hit = ensure_compiler(args.def_file, args.target, shlex.split(args.gen_flags))
+    except BuildError as exc:
+        print(f'Build failed:\n{exc}', file=sys.stderr)
+        return 1
+
+    status = 'hit' if hit else 'miss, built and stored'
+    print(f'Build cache {status}: {args.def_file} [{key[:12]}]')
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
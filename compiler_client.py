@@ -0,0 +1,296 @@
+#!/usr/bin/env python3
+"""
+compiler_client.py
+------------------
+Talk to resident ``custom_compiler --server`` processes.
+
+Starting a compiler process costs far more than parsing a small document.
+In server mode the generated program stays alive and answers one request
+per document over a pipe (or a Unix socket with ``--socket PATH``):
+
+- request: u32 length, then the document bytes
+- response: u32 status, u32 length, then the tree (or the error message when
+  the status is not 0)
+
+All integers are little-endian. `CompilerServer` wraps one such process and
+`ServerPool` keeps several of them busy from multiple threads.
+
+Files on disk are cheaper still in batch mode: ``custom_compiler --files-from -``
+parses every listed path in one process and writes one record per file.
+`parse_files` splits a file list into chunks and runs one batch process per
+core, yielding ``(path, status, tree)`` records in input order.
+
+Important functions:
+- `CompilerServer(binary).parse(data)` - one request/response round trip
+- `SocketClient(path).parse(data)` - the same against ``--socket PATH``
+- `ServerPool(binary, size).map(documents)` - parse many documents in parallel
+- `parse_files(binary, paths, jobs)` - batch-parse files on every core
+"""
+
+import os
+import queue
+import socket
+import struct
+import subprocess
+import sys
+import weakref
+from concurrent.futures import ThreadPoolExecutor
+from typing import BinaryIO, Iterable, Iterator, List, Sequence, Tuple
+
+FRAME = struct.Struct('<I')
+REPLY = struct.Struct('<II')
+
+# Most paths handed to one batch process; smaller lists are split evenly
+BATCH_CHUNK_FILES = 512
+
+
+class CompilerError(RuntimeError):
+    """Raised when a compiler server dies or breaks the protocol."""
+
+
+def _read_exact(stream: BinaryIO, size: int) -> bytes:
+    data = stream.read(size)
+    if data is None or len(data) != size:
+        raise CompilerError('compiler server closed the connection')
+    return data
+
+
+def _round_trip(writer: BinaryIO, reader: BinaryIO, data: bytes) -> Tuple[int, bytes]:
+    writer.write(FRAME.pack(len(data)))
+    writer.write(data)
+    writer.flush()
+    status, length = REPLY.unpack(_read_exact(reader, REPLY.size))
+    return status, _read_exact(reader, length)
+
+
+def _stop_server(process: subprocess.Popen):
+    if process.poll() is None:
+        process.stdin.close()
+        process.wait()
+    process.stdout.close()
+
+
+class CompilerServer:
+    """One resident ``custom_compiler --server`` process.
+
+    `parse` returns ``(status, payload)``: status 0 means ``payload`` is the
+    tree in ``output_format``, anything else that it is the error message.
+    Not thread-safe; use `ServerPool` to share servers between threads.
+    The process is stopped by `close` or, failing that, once the server is
+    garbage collected (e.g. with the web UI session that held it).
+    """
+
+    def __init__(self, binary: str = './custom_compiler', output_format: str = 'binary'):
+        self.binary = str(binary)
+        self.process = subprocess.Popen(
+            [self.binary, '--server', '--format', output_format],
+            stdin=subprocess.PIPE,
+            stdout=subprocess.PIPE,
+            stderr=subprocess.DEVNULL,
+        )
+        self._finalizer = weakref.finalize(self, _stop_server, self.process)
+
+    def parse(self, data: bytes) -> Tuple[int, bytes]:
+        try:
+            return _round_trip(self.process.stdin, self.process.stdout, data)
+        except (BrokenPipeError, CompilerError) as exc:
+            raise CompilerError(f'{self.binary} exited with {self.process.poll()}') from exc
+
+    def close(self):
+        self._finalizer()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+
+class SocketClient:
+    """Connection to a compiler started with ``--socket PATH``."""
+
+    def __init__(self, path: str):
+        self.connection = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        self.connection.connect(path)
+        self.stream = self.connection.makefile('rwb')
+
+    def parse(self, data: bytes) -> Tuple[int, bytes]:
+        return _round_trip(self.stream, self.stream, data)
+
+    def close(self):
+        self.stream.close()
+        self.connection.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+
+class ServerPool:
+    """A fixed set of compiler servers shared by any number of threads.
+
+    Each `parse` call borrows an idle server, so at most ``size`` documents
+    are parsed at once. A server that dies is replaced on its next use.
+    """
+
+    def __init__(self, binary: str = './custom_compiler', size: int = 0,
+                 output_format: str = 'binary'):
+        self.binary = str(binary)
+        self.output_format = output_format
+        self.size = size or os.cpu_count() or 1
+        self.idle = queue.Queue()
+        for _ in range(self.size):
+            self.idle.put(CompilerServer(self.binary, output_format))
+
+    def parse(self, data: bytes) -> Tuple[int, bytes]:
+        server = self.idle.get()
+        try:
+            return server.parse(data)
+        except CompilerError:
+            server.close()
+            server = CompilerServer(self.binary, self.output_format)
+            raise
+        finally:
+            self.idle.put(server)
+
+    def map(self, documents: Iterable[bytes]) -> Iterator[Tuple[int, bytes]]:
+        """Parse ``documents`` concurrently, yielding replies in input order."""
+
+        with ThreadPoolExecutor(max_workers=self.size) as executor:
+            yield from executor.map(self.parse, documents)
+
+    def close(self):
+        for _ in range(self.size):
+            self.idle.get().close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+
+def iter_batch_records(data) -> Iterator[Tuple[str, int, bytes]]:
+    """Decode the ``--format binary`` output of a batch run.
+
+    Each record is u32 status, u32 path length, the path, u32 payload length
+    and the payload (the tree, or the error message when status is not 0).
+    """
+
+    buffer = memoryview(data)
+    offset = 0
+    while offset < len(buffer):
+        status, path_length = REPLY.unpack_from(buffer, offset)
+        offset += REPLY.size
+        path = str(buffer[offset:offset + path_length], 'utf-8', 'replace')
+        offset += path_length
+        (length,) = FRAME.unpack_from(buffer, offset)
+        offset += FRAME.size
+        if offset + length > len(buffer):
+            raise CompilerError('truncated batch record')
+        yield path, status, bytes(buffer[offset:offset + length])
+        offset += length
+
+
+def run_batch(binary: str, paths: Sequence[str], output_format: str = 'binary') -> subprocess.CompletedProcess:
+    """Parse ``paths`` with a single batch-mode compiler process.
+
+    The paths are passed on stdin (``--files-from -``), so the list length is
+    not limited by the command line. The exit status is 1 if any file failed.
+    """
+
+    listing = ''.join(f'{path}\n' for path in paths).encode('utf-8')
+    return subprocess.run(
+        [str(binary), '--format', output_format, '--files-from', '-'],
+        input=listing,
+        stdout=subprocess.PIPE,
+        stderr=subprocess.PIPE,
+    )
+
+
+def _chunk_paths(paths: List[str], jobs: int, chunk_files: int) -> List[List[str]]:
+    size = max(1, min(chunk_files, -(-len(paths) // jobs)))
+    return [paths[start:start + size] for start in range(0, len(paths), size)]
+
+
+def batch_outputs(binary: str, paths: Iterable[str], jobs: int = 0, output_format: str = 'binary',
+                  chunk_files: int = BATCH_CHUNK_FILES) -> Iterator[subprocess.CompletedProcess]:
+    """Run batch processes over chunks of ``paths``, ``jobs`` at a time.
+
+    Yields each chunk's completed process in input order while later chunks
+    are still being parsed.
+    """
+
+    paths = list(paths)
+    jobs = jobs or os.cpu_count() or 1
+    chunks = _chunk_paths(paths, jobs, chunk_files)
+    with ThreadPoolExecutor(max_workers=jobs) as executor:
+        yield from executor.map(lambda chunk: run_batch(binary, chunk, output_format), chunks)
+
+
+def parse_files(binary: str, paths: Iterable[str], jobs: int = 0,
+                chunk_files: int = BATCH_CHUNK_FILES) -> Iterator[Tuple[str, int, bytes]]:
+    """Parse many files on every core, yielding ``(path, status, tree)`` in order.
+
+    ``tree`` is a binary parse tree (see `tree_binary`) when status is 0 and
+    the error message otherwise.
+    """
+
+    for result in batch_outputs(binary, paths, jobs, 'binary', chunk_files):
+        yield from iter_batch_records(result.stdout)
+
+
+def main():
+    import argparse
+
+    parser = argparse.ArgumentParser(description='Parse files through resident compiler servers')
+    parser.add_argument('files', nargs='*', help='Input documents')
+    parser.add_argument('--compiler', default='./custom_compiler',
+                        help='Compiler executable (default: ./custom_compiler)')
+    parser.add_argument('-j', '--jobs', type=int, default=0,
+                        help='Number of servers (default: number of cores)')
+    parser.add_argument('--format', choices=['text', 'binary'], default='text',
+                        help='Tree format to request (default: text)')
+    parser.add_argument('--batch', action='store_true',
+                        help='Use batch processes instead of resident servers and '
+                             'write one record per file')
+    parser.add_argument('--files-from', metavar='PATH',
+                        help='Read additional input paths from PATH, one per line (- for stdin)')
+
+    args = parser.parse_args()
+
+    files = list(args.files)
+    if args.files_from:
+        with (sys.stdin if args.files_from == '-' else open(args.files_from)) as listing:
+            files.extend(line.rstrip('\r\n') for line in listing if line.strip())
+
+    out = sys.stdout.buffer
+    if args.batch:
+        failures = 0
+        for result in batch_outputs(args.compiler, files, args.jobs, args.format):
+            failures += result.returncode != 0
+            out.write(result.stdout)
+            sys.stderr.buffer.write(result.stderr)
+        out.flush()
+        return 1 if failures else 0
+
+    def read(path):
+        with open(path, 'rb') as f:
+            return f.read()
+
+    failures = 0
+    with ServerPool(args.compiler, args.jobs, args.format) as pool:
+        for path, (status, payload) in zip(files, pool.map(read(path) for path in files)):
+            if status:
+                failures += 1
+                sys.stderr.write(f'{path}: {payload.decode("utf-8", "replace")}')
+            else:
+                out.write(payload)
+    out.flush()
+    return 1 if failures else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -17,8 +17,14 @@ generation pipeline.
 
 import sys
 import re
+import operator
+import subprocess
+try:
+    from re import _parser as sre_parse
+except ImportError:  # Python < 3.11
+    import sre_parse
 from pathlib import Path
-from typing import List, Tuple, Optional
+from typing import Callable, Dict, Iterator, List, Tuple, Optional
 
 
 class LexRule:
@@ -41,94 +47,219 @@ class GrammarRule:
     # in ``rhs`` and any associated semantic action (from ``{ ... }``) in
     # ``action``.
 
-def parse_def_file(filename: str) -> Tuple[List[LexRule], List[GrammarRule]]:
+class DefOptions:
+    def __init__(self):
+        self.records: List[str] = []
+        self.tables: Optional[str] = None
+        self.scanner_options: List[str] = []
+        self.buffer_size: Optional[int] = None
+        self.novalue: List[str] = []
+        self.stack_limit: Optional[int] = None
+
+    # ``DefOptions`` collects the ``%name args...`` directive lines that may
+    # appear in either section of a ``.def`` file. ``records`` lists the
+    # nonterminals declared with ``%record``: their subtrees are printed and
+    # freed as soon as the parser reduces them. ``tables`` (``%tables``),
+    # ``scanner_options`` (``%option``) and ``buffer_size`` (``%bufsize``)
+    # tune the generated Flex scanner; see `TABLE_MODES`. Tokens listed with
+    # ``%novalue`` (operators, newlines...) get leaves without text.
+    # ``stack_limit`` (``%stack``) is the parser stack size in entries,
+    # bison's ``YYMAXDEPTH``; see `BISON_MAXDEPTH`.
+
+# Parser stack entries bison allows when YYMAXDEPTH is not defined, and the
+# size it starts with
+BISON_MAXDEPTH = 10000
+BISON_INITDEPTH = 200
+
+# Flex table representations selectable with ``%tables`` / ``--tables``, as
+# the ``%option`` names equivalent to flex's -C flags. Full and fast tables
+# scan faster at the price of (much) larger tables.
+TABLE_MODES = {
+    'compressed': ('ecs', 'meta-ecs'),  # -Cem, the flex default
+    'ecs': ('ecs',),                    # -Ce
+    'full': ('full',),                  # -Cf
+    'full-ecs': ('full', 'ecs'),        # -Cfe
+    'fast': ('fast',),                  # -CF
+    'fast-ecs': ('fast', 'ecs'),        # -CFe
+}
+
+def parse_directive(line: str, options: DefOptions, filename: str):
+    """Apply one ``%name args...`` directive line to ``options``."""
+
+    parts = line[1:].split()
+    if not parts:
+        return
+    name, args = parts[0], parts[1:]
+
+    if name == 'record':
+        options.records.extend(args)
+    elif name == 'tables' and len(args) == 1 and args[0] in TABLE_MODES:
+        options.tables = args[0]
+    elif name == 'novalue':
+        options.novalue.extend(args)
+    elif name == 'option':
+        options.scanner_options.extend(args)
+    elif name == 'bufsize' and len(args) == 1 and args[0].isdigit():
+        options.buffer_size = int(args[0])
+    elif name == 'stack' and len(args) == 1 and args[0].isdigit() and int(args[0]) > 0:
+        options.stack_limit = int(args[0])
+    elif name in ('tables', 'bufsize', 'stack'):
+        print(f'Warning: {filename}: invalid %{name} {" ".join(args)} ignored')
+    else:
+        print(f'Warning: {filename}: unknown directive %{name} ignored')
+
+def scanner_options(options: DefOptions, reentrant: bool = False) -> List[str]:
+    """Return the Flex ``%option`` names for ``options``, without duplicates."""
+
+    names = []
+    if reentrant:
+        names += ['reentrant', 'bison-bridge', 'noyywrap']
+    if options.tables:
+        names += TABLE_MODES[options.tables]
+    names += options.scanner_options
+    return list(dict.fromkeys(names))
+
+def report_scanner_tables(binary: str) -> Dict[str, int]:
+    """Return the size in bytes of each Flex table linked into ``binary``.
+
+    The tables are the read-only ``yy_*`` arrays of the scanner (``yy_nxt``,
+    ``yy_chk``, ``yy_ec``...), read from the symbol table with ``nm``, so the
+    figures reflect whatever ``%tables`` mode the scanner was built with.
+    """
+
+    result = subprocess.run(['nm', '-S', '--defined-only', binary],
+                            capture_output=True, text=True, check=True)
+    tables = {}
+    for line in result.stdout.splitlines():
+        fields = line.split()
+        if len(fields) == 4 and fields[2] in ('r', 'R') and fields[3].startswith('yy_'):
+            tables[fields[3]] = int(fields[1], 16)
+    return tables
+
+def parse_def_file(filename: str) -> Tuple[List[LexRule], List[GrammarRule], DefOptions]:
     """Parse a ``.def`` analyzer file into lexer and grammar structures.
 
-    Expects exactly one ``%%LEX`` followed by one ``%%YACC`` section.  The
-    approach is intentionally pragmatic: it scans lines, extracts token /
-    regex pairs, and records grammar productions including simple semantic
-    actions.  Extremely elaborate multi-line actions may require manual touch
-    ups, but typical samples are supported.
+    Expects exactly one ``%%LEX`` followed by one ``%%YACC`` section; see
+    `parse_def_text`. Prints the problem and exits if the file is malformed.
     """
 
     with open(filename, 'r') as f:
         content = f.read()
 
-    # Basic validation that the required sections exist
-    if '%%LEX' not in content or '%%YACC' not in content:
-        print(f'Error: {filename} must contain both %%LEX and %%YACC sections')
+    try:
+        return parse_def_text(content, filename)
+    except ValueError as exc:
+        print(f'Error: {exc}')
         sys.exit(1)
 
-    # Split the file into lex and yacc sections. This assumes a single
-    # `%%LEX` followed by a single `%%YACC` in that order.
-    parts = content.split('%%LEX')
-    after_lex = parts[1].split('%%YACC')
-    lex_section = after_lex[0]
-    yacc_section = after_lex[1]
-    
+# Section markers of a .def file, as written in it
+LEX_MARKER = '%%LEX'
+YACC_MARKER = '%%YACC'
+
+# Parts of a C action that may contain braces or semicolons without them
+# being the action's own: string and character literals and comments
+ACTION_PART_PATTERN = re.compile(
+    r'"(?:[^"\\\n]|\\.)*"|\'(?:[^\'\\\n]|\\.)*\'|/\*.*?\*/|//[^\n]*|[{};]', re.S)
+
+def _action_end(content: str, start: int, end: int, filename: str) -> int:
+    """Index of the ``}`` closing the action that opens at ``content[start]``."""
+
+    depth = 0
+    for match in ACTION_PART_PATTERN.finditer(content, start, end):
+        part = match.group()
+        if part == '{':
+            depth += 1
+        elif part == '}':
+            depth -= 1
+            if not depth:
+                return match.start()
+    line = content.count('\n', 0, start) + 1
+    raise ValueError(f'{filename}:{line}: action has no closing }}')
+
+def parse_def_text(content: str, filename: str = '<def>') -> Tuple[List[LexRule], List[GrammarRule], DefOptions]:
+    """Parse the text of a ``.def`` file; see `parse_def_file`.
+
+    The text is read once, front to back. ``%%LEX`` lines are token /
+    regex pairs. In ``%%YACC`` a production is ``lhs -> symbols`` or an
+    alternative ``| symbols``, optionally followed by a C action in braces,
+    either on the same line or starting on the next one. Actions may span
+    lines and nest braces; braces inside strings and comments do not count.
+    Lines starting with a single ``%`` are directives and are collected into
+    the returned ``DefOptions``; lines starting with ``#`` are comments.
+
+    Raises ``ValueError`` if a section is missing or an action is not
+    closed. ``filename`` is only used in messages.
+    """
+
+    lex_start = content.find(LEX_MARKER)
+    yacc_start = content.find(YACC_MARKER, lex_start) if lex_start >= 0 else -1
+    if lex_start < 0 or yacc_start < 0:
+        raise ValueError(f'{filename} must contain a {LEX_MARKER} section '
+                         f'followed by a {YACC_MARKER} section')
+    lex_start += len(LEX_MARKER)
+    yacc_start += len(YACC_MARKER)
+    # The YACC section runs up to any further section marker
+    yacc_end = len(content)
+    for marker in (LEX_MARKER, YACC_MARKER):
+        found = content.find(marker, yacc_start)
+        if found >= 0:
+            yacc_end = min(yacc_end, found)
+
+    options = DefOptions()
     lex_rules = []
-    for line in lex_section.strip().split('\n'):
+    for line in content[lex_start:yacc_start - len(YACC_MARKER)].split('\n'):
         line = line.strip()
         if not line or line.startswith('#'):
             continue
+        if line.startswith('%'):
+            parse_directive(line, options, filename)
+            continue
         parts = line.split(None, 1)
         if len(parts) == 2:
             token_name, regex = parts
             lex_rules.append(LexRule(token_name, regex))
-    
+
     grammar_rules = []
-    lines = yacc_section.strip().split('\n')
-    i = 0
-    while i < len(lines):
-        line = lines[i].strip()
-        
+    position = yacc_start
+    while position < yacc_end:
+        line_end = content.find('\n', position, yacc_end)
+        if line_end < 0:
+            line_end = yacc_end
+        line = content[position:line_end].strip()
+        next_line = line_end + 1
+
+        head = line.split('{', 1)[0]
         if not line or line.startswith('#'):
-            i += 1
-            continue
-        
-        if '->' in line:
-            parts = line.split('->', 1)
-            lhs = parts[0].strip()
-            rest = parts[1].strip()
-            
-            if '{' in rest:
-                brace_content = rest[rest.index('{')+1:]
-                rhs = rest[:rest.index('{')].strip()
-                action = brace_content[:brace_content.index('}')].strip()
+            pass
+        elif line.startswith('%'):
+            parse_directive(line, options, filename)
+        elif '->' in head or (line.startswith('|') and grammar_rules):
+            if '->' in head:
+                lhs, rhs = head.split('->', 1)
+                lhs = lhs.strip()
             else:
-                rhs = rest
-                action = ''
-                if i + 1 < len(lines):
-                    next_line = lines[i + 1].strip()
-                    if next_line.startswith('{'):
-                        action = next_line[next_line.index('{')+1:next_line.index('}')].strip()
-                        i += 1
-            
-            grammar_rules.append(GrammarRule(lhs, rhs, action))
-        
-        elif line.startswith('|'):
-            if grammar_rules:
-                last_lhs = grammar_rules[-1].lhs
-                rest = line[1:].strip()
-                
-                if '{' in rest:
-                    brace_content = rest[rest.index('{')+1:]
-                    rhs = rest[:rest.index('{')].strip()
-                    action = brace_content[:brace_content.index('}')].strip()
-                else:
-                    rhs = rest
-                    action = ''
-                    if i + 1 < len(lines):
-                        next_line = lines[i + 1].strip()
-                        if next_line.startswith('{'):
-                            action = next_line[next_line.index('{')+1:next_line.index('}')].strip()
-                            i += 1
-                
-                grammar_rules.append(GrammarRule(last_lhs, rhs, action))
-        
-        i += 1
-    
-    return lex_rules, grammar_rules
+                lhs, rhs = grammar_rules[-1].lhs, head[1:]
+
+            # The action opens on this line or, failing that, the next one
+            action_start = content.find('{', position, line_end) if '{' in line else -1
+            if action_start < 0 and next_line < yacc_end:
+                following_end = content.find('\n', next_line, yacc_end)
+                following = content[next_line:following_end if following_end >= 0 else yacc_end]
+                if following.lstrip().startswith('{'):
+                    action_start = content.find('{', next_line)
+
+            action = ''
+            if action_start >= 0:
+                action_end = _action_end(content, action_start, yacc_end, filename)
+                action = content[action_start + 1:action_end].strip()
+                # Anything after the closing brace on its line is ignored
+                next_line = content.find('\n', action_end, yacc_end) + 1 or yacc_end
+
+            grammar_rules.append(GrammarRule(lhs, rhs.strip(), action))
+
+        position = next_line
+
+    return lex_rules, grammar_rules, options
 
 
 def flex_regex_to_python(pattern: str) -> str:
@@ -146,6 +277,252 @@ def flex_regex_to_python(pattern: str) -> str:
     return converted
 
 
+def split_alternatives(pattern: str) -> List[str]:
+    """Split a Flex pattern at its top-level ``|`` operators.
+
+    Bars inside groups, character classes, quoted strings or escapes are
+    kept. A pattern without top-level alternatives comes back unchanged.
+    """
+
+    parts = []
+    start = depth = 0
+    in_class = in_quote = False
+    i = 0
+    while i < len(pattern):
+        char = pattern[i]
+        if char == '\\':
+            i += 2
+            continue
+        if in_quote:
+            in_quote = char != '"'
+        elif in_class:
+            in_class = char != ']'
+        elif char == '"':
+            in_quote = True
+        elif char == '[':
+            in_class = True
+            # A leading ']' (or '^]') is a literal member of the class
+            if pattern[i + 1:i + 2] == '^':
+                i += 1
+            if pattern[i + 1:i + 2] == ']':
+                i += 1
+        elif char == '(':
+            depth += 1
+        elif char == ')':
+            depth -= 1
+        elif char == '|' and depth == 0:
+            parts.append(pattern[start:i])
+            start = i + 1
+        i += 1
+    parts.append(pattern[start:])
+    return parts
+
+
+# Python-level regex categories, for first-character tests of ``\\d`` etc.
+_CATEGORY_PATTERNS = {
+    'CATEGORY_DIGIT': r'\d', 'CATEGORY_NOT_DIGIT': r'\D',
+    'CATEGORY_SPACE': r'\s', 'CATEGORY_NOT_SPACE': r'\S',
+    'CATEGORY_WORD': r'\w', 'CATEGORY_NOT_WORD': r'\W',
+}
+
+
+def _any_char(char: str) -> bool:
+    return True
+
+
+def _class_test(items) -> Callable[[str], bool]:
+    """Membership test for the items of a parsed ``[...]`` class."""
+
+    negate = False
+    tests = []
+    for op, arg in items:
+        name = str(op)
+        if name == 'NEGATE':
+            negate = True
+        elif name == 'LITERAL':
+            tests.append(lambda char, code=arg: ord(char) == code)
+        elif name == 'RANGE':
+            tests.append(lambda char, low=arg[0], high=arg[1]: low <= ord(char) <= high)
+        elif name == 'CATEGORY' and str(arg) in _CATEGORY_PATTERNS:
+            tests.append(re.compile(_CATEGORY_PATTERNS[str(arg)]).match)
+        else:
+            return _any_char
+    return lambda char: any(test(char) for test in tests) != negate
+
+
+def _first_char_test(items) -> Tuple[Callable[[str], bool], bool]:
+    """Return ``(test, nullable)`` for a parsed regex sequence.
+
+    ``test(char)`` is true for every character a non-empty match can start
+    with (and possibly more: unknown constructs accept anything), and
+    ``nullable`` tells whether the sequence can match the empty string.
+    """
+
+    tests = []
+    for op, arg in items:
+        name = str(op)
+        nullable = False
+        if name == 'LITERAL':
+            test = lambda char, code=arg: ord(char) == code
+        elif name == 'NOT_LITERAL':
+            test = lambda char, code=arg: ord(char) != code
+        elif name == 'ANY':
+            test = lambda char: char != '\n'
+        elif name == 'IN':
+            test = _class_test(arg)
+        elif name == 'SUBPATTERN':
+            test, nullable = _first_char_test(arg[-1])
+        elif name == 'ATOMIC_GROUP':
+            test, nullable = _first_char_test(arg)
+        elif name == 'BRANCH':
+            branches = [_first_char_test(branch) for branch in arg[1]]
+            branch_tests = [test for test, _ in branches]
+            test = lambda char, tests=branch_tests: any(test(char) for test in tests)
+            nullable = any(empty for _, empty in branches)
+        elif name in ('MAX_REPEAT', 'MIN_REPEAT', 'POSSESSIVE_REPEAT'):
+            test, nullable = _first_char_test(arg[2])
+            nullable = nullable or arg[0] == 0
+        elif name in ('AT', 'ASSERT', 'ASSERT_NOT'):
+            # Zero-width: the next item decides the first character
+            continue
+        else:
+            return _any_char, True
+        tests.append(test)
+        if not nullable:
+            break
+    else:
+        nullable = True
+    return (lambda char: any(test(char) for test in tests)), nullable
+
+
+class TokenScanner:
+    """Python scanner tokenizing text the way the Flex lexer of a ``.def`` does.
+
+    At every position the longest match wins and ties go to the earliest
+    rule; input that no rule matches comes back one character at a time with
+    ``None`` as token name, like the generated lexer's fallback rule. Python
+    alternation takes the first alternative that matches rather than the
+    longest, so every top-level alternative of a rule (keyword lists such as
+    ``WIN|WINNER``) is matched on its own.
+
+    Only the alternatives that can start with the character at hand are
+    tried. For each set of them one regex holds every alternative in an
+    optional lookahead group, so a single ``match`` reports how far each
+    would match; a lone candidate is matched directly. Rules whose pattern
+    Python cannot compile are left out with a warning.
+    """
+
+    def __init__(self, lex_rules: List[LexRule]):
+        self.alternatives: List[Tuple[str, str]] = []
+        for rule in lex_rules:
+            patterns = [flex_regex_to_python(part) for part in split_alternatives(rule.regex)]
+            try:
+                for pattern in patterns:
+                    re.compile(pattern)
+            except re.error as exc:
+                print(f'Warning: could not compile regex for token {rule.token_name}: {exc}')
+                continue
+            self.alternatives.extend((rule.token_name, pattern) for pattern in patterns)
+
+        self.first_tests = []
+        for _, pattern in self.alternatives:
+            try:
+                self.first_tests.append(_first_char_test(sre_parse.parse(pattern, re.MULTILINE))[0])
+            except Exception:
+                self.first_tests.append(_any_char)
+
+        self.by_char: Dict[str, tuple] = {}
+        self.by_candidates: Dict[Tuple[int, ...], tuple] = {}
+
+    def _matcher(self, char: str) -> tuple:
+        candidates = tuple(index for index, test in enumerate(self.first_tests) if test(char))
+        matcher = self.by_candidates.get(candidates)
+        if matcher is None:
+            if len(candidates) <= 1:
+                name, pattern = self.alternatives[candidates[0]] if candidates else (None, '(?!)')
+                matcher = (re.compile(pattern, re.MULTILINE).match, None, name)
+            else:
+                groups = ''.join(f'(?:(?=(?P<t{index}>{self.alternatives[index][1]})))?'
+                                 for index in candidates)
+                scanner = re.compile(groups, re.MULTILINE)
+                # Span of the whole (empty) match first, then one per
+                # candidate, so a span's index is its candidate's plus one
+                spans = operator.itemgetter(0, *[scanner.groupindex[f't{index}']
+                                                 for index in candidates])
+                names = [None] + [self.alternatives[index][0] for index in candidates]
+                matcher = (scanner.match, spans, names)
+            self.by_candidates[candidates] = matcher
+        self.by_char[char] = matcher
+        return matcher
+
+    def scan(self, text: str) -> Iterator[Tuple[str, str]]:
+        """Yield ``(token_name, value)`` for each token of ``text``, in order."""
+
+        by_char = self.by_char
+        span_end = operator.itemgetter(1)
+        position = 0
+        end = len(text)
+        while position < end:
+            char = text[position]
+            match, spans_of, names = by_char.get(char) or self._matcher(char)
+            if spans_of is None:
+                found = match(text, position)
+                stop = found.end() if found else position
+                name = names
+            else:
+                spans = spans_of(match(text, position).regs)
+                # max() and index() both pick the first maximum: the earliest rule
+                longest = max(spans, key=span_end)
+                stop = longest[1]
+                name = names[spans.index(longest)]
+            if stop <= position:
+                yield None, char
+                position += 1
+                continue
+            yield name, text[position:stop]
+            position = stop
+
+
+# Literal node labels in grammar actions, e.g. ``create_node("expr", 2, $1, $2)``
+NODE_CALL_PATTERN = re.compile(r'\b(create_node|create_leaf_node)\s*\(\s*"((?:[^"\\]|\\.)*)"')
+
+
+def collect_node_types(lex_rules: List[LexRule], grammar_rules: List[GrammarRule]) -> Dict[str, str]:
+    """Assign an integer node type to every token and action label.
+
+    Returns an insertion-ordered mapping from type name to the C constant
+    emitted for it; the position in the mapping is the numeric id. Tokens come
+    first in ``%%LEX`` order, followed by labels in order of first use.
+    """
+
+    names = [rule.token_name for rule in lex_rules if rule.token_name != 'WHITESPACE']
+    for rule in grammar_rules:
+        names.extend(match.group(2) for match in NODE_CALL_PATTERN.finditer(rule.action))
+
+    node_types = {}
+    used = set()
+    for name in names:
+        if name in node_types:
+            continue
+        base = 'AST_' + re.sub(r'\W', '_', name)
+        constant = base
+        suffix = 2
+        while constant in used:
+            constant = f'{base}_{suffix}'
+            suffix += 1
+        used.add(constant)
+        node_types[name] = constant
+
+    return node_types
+
+
+def rewrite_action(action: str, node_types: Dict[str, str]) -> str:
+    """Replace literal labels in ``action`` with their node type constants."""
+
+    return NODE_CALL_PATTERN.sub(
+        lambda match: f'{match.group(1)}_id({node_types[match.group(2)]}', action)
+
+
 def find_input_file(def_path: Path) -> Optional[Path]:
     """Infer the most appropriate sample input file for an analyzer."""
 
@@ -170,10 +547,46 @@ def find_input_file(def_path: Path) -> Optional[Path]:
 
     return None
 
-def generate_lexer(lex_rules: List[LexRule], output_file: str):
-    """Emit a Flex ``lexer.l`` implementation from parsed ``LexRule`` entries."""
+# Per-rule lines of lexer.l; see generate_lexer
+LEX_SKIP_TEMPLATE = '{regex}    {{ /* skip whitespace */ }}\n'
+LEX_TOKEN_TEMPLATE = '{regex}    {{ {value} = create_leaf_text({constant}, {text}); return {token}; }}\n'
+
+def generate_lexer(lex_rules: List[LexRule], output_file: str,
+                   node_types: Optional[Dict[str, str]] = None,
+                   reentrant: bool = False,
+                   options: Optional[DefOptions] = None):
+    """Emit a Flex ``lexer.l`` implementation from parsed ``LexRule`` entries.
+
+    With ``reentrant`` the scanner keeps its state in a ``yyscan_t`` and
+    receives ``yylval`` from the pure parser (``bison-bridge``). Table mode,
+    extra ``%option`` names and the input buffer size come from ``options``.
+
+    Leaves are built from ``yytext``/``yyleng`` with ``create_leaf_text``, so
+    no ``strlen`` is needed and, under ``--mmap``, values can point into the
+    input. Tokens in ``options.novalue`` keep no text at all.
+    """
+
+    if node_types is None:
+        node_types = collect_node_types(lex_rules, [])
+    if options is None:
+        options = DefOptions()
+    semantic_value = 'yylval->node' if reentrant else 'yylval.node'
+    flex_options = scanner_options(options, reentrant)
+    token_names = set(rule.token_name for rule in lex_rules)
+    novalue = set()
+    for name in options.novalue:
+        if name in token_names and name != 'WHITESPACE':
+            novalue.add(name)
+        else:
+            print(f'Warning: %novalue {name} is not a token; ignored')
 
     with open(output_file, 'w') as f:
+        if options.buffer_size:
+            # YY_BUF_SIZE must be defined before flex's own default
+            f.write('%top{\n')
+            f.write(f'#define YY_BUF_SIZE {options.buffer_size}\n')
+            f.write('}\n\n')
+
         # C prologue required by flex/bison integration
         f.write('%{\n')
         f.write('#include <stdio.h>\n')
@@ -182,46 +595,160 @@ def generate_lexer(lex_rules: List[LexRule], output_file: str):
         f.write('#include "ast.h"\n')
         f.write('#include "y.tab.h"\n')
         f.write('%}\n\n')
+        if flex_options:
+            f.write('%option ' + ' '.join(flex_options) + '\n\n')
         f.write('%%\n\n')
 
         # Emit each lexer rule. The ``.regex`` is written verbatim; the .def
         # author is responsible for providing Flex-compatible patterns.
-        for rule in lex_rules:
-            if rule.token_name == 'WHITESPACE':
-                # Skip whitespace tokens entirely (no AST node created)
-                f.write(rule.regex + '    { /* skip whitespace */ }\n')
-            else:
-                # For named tokens, create a leaf node and return the token
-                f.write(rule.regex + '    { ')
-                f.write('yylval.node = create_leaf_node("' + rule.token_name + '", yytext); ')
-                f.write('return ' + rule.token_name + '; ')
-                f.write('}\n')
+        # Whitespace creates no AST node; named tokens create a leaf node and
+        # return the token.
+        f.write(''.join(
+            LEX_SKIP_TEMPLATE.format(regex=rule.regex) if rule.token_name == 'WHITESPACE'
+            else LEX_TOKEN_TEMPLATE.format(
+                regex=rule.regex, value=semantic_value, constant=node_types[rule.token_name],
+                text='NULL, 0' if rule.token_name in novalue else 'yytext, yyleng',
+                token=rule.token_name)
+            for rule in lex_rules
+        ))
 
         # Fallback rule for unexpected input characters
         f.write('\n.    { fprintf(stderr, "Unexpected character: %s\\n", yytext); }\n')
         f.write('%%\n\n')
-        f.write('int yywrap() { return 1; }\n')
+        if 'noyywrap' not in flex_options:
+            f.write('int yywrap() { return 1; }\n')
+
+def generate_parser(lex_rules: List[LexRule], grammar_rules: List[GrammarRule], output_file: str,
+                    node_types: Optional[Dict[str, str]] = None,
+                    options: Optional[DefOptions] = None,
+                    reentrant: bool = False):
+    """Produce a Bison ``parser.y`` using the collected rule definitions.
+
+    When ``options.records`` names nonterminals, the parser streams: every
+    reduction of a record nonterminal emits its subtree, frees it and hands
+    NULL to the enclosing rule, so memory stays bounded by one record.
+
+    ``options.stack_limit`` becomes ``YYMAXDEPTH``, the number of entries
+    the parser stack may grow to before bison gives up with "memory
+    exhausted".
+
+    With ``reentrant`` the parser is pure (``api.pure``) and is driven by a
+    reentrant scanner; the root and the error message go into the caller's
+    ``AnalyzerResult`` instead of globals, and the ``analyzer.h`` API is
+    emitted for ``libanalyzer.so``. Records are not streamed in this mode.
+    """
 
-def generate_parser(lex_rules: List[LexRule], grammar_rules: List[GrammarRule], output_file: str):
-    """Produce a Bison ``parser.y`` using the collected rule definitions."""
+    if node_types is None:
+        node_types = collect_node_types(lex_rules, grammar_rules)
+    if options is None:
+        options = DefOptions()
+
+    nonterminals = set(rule.lhs for rule in grammar_rules)
+    records = set()
+    for name in options.records:
+        if reentrant:
+            print(f'Warning: %record {name} is not supported with --reentrant; ignored')
+        elif name in nonterminals:
+            records.add(name)
+        else:
+            print(f'Warning: %record {name} is not a nonterminal; ignored')
+    root = 'result->root' if reentrant else 'ast_root'
 
     with open(output_file, 'w') as f:
         # Bison C prologue: includes and forward declarations
         f.write('%{\n')
+        f.write('#define _POSIX_C_SOURCE 200809L  /* open_memstream, fdopen */\n')
+        f.write('#define _DEFAULT_SOURCE  /* MAP_ANONYMOUS */\n')
         f.write('#include <stdio.h>\n')
         f.write('#include <stdlib.h>\n')
         f.write('#include <string.h>\n')
+        f.write('#include <errno.h>\n')
+        f.write('#include <unistd.h>\n')
+        f.write('#include <sys/socket.h>\n')
+        f.write('#include <sys/un.h>\n')
+        f.write('#include <sys/mman.h>\n')
+        f.write('#include <sys/stat.h>\n')
+        f.write('#include <fcntl.h>\n')
+        f.write('#include <limits.h>\n')
         f.write('#include "ast.h"\n\n')
-        f.write('extern int yylex();\n')
-        f.write('extern int yyparse();\n')
-        f.write('extern FILE *yyin;\n')
-        f.write('void yyerror(const char *s);\n\n')
-        f.write('Node *ast_root = NULL;\n')
+        if options.stack_limit:
+            f.write(f'#define YYMAXDEPTH {options.stack_limit}\n')
+            if options.stack_limit < BISON_INITDEPTH:
+                f.write(f'#define YYINITDEPTH {options.stack_limit}\n')
+            f.write('\n')
+        f.write('typedef struct yy_buffer_state *YY_BUFFER_STATE;\n')
+        if not reentrant:
+            f.write('extern int yylex();\n')
+            f.write('extern int yyparse();\n')
+            f.write('extern FILE *yyin;\n')
+            f.write('extern YY_BUFFER_STATE yy_scan_bytes(const char *bytes, int length);\n')
+            f.write('extern YY_BUFFER_STATE yy_scan_buffer(char *base, size_t size);\n')
+            f.write('extern void yy_delete_buffer(YY_BUFFER_STATE buffer);\n')
+            f.write('extern void yyrestart(FILE *file);\n')
+            f.write('void yyerror(const char *s);\n\n')
+            f.write('Node *ast_root = NULL;\n')
+            f.write('static FILE *output = NULL;\n')
+            f.write('static int output_binary = 0;\n\n')
+        if records:
+            # Record reductions print and free their subtree immediately
+            f.write('static void emit_record(Node *record) {\n')
+            f.write('    if (record == NULL) return;\n')
+            f.write('    if (output_binary) {\n')
+            f.write('        write_ast_binary(record, output);\n')
+            f.write('    } else {\n')
+            f.write('        print_ast_to(output, record, 0);\n')
+            f.write('    }\n')
+            f.write('    free_ast(record);\n')
+            f.write('}\n\n')
+
+        # Node type name table indexed by the AST_* constants below
+        f.write('const char* const ast_type_names[] = {\n')
+        f.write(''.join(f'    "{name}",\n' for name in node_types))
+        f.write('};\n')
+        f.write('const int ast_type_count = ' + str(len(node_types)) + ';\n')
         f.write('%}\n\n')
+
+        # Type constants go into y.tab.h as well so lexer.l can use them
+        f.write('%code provides {\n')
+        f.write('enum {\n')
+        f.write(''.join(f'    {constant} = {type_id},\n'
+                        for type_id, constant in enumerate(node_types.values())))
+        f.write('};\n')
+        f.write('}\n\n')
         f.write('%union {\n')
         f.write('    Node *node;\n')
         f.write('}\n\n')
 
+        if reentrant:
+            # All parse state lives in the scanner and the caller's result
+            f.write('%define api.pure full\n')
+            f.write('%lex-param {yyscan_t scanner}\n')
+            f.write('%parse-param {yyscan_t scanner} {AnalyzerResult *result}\n\n')
+            f.write('%code requires {\n')
+            f.write('#include "analyzer.h"\n')
+            f.write('#ifndef YY_TYPEDEF_YY_SCANNER_T\n')
+            f.write('#define YY_TYPEDEF_YY_SCANNER_T\n')
+            f.write('typedef void *yyscan_t;\n')
+            f.write('#endif\n\n')
+            f.write('struct AnalyzerResult {\n')
+            f.write('    Node *root;\n')
+            f.write('    AstArena *arena;\n')
+            f.write('    int status;\n')
+            f.write('    char error[256];\n')
+            f.write('};\n')
+            f.write('}\n\n')
+            f.write('%code {\n')
+            f.write('int yylex(YYSTYPE *yylval_param, yyscan_t scanner);\n')
+            f.write('int yylex_init(yyscan_t *scanner);\n')
+            f.write('int yylex_destroy(yyscan_t scanner);\n')
+            f.write('YY_BUFFER_STATE yy_scan_bytes(const char *bytes, int length, yyscan_t scanner);\n')
+            f.write('YY_BUFFER_STATE yy_scan_buffer(char *base, size_t size, yyscan_t scanner);\n')
+            f.write('void yy_delete_buffer(YY_BUFFER_STATE buffer, yyscan_t scanner);\n')
+            f.write('void yyrestart(FILE *file, yyscan_t scanner);\n')
+            f.write('void yyset_in(FILE *file, yyscan_t scanner);\n')
+            f.write('void yyerror(yyscan_t scanner, AnalyzerResult *result, const char *s);\n')
+            f.write('}\n\n')
+
         # Gather token names from lex rules (skip WHITESPACE)
         tokens = set()
         for rule in lex_rules:
@@ -229,17 +756,11 @@ def generate_parser(lex_rules: List[LexRule], grammar_rules: List[GrammarRule],
                 tokens.add(rule.token_name)
 
         # Emit %token declarations with the Node* semantic type
-        for token in sorted(tokens):
-            f.write('%token <node> ' + token + '\n')
+        f.write(''.join(f'%token <node> {token}\n' for token in sorted(tokens)))
         f.write('\n')
 
         # Declare %type for each nonterminal
-        nonterminals = set()
-        for rule in grammar_rules:
-            nonterminals.add(rule.lhs)
-
-        for nt in sorted(nonterminals):
-            f.write('%type <node> ' + nt + '\n')
+        f.write(''.join(f'%type <node> {nt}\n' for nt in sorted(nonterminals)))
         f.write('\n')
 
         # Set the start symbol to the first declared LHS
@@ -249,63 +770,577 @@ def generate_parser(lex_rules: List[LexRule], grammar_rules: List[GrammarRule],
         f.write('%%\n\n')
 
         # Emit grammar rules grouped by LHS, using '|' for alternatives and
-        # preserving any user-provided actions.
+        # preserving any user-provided actions. The section is assembled in
+        # memory and written at once.
+        out = []
         current_lhs = None
         is_first_rule = True
         for rule in grammar_rules:
             if rule.lhs != current_lhs:
                 if current_lhs is not None:
-                    f.write('    ;\n\n')
-                f.write(rule.lhs + ':\n')
+                    out.append('    ;\n\n')
+                out.append(rule.lhs + ':\n    ')
                 current_lhs = rule.lhs
-                first = True
             else:
-                f.write('    | ')
-                first = False
-
-            if first:
-                f.write('    ')
+                out.append('    | ')
 
-            f.write(rule.rhs if rule.rhs else '/* empty */')
+            out.append(rule.rhs if rule.rhs else '/* empty */')
 
             # Attach action code if present. For the very first grammar rule
-            # record the root AST node in ``ast_root``.
+            # record the root AST node (``ast_root`` or the result's root);
+            # record rules emit their subtree and pass NULL upwards.
+            # Actions that span lines or may end in a // comment get the
+            # added statements and the closing brace on lines of their own.
             if rule.action:
-                f.write('\n        { ' + rule.action)
+                separator = '\n        ' if '\n' in rule.action or '//' in rule.action else ' '
+                out.append('\n        { ' + rewrite_action(rule.action, node_types))
+                if rule.lhs in records:
+                    out.append(separator + 'emit_record($$); $$ = NULL;')
                 if is_first_rule:
-                    f.write(' ast_root = $$;')
-                f.write(' }')
+                    out.append(separator + root + ' = $$;')
+                out.append(separator + '}')
+            elif rule.lhs in records:
+                out.append('\n        { ')
+                if rule.rhs:
+                    out.append('emit_record($1); ')
+                out.append('$$ = NULL; }')
             elif is_first_rule:
-                f.write('\n        { ast_root = $$; }')
+                out.append('\n        { ' + root + ' = $$; }')
 
-            f.write('\n')
+            out.append('\n')
             is_first_rule = False
 
         if current_lhs is not None:
-            f.write('    ;\n\n')
+            out.append('    ;\n\n')
+        f.write(''.join(out))
 
-        # Epilogue: error handler and a small main() that runs the parser
+        # Epilogue: error handler and main()
         f.write('%%\n\n')
+        if reentrant:
+            generate_library(f)
+        generate_main(f, streaming=bool(records), reentrant=reentrant)
+
+def generate_library(f):
+    """Write ``yyerror`` and the ``analyzer.h`` API for a reentrant parser.
+
+    Every call owns a scanner, an ``AnalyzerResult`` and an arena that the
+    tree is carved from; the arena is selected only for the current thread
+    while parsing, so calls on different threads never share state.
+    """
+
+    f.write('void yyerror(yyscan_t scanner, AnalyzerResult *result, const char *s) {\n')
+    f.write('    (void)scanner;\n')
+    f.write('    snprintf(result->error, sizeof(result->error), "Parse error: %s\\n", s);\n')
+    f.write('}\n\n')
+    f.write('AnalyzerResult *analyzer_parse(const char *data, size_t length) {\n')
+    f.write('    AnalyzerResult *result = (AnalyzerResult*)calloc(1, sizeof(AnalyzerResult));\n')
+    f.write('    if (!result) return NULL;\n')
+    f.write('    yyscan_t scanner;\n')
+    f.write('    if (length > INT_MAX || yylex_init(&scanner) != 0) {\n')
+    f.write('        snprintf(result->error, sizeof(result->error), "Cannot scan input of %zu bytes\\n", length);\n')
+    f.write('        result->status = 3;\n')
+    f.write('        return result;\n')
+    f.write('    }\n\n')
+    f.write('    result->arena = ast_arena_create();\n')
+    f.write('    AstArena *previous = ast_arena_select(result->arena);\n')
+    f.write('    YY_BUFFER_STATE buffer = yy_scan_bytes(data, (int)length, scanner);\n')
+    f.write('    result->status = yyparse(scanner, result);\n')
+    f.write('    yy_delete_buffer(buffer, scanner);\n')
+    f.write('    yylex_destroy(scanner);\n')
+    f.write('    ast_arena_select(previous);\n')
+    f.write('    if (result->status != 0) {\n')
+    f.write('        result->root = NULL;\n')
+    f.write('    }\n')
+    f.write('    return result;\n')
+    f.write('}\n\n')
+    f.write('int analyzer_status(const AnalyzerResult *result) {\n')
+    f.write('    return result->status;\n')
+    f.write('}\n\n')
+    f.write('const char *analyzer_error(const AnalyzerResult *result) {\n')
+    f.write('    return result->error;\n')
+    f.write('}\n\n')
+    f.write('Node *analyzer_root(const AnalyzerResult *result) {\n')
+    f.write('    return result->root;\n')
+    f.write('}\n\n')
+    f.write('int analyzer_write_binary(const AnalyzerResult *result, char **data, size_t *size) {\n')
+    f.write('    *data = NULL;\n')
+    f.write('    *size = 0;\n')
+    f.write('    if (result->root == NULL) return -1;\n')
+    f.write('    FILE *memory = open_memstream(data, size);\n')
+    f.write('    if (!memory) return -1;\n')
+    f.write('    write_ast_binary(result->root, memory);\n')
+    f.write('    return fclose(memory) == 0 ? 0 : -1;\n')
+    f.write('}\n\n')
+    f.write('void analyzer_free_buffer(char *data) {\n')
+    f.write('    free(data);\n')
+    f.write('}\n\n')
+    f.write('void analyzer_free(AnalyzerResult *result) {\n')
+    f.write('    if (!result) return;\n')
+    f.write('    ast_arena_destroy(result->arena);\n')
+    f.write('    free(result);\n')
+    f.write('}\n\n')
+
+def generate_main(f, streaming: bool = False, reentrant: bool = False):
+    """Write the C epilogue: ``yyerror``, the document runner and ``main``.
+
+    The program parses one input (a file or stdin) by default. With
+    ``--server`` it stays resident and answers length-prefixed documents on
+    stdin/stdout, or on a Unix socket with ``--socket PATH``:
+
+    - request: u32 length, then that many bytes of input
+    - response: u32 status (``yyparse()`` result), u32 length, then the tree
+      in the selected format, or the error message if the status is not 0
+
+    All integers are little-endian. Each document gets a fresh scanner buffer
+    via ``yy_scan_bytes`` and its tree memory is released before the next.
+
+    Given several inputs, or a list of paths with ``--files-from PATH`` (``-``
+    for stdin), the program parses each file in turn with ``yyrestart`` and
+    writes one record per file. In text format a record is a
+    ``=== File: PATH ===`` line followed by the tree or the error message. In
+    binary format it is a frame: u32 status, u32 path length, the path, u32
+    payload length and the tree (or error message). Status 3 means the file
+    could not be opened.
+
+    ``--range START:END`` parses only bytes ``[START, END)`` of the single
+    input file, memory-mapped rather than read, so that parallel processes
+    can each take one shard of a large line-oriented input.
+
+    ``--mmap`` parses the single input (or its ``--range``) in place with
+    ``yy_scan_buffer`` over a private mapping instead of copying it, and turns
+    on ``ast_share_input`` so leaf values point into the mapping rather than
+    being duplicated. The tree is written before the mapping is released.
+
+    A ``reentrant`` parser is driven through one scanner and result owned by
+    the program. Its ``main`` is left out when compiling with
+    ``-DANALYZER_LIBRARY``, which is how ``libanalyzer.so`` is built.
+    """
+
+    # Scanner calls take the scanner as last argument in reentrant mode
+    scanner = ', scanner' if reentrant else ''
+    root = 'state.root' if reentrant else 'ast_root'
+
+    if reentrant:
+        f.write('#ifndef ANALYZER_LIBRARY\n')
+        f.write('static yyscan_t scanner;\n')
+        f.write('static AnalyzerResult state;\n')
+        f.write('static FILE *output = NULL;\n')
+        f.write('static int output_binary = 0;\n')
+    # Parse errors are also kept for the server's error responses
+    f.write('static char last_error[256];\n')
+    f.write('static int server_mode = 0;\n')
+    f.write('static int batch_mode = 0;\n\n')
+    if not reentrant:
         f.write('void yyerror(const char *s) {\n')
-        f.write('    fprintf(stderr, "Parse error: %s\\n", s);\n')
+        f.write('    snprintf(last_error, sizeof(last_error), "Parse error: %s\\n", s);\n')
+        f.write('    if (!server_mode && !batch_mode) {\n')
+        f.write('        fputs(last_error, stderr);\n')
+        f.write('    }\n')
         f.write('}\n\n')
-        f.write('int main(int argc, char **argv) {\n')
-        f.write('    if (argc > 1) {\n')
-        f.write('        FILE *file = fopen(argv[1], "r");\n')
-        f.write('        if (!file) {\n')
-        f.write('            perror(argv[1]);\n')
-        f.write('            return 1;\n')
+    f.write('static void usage(const char *program) {\n')
+    f.write('    fprintf(stderr, "Usage: %s [--format text|binary] [--server] [--socket PATH] [--files-from PATH] [--range START:END] [--mmap] [input...]\\n", program);\n')
+    f.write('}\n\n')
+
+    # Parse whatever input is current and write its tree to ``output``
+    f.write('static int parse_document(void) {\n')
+    if reentrant:
+        f.write('    state.root = NULL;\n')
+        f.write('    state.error[0] = \'\\0\';\n')
+        f.write('    int result = yyparse(scanner, &state);\n')
+        f.write('    memcpy(last_error, state.error, sizeof(last_error));\n')
+        f.write('    if (result != 0 && !server_mode && !batch_mode) {\n')
+        f.write('        fputs(last_error, stderr);\n')
+        f.write('    }\n')
+    else:
+        f.write('    ast_root = NULL;\n')
+    if streaming:
+        # Records are printed while parsing, so the header goes first and
+        # nodes are freed one record at a time instead of via the arena.
+        f.write('    if (!output_binary) {\n')
+        f.write('        fputs("\\n=== Parse Tree ===\\n", output);\n')
+        f.write('    }\n')
+        f.write('    int result = yyparse();\n')
+        f.write('    if (result == 0 && ast_root != NULL) {\n')
+        f.write('        emit_record(ast_root);\n')
+        f.write('    }\n')
+    else:
+        if not reentrant:
+            f.write('    int result = yyparse();\n')
+        f.write(f'    if (result == 0 && {root} != NULL) {{\n')
+        f.write('        if (output_binary) {\n')
+        f.write(f'            write_ast_binary({root}, output);\n')
+        f.write('        } else {\n')
+        f.write('            fputs("\\n=== Parse Tree ===\\n", output);\n')
+        f.write(f'            print_ast_to(output, {root}, 0);\n')
         f.write('        }\n')
+        f.write('    }\n')
+        f.write('    ast_arena_release();\n')
+    f.write('    return result;\n')
+    f.write('}\n\n')
+
+    # Little-endian framing helpers for server mode
+    f.write('static int read_u32(FILE *in, unsigned int *value) {\n')
+    f.write('    unsigned char bytes[4];\n')
+    f.write('    if (fread(bytes, 1, 4, in) != 4) return 0;\n')
+    f.write('    *value = bytes[0] | (bytes[1] << 8) | (bytes[2] << 16) | ((unsigned int)bytes[3] << 24);\n')
+    f.write('    return 1;\n')
+    f.write('}\n\n')
+    f.write('static void write_u32(FILE *out, unsigned int value) {\n')
+    f.write('    unsigned char bytes[4] = {\n')
+    f.write('        value & 0xFF, (value >> 8) & 0xFF, (value >> 16) & 0xFF, (value >> 24) & 0xFF\n')
+    f.write('    };\n')
+    f.write('    fwrite(bytes, 1, 4, out);\n')
+    f.write('}\n\n')
+
+    # Answer documents until the client closes its end
+    f.write('static int serve(FILE *in, FILE *out) {\n')
+    f.write('    char *document = NULL;\n')
+    f.write('    size_t capacity = 0;\n')
+    f.write('    char *reply = NULL;\n')
+    f.write('    size_t reply_size = 0;\n')
+    f.write('    FILE *memory = open_memstream(&reply, &reply_size);\n')
+    f.write('    if (!memory) {\n')
+    f.write('        perror("open_memstream");\n')
+    f.write('        return 1;\n')
+    f.write('    }\n')
+    f.write('    output = memory;\n\n')
+    f.write('    unsigned int length;\n')
+    f.write('    while (read_u32(in, &length)) {\n')
+    f.write('        if (length + 1 > capacity) {\n')
+    f.write('            capacity = length + 1;\n')
+    f.write('            document = (char*)realloc(document, capacity);\n')
+    f.write('            if (!document) {\n')
+    f.write('                perror("server");\n')
+    f.write('                return 1;\n')
+    f.write('            }\n')
+    f.write('        }\n')
+    f.write('        if (fread(document, 1, length, in) != length) break;\n\n')
+    f.write('        last_error[0] = \'\\0\';\n')
+    f.write(f'        YY_BUFFER_STATE buffer = yy_scan_bytes(document, (int)length{scanner});\n')
+    f.write('        int status = parse_document();\n')
+    f.write(f'        yy_delete_buffer(buffer{scanner});\n')
+    f.write('        fflush(memory);\n\n')
+    f.write('        const char *payload = reply;\n')
+    f.write('        size_t payload_size = reply_size;\n')
+    f.write('        if (status != 0) {\n')
+    f.write('            payload = last_error;\n')
+    f.write('            payload_size = strlen(last_error);\n')
+    f.write('        }\n')
+    f.write('        write_u32(out, (unsigned int)status);\n')
+    f.write('        write_u32(out, (unsigned int)payload_size);\n')
+    f.write('        fwrite(payload, 1, payload_size, out);\n')
+    f.write('        fflush(out);\n')
+    f.write('        fseek(memory, 0, SEEK_SET);\n')
+    f.write('    }\n\n')
+    f.write('    fclose(memory);\n')
+    f.write('    free(reply);\n')
+    f.write('    free(document);\n')
+    f.write('    output = stdout;\n')
+    f.write('    return 0;\n')
+    f.write('}\n\n')
+
+    # Accept clients on a Unix socket one after another
+    f.write('static int serve_socket(const char *path) {\n')
+    f.write('    struct sockaddr_un address;\n')
+    f.write('    memset(&address, 0, sizeof(address));\n')
+    f.write('    address.sun_family = AF_UNIX;\n')
+    f.write('    if (strlen(path) >= sizeof(address.sun_path)) {\n')
+    f.write('        fprintf(stderr, "Socket path too long: %s\\n", path);\n')
+    f.write('        return 1;\n')
+    f.write('    }\n')
+    f.write('    strcpy(address.sun_path, path);\n\n')
+    f.write('    int listener = socket(AF_UNIX, SOCK_STREAM, 0);\n')
+    f.write('    unlink(path);\n')
+    f.write('    if (listener < 0 || bind(listener, (struct sockaddr*)&address, sizeof(address)) < 0 ||\n')
+    f.write('        listen(listener, 16) < 0) {\n')
+    f.write('        perror(path);\n')
+    f.write('        return 1;\n')
+    f.write('    }\n\n')
+    f.write('    for (;;) {\n')
+    f.write('        int connection = accept(listener, NULL, NULL);\n')
+    f.write('        if (connection < 0) {\n')
+    f.write('            if (errno == EINTR) continue;\n')
+    f.write('            perror("accept");\n')
+    f.write('            return 1;\n')
+    f.write('        }\n')
+    f.write('        FILE *in = fdopen(connection, "rb");\n')
+    f.write('        FILE *out = fdopen(dup(connection), "wb");\n')
+    f.write('        if (in && out) {\n')
+    f.write('            serve(in, out);\n')
+    f.write('        }\n')
+    f.write('        if (in) fclose(in);\n')
+    f.write('        if (out) fclose(out);\n')
+    f.write('    }\n')
+    f.write('}\n\n')
+
+    # Parse one file of a batch and write its record
+    f.write('static FILE *batch_memory = NULL;\n')
+    f.write('static char *batch_reply = NULL;\n')
+    f.write('static size_t batch_reply_size = 0;\n\n')
+    f.write('static int batch_file(const char *path) {\n')
+    f.write('    int status;\n')
+    f.write('    last_error[0] = \'\\0\';\n')
+    f.write('    if (!output_binary) {\n')
+    f.write('        fprintf(stdout, "=== File: %s ===\\n", path);\n')
+    f.write('    }\n')
+    f.write('    FILE *file = fopen(path, "r");\n')
+    f.write('    if (!file) {\n')
+    f.write('        snprintf(last_error, sizeof(last_error), "Cannot open %s: %s\\n", path, strerror(errno));\n')
+    f.write('        status = 3;\n')
+    f.write('    } else {\n')
+    f.write(f'        yyrestart(file{scanner});\n')
+    f.write('        status = parse_document();\n')
+    f.write('        fclose(file);\n')
+    f.write('    }\n\n')
+    f.write('    if (!output_binary) {\n')
+    f.write('        fputs(last_error, stdout);\n')
+    f.write('        return status;\n')
+    f.write('    }\n')
+    f.write('    fflush(batch_memory);\n')
+    f.write('    const char *payload = batch_reply;\n')
+    f.write('    size_t payload_size = batch_reply_size;\n')
+    f.write('    if (status != 0) {\n')
+    f.write('        payload = last_error;\n')
+    f.write('        payload_size = strlen(last_error);\n')
+    f.write('    }\n')
+    f.write('    size_t path_size = strlen(path);\n')
+    f.write('    write_u32(stdout, (unsigned int)status);\n')
+    f.write('    write_u32(stdout, (unsigned int)path_size);\n')
+    f.write('    fwrite(path, 1, path_size, stdout);\n')
+    f.write('    write_u32(stdout, (unsigned int)payload_size);\n')
+    f.write('    fwrite(payload, 1, payload_size, stdout);\n')
+    f.write('    fseek(batch_memory, 0, SEEK_SET);\n')
+    f.write('    return status;\n')
+    f.write('}\n\n')
+
+    # Parse every listed file; paths come from argv and then --files-from
+    f.write('static int batch(const char **paths, int count, const char *list_path) {\n')
+    f.write('    if (output_binary) {\n')
+    f.write('        batch_memory = open_memstream(&batch_reply, &batch_reply_size);\n')
+    f.write('        if (!batch_memory) {\n')
+    f.write('            perror("open_memstream");\n')
+    f.write('            return 1;\n')
+    f.write('        }\n')
+    f.write('        output = batch_memory;\n')
+    f.write('    }\n\n')
+    f.write('    int failures = 0;\n')
+    f.write('    for (int i = 0; i < count; i++) {\n')
+    f.write('        failures += batch_file(paths[i]) != 0;\n')
+    f.write('    }\n\n')
+    f.write('    if (list_path) {\n')
+    f.write('        FILE *list = strcmp(list_path, "-") == 0 ? stdin : fopen(list_path, "r");\n')
+    f.write('        if (!list) {\n')
+    f.write('            perror(list_path);\n')
+    f.write('            return 1;\n')
+    f.write('        }\n')
+    f.write('        char *line = NULL;\n')
+    f.write('        size_t line_capacity = 0;\n')
+    f.write('        ssize_t length;\n')
+    f.write('        while ((length = getline(&line, &line_capacity, list)) != -1) {\n')
+    f.write('            while (length > 0 && (line[length - 1] == \'\\n\' || line[length - 1] == \'\\r\')) {\n')
+    f.write('                line[--length] = \'\\0\';\n')
+    f.write('            }\n')
+    f.write('            if (length > 0) {\n')
+    f.write('                failures += batch_file(line) != 0;\n')
+    f.write('            }\n')
+    f.write('        }\n')
+    f.write('        free(line);\n')
+    f.write('        if (list != stdin) fclose(list);\n')
+    f.write('    }\n\n')
+    f.write('    fflush(stdout);\n')
+    f.write('    if (batch_memory) {\n')
+    f.write('        fclose(batch_memory);\n')
+    f.write('        free(batch_reply);\n')
+    f.write('        output = stdout;\n')
+    f.write('    }\n')
+    f.write('    return failures ? 1 : 0;\n')
+    f.write('}\n\n')
+
+    # Parse one byte range of a file straight from a memory mapping. With
+    # zero_copy the scanner runs in place over a private, writable mapping
+    # (flex needs two NUL bytes after the text and writes its hold char into
+    # the buffer; touched pages are copied on write) and leaves point into it.
+    f.write('static int parse_range(const char *path, long long start, long long end, int zero_copy) {\n')
+    f.write('    int fd = open(path, O_RDONLY);\n')
+    f.write('    struct stat info;\n')
+    f.write('    if (fd < 0 || fstat(fd, &info) < 0) {\n')
+    f.write('        perror(path);\n')
+    f.write('        return 1;\n')
+    f.write('    }\n')
+    f.write('    if (end < 0 || end > (long long)info.st_size) end = info.st_size;\n')
+    f.write('    if (start < 0 || start > end || end - start > INT_MAX - 2) {\n')
+    f.write('        fprintf(stderr, "Invalid range %lld:%lld for %s\\n", start, end, path);\n')
+    f.write('        close(fd);\n')
+    f.write('        return 2;\n')
+    f.write('    }\n\n')
+    f.write('    /* Mappings start on a page boundary */\n')
+    f.write('    long long page = sysconf(_SC_PAGESIZE);\n')
+    f.write('    long long aligned = start - start % page;\n')
+    f.write('    size_t span = (size_t)(end - aligned);\n')
+    f.write('    size_t length = (size_t)(end - start);\n')
+    f.write('    size_t mapped = zero_copy ? span + 2 : span;\n')
+    f.write('    char *data = NULL;\n')
+    f.write('    if (zero_copy) {\n')
+    f.write('        /* Reserve room for the terminators, then map the file over it */\n')
+    f.write('        data = (char*)mmap(NULL, mapped, PROT_READ | PROT_WRITE, MAP_PRIVATE | MAP_ANONYMOUS, -1, 0);\n')
+    f.write('        if (data != MAP_FAILED && span > 0 &&\n')
+    f.write('            mmap(data, span, PROT_READ | PROT_WRITE, MAP_PRIVATE | MAP_FIXED, fd, (off_t)aligned) == MAP_FAILED) {\n')
+    f.write('            munmap(data, mapped);\n')
+    f.write('            data = (char*)MAP_FAILED;\n')
+    f.write('        }\n')
+    f.write('    } else if (mapped > 0) {\n')
+    f.write('        data = (char*)mmap(NULL, mapped, PROT_READ, MAP_PRIVATE, fd, (off_t)aligned);\n')
+    f.write('    }\n')
+    f.write('    if (data == MAP_FAILED) {\n')
+    f.write('        perror(path);\n')
+    f.write('        close(fd);\n')
+    f.write('        return 1;\n')
+    f.write('    }\n')
+    f.write('    close(fd);\n\n')
+    f.write('    YY_BUFFER_STATE buffer;\n')
+    f.write('    if (zero_copy) {\n')
+    f.write('        char *text = data + (start - aligned);\n')
+    f.write('        text[length] = \'\\0\';\n')
+    f.write('        text[length + 1] = \'\\0\';\n')
+    f.write(f'        buffer = yy_scan_buffer(text, length + 2{scanner});\n')
+    f.write('        ast_share_input(1);\n')
+    f.write('    } else {\n')
+    f.write(f'        buffer = yy_scan_bytes(data ? data + (start - aligned) : "", (int)length{scanner});\n')
+    f.write('    }\n')
+    f.write('    int result = parse_document();\n')
+    f.write('    ast_share_input(0);\n')
+    f.write(f'    yy_delete_buffer(buffer{scanner});\n')
+    f.write('    if (data) munmap(data, mapped);\n')
+    f.write('    return result;\n')
+    f.write('}\n\n')
+
+    f.write('int main(int argc, char **argv) {\n')
+    f.write('    const char **paths = (const char**)malloc(argc * sizeof(char*));\n')
+    f.write('    int path_count = 0;\n')
+    f.write('    const char *socket_path = NULL;\n')
+    f.write('    const char *list_path = NULL;\n')
+    f.write('    const char *range = NULL;\n')
+    f.write('    int zero_copy = 0;\n\n')
+    f.write('    for (int i = 1; i < argc; i++) {\n')
+    f.write('        if (strcmp(argv[i], "--format") == 0 && i + 1 < argc) {\n')
+    f.write('            const char *format = argv[++i];\n')
+    f.write('            if (strcmp(format, "binary") == 0) {\n')
+    f.write('                output_binary = 1;\n')
+    f.write('            } else if (strcmp(format, "text") != 0) {\n')
+    f.write('                usage(argv[0]);\n')
+    f.write('                return 2;\n')
+    f.write('            }\n')
+    f.write('        } else if (strcmp(argv[i], "--server") == 0) {\n')
+    f.write('            server_mode = 1;\n')
+    f.write('        } else if (strcmp(argv[i], "--socket") == 0 && i + 1 < argc) {\n')
+    f.write('            server_mode = 1;\n')
+    f.write('            socket_path = argv[++i];\n')
+    f.write('        } else if (strcmp(argv[i], "--files-from") == 0 && i + 1 < argc) {\n')
+    f.write('            list_path = argv[++i];\n')
+    f.write('        } else if (strcmp(argv[i], "--range") == 0 && i + 1 < argc) {\n')
+    f.write('            range = argv[++i];\n')
+    f.write('        } else if (strcmp(argv[i], "--mmap") == 0) {\n')
+    f.write('            zero_copy = 1;\n')
+    f.write('        } else if (argv[i][0] == \'-\' && argv[i][1] != \'\\0\') {\n')
+    f.write('            usage(argv[0]);\n')
+    f.write('            return 2;\n')
+    f.write('        } else {\n')
+    f.write('            paths[path_count++] = argv[i];\n')
+    f.write('        }\n')
+    f.write('    }\n\n')
+    f.write('    output = stdout;\n')
+    if reentrant:
+        f.write('    if (yylex_init(&scanner) != 0) {\n')
+        f.write('        perror("yylex_init");\n')
+        f.write('        return 1;\n')
+        f.write('    }\n')
+    if streaming:
+        f.write('    /* Stream records as they are reduced; drop the emptied spine */\n')
+        f.write('    ast_collapse_empty(1);\n\n')
+    else:
+        f.write('    /* Carve each tree from arena blocks and release it in one go */\n')
+        f.write('    ast_arena_enable();\n\n')
+    f.write('    if (server_mode) {\n')
+    f.write('        return socket_path ? serve_socket(socket_path) : serve(stdin, stdout);\n')
+    f.write('    }\n\n')
+    f.write('    if (list_path || path_count > 1) {\n')
+    f.write('        batch_mode = 1;\n')
+    f.write('        return batch(paths, path_count, list_path);\n')
+    f.write('    }\n\n')
+    f.write('    if (range) {\n')
+    f.write('        char *separator = NULL;\n')
+    f.write('        long long start = strtoll(range, &separator, 10);\n')
+    f.write('        if (path_count != 1 || *separator != \':\') {\n')
+    f.write('            usage(argv[0]);\n')
+    f.write('            return 2;\n')
+    f.write('        }\n')
+    f.write('        /* An empty END means the end of the file */\n')
+    f.write('        long long end = separator[1] ? strtoll(separator + 1, NULL, 10) : -1;\n')
+    f.write('        return parse_range(paths[0], start, end, zero_copy);\n')
+    f.write('    }\n\n')
+    f.write('    if (zero_copy && path_count == 1) {\n')
+    f.write('        return parse_range(paths[0], 0, -1, 1);\n')
+    f.write('    }\n\n')
+    f.write('    if (path_count == 1) {\n')
+    f.write('        FILE *file = fopen(paths[0], "r");\n')
+    f.write('        if (!file) {\n')
+    f.write('            perror(paths[0]);\n')
+    f.write('            return 1;\n')
+    f.write('        }\n')
+    if reentrant:
+        f.write('        yyset_in(file, scanner);\n')
+    else:
         f.write('        yyin = file;\n')
-        f.write('    }\n\n')
-        f.write('    int result = yyparse();\n\n')
-        f.write('    if (result == 0 && ast_root != NULL) {\n')
-        f.write('        printf("\\n=== Parse Tree ===\\n");\n')
-        f.write('        print_ast(ast_root, 0);\n')
-        f.write('        free_ast(ast_root);\n')
-        f.write('    }\n\n')
-        f.write('    return result;\n')
-        f.write('}\n')
+    f.write('    }\n\n')
+    f.write('    return parse_document();\n')
+    f.write('}\n')
+    if reentrant:
+        f.write('#endif\n')
+
+# Tokens whose values make poor examples (punctuation, whitespace, generic
+# character classes); no *_tokens.txt file is written for them
+SKIP_TOKEN_SAMPLES = {
+    'WHITESPACE', 'NEWLINE', 'SPACE', 'TAB',
+    'COMMA', 'DOT', 'COLON', 'SEMICOLON',
+    'LPAREN', 'RPAREN', 'LBRACE', 'RBRACE',
+    'LBRACKET', 'RBRACKET', 'QUOTE', 'DQUOTE',
+    'PLUS', 'MINUS', 'TIMES', 'DIVIDE', 'STAR',
+    'EQUALS', 'DASH', 'SLASH', 'BACKSLASH',
+    'PERCENT', 'DOLLAR', 'AT', 'HASH', 'EXCLAIM',
+    'QUESTION', 'AMPERSAND', 'PIPE', 'CARET',
+    'TILDE', 'BACKTICK', 'UNDERSCORE',
+    'LETTER', 'DIGIT', 'WORD', 'CHAR'
+}
+
+# Unique values written to each *_tokens.txt file
+MAX_TOKEN_SAMPLES = 50
+
+def remove_token_files(output_dir: Path):
+    """Delete previously generated ``*_tokens.txt`` files in ``output_dir``."""
+
+    removed = 0
+    for token_file in output_dir.glob('*_tokens.txt'):
+        try:
+            token_file.unlink()
+            removed += 1
+        except OSError as exc:
+            print(f'Warning: could not remove {token_file.name}: {exc}')
+
+    if removed:
+        print(f'Removed {removed} old token file(s) from {output_dir}')
+
+def write_token_file(output_dir: Path, token_name: str, values: List[str]) -> bool:
+    """Write ``values`` one per line to ``{token_name}_tokens.txt``."""
+
+    filepath = output_dir / f"{token_name.lower()}_tokens.txt"
+    try:
+        with open(filepath, 'w') as f:
+            for value in values:
+                f.write(f"{value}\n")
+    except OSError as exc:
+        print(f'Warning: could not write {filepath.name}: {exc}')
+        return False
+    return True
 
 def generate_token_files(lex_rules: List[LexRule], def_file: str):
     """
@@ -315,9 +1350,10 @@ def generate_token_files(lex_rules: List[LexRule], def_file: str):
      1. Locate the input file associated with the `.def` analyzer.
      2. Remove any previously generated `*_tokens.txt` files so that output is
          always derived from the latest input.
-     3. For each lex rule (excluding punctuation/whitespace tokens), compile a
-         Python regex equivalent of the Flex pattern and find unique matches in the
-         input text.
+     3. Tokenize the input once with a Python scanner combining every lex rule
+         (longest match, earliest rule first, as Flex does) and collect up to
+         `max_samples` unique values per token, excluding punctuation and
+         whitespace tokens. Scanning stops once every token has enough.
      4. Write the matches to `{token_name}_tokens.txt` in the analyzer directory.
     """
 
@@ -335,74 +1371,29 @@ def generate_token_files(lex_rules: List[LexRule], def_file: str):
         print(f'Could not read input file {input_file}: {exc}')
         return
 
-    # Remove previously generated token files in this analyzer directory
-    removed = 0
-    for token_file in output_dir.glob('*_tokens.txt'):
-        try:
-            token_file.unlink()
-            removed += 1
-        except OSError as exc:
-            print(f'Warning: could not remove {token_file.name}: {exc}')
-
-    if removed:
-        print(f'Removed {removed} old token file(s) from {output_dir}')
-
-    skip_tokens = {
-        'WHITESPACE', 'NEWLINE', 'SPACE', 'TAB',
-        'COMMA', 'DOT', 'COLON', 'SEMICOLON',
-        'LPAREN', 'RPAREN', 'LBRACE', 'RBRACE',
-        'LBRACKET', 'RBRACKET', 'QUOTE', 'DQUOTE',
-        'PLUS', 'MINUS', 'TIMES', 'DIVIDE', 'STAR',
-        'EQUALS', 'DASH', 'SLASH', 'BACKSLASH',
-        'PERCENT', 'DOLLAR', 'AT', 'HASH', 'EXCLAIM',
-        'QUESTION', 'AMPERSAND', 'PIPE', 'CARET',
-        'TILDE', 'BACKTICK', 'UNDERSCORE',
-        'LETTER', 'DIGIT', 'WORD', 'CHAR'
-    }
-
-    max_samples = 50
+    remove_token_files(output_dir)
+    max_samples = MAX_TOKEN_SAMPLES
+    skip_tokens = SKIP_TOKEN_SAMPLES
     files_created = 0
 
-    for rule in lex_rules:
-        token_name = rule.token_name
-
-        if token_name.upper() in skip_tokens:
-            continue
-
-        pattern = flex_regex_to_python(rule.regex)
-        try:
-            regex = re.compile(pattern, re.MULTILINE)
-        except re.error as exc:
-            print(f'Warning: could not compile regex for token {token_name}: {exc}')
+    # One pass over the input with the same tokenization as the lexer
+    scanner = TokenScanner(lex_rules)
+    samples: Dict[str, Dict[str, None]] = {
+        name: {} for name, _ in scanner.alternatives if name.upper() not in skip_tokens
+    }
+    pending = set(samples)
+    for token_name, value in scanner.scan(text):
+        if token_name not in pending or value in samples[token_name]:
             continue
-
-        matches = []
-        seen = set()
-        for match in regex.finditer(text):
-            value = match.group(0)
-            if not value:
-                continue
-            if value in seen:
-                continue
-            matches.append(value)
-            seen.add(value)
-            if len(matches) >= max_samples:
+        samples[token_name][value] = None
+        if len(samples[token_name]) >= max_samples:
+            pending.discard(token_name)
+            if not pending:
                 break
 
-        if not matches:
-            continue
-
-        filename = f"{token_name.lower()}_tokens.txt"
-        filepath = output_dir / filename
-        try:
-            with open(filepath, 'w') as f:
-                for value in matches:
-                    f.write(f"{value}\n")
-        except OSError as exc:
-            print(f'Warning: could not write {filepath.name}: {exc}')
-            continue
-
-        files_created += 1
+    for token_name, matches in samples.items():
+        if matches and write_token_file(output_dir, token_name, matches):
+            files_created += 1
 
     if files_created > 0:
         print(f'Generated {files_created} token example file(s) in {output_dir} from {input_file.name}')
@@ -410,25 +1401,96 @@ def generate_token_files(lex_rules: List[LexRule], def_file: str):
         print(f'No token data generated from {input_file.name}')
 
 def main():
-    if len(sys.argv) != 2:
-        print('Usage: generator.py <input.def>')
-        sys.exit(1)
-    
-    def_file = sys.argv[1]
+    import argparse
+
+    parser = argparse.ArgumentParser(description='Generate lexer.l and parser.y from a .def analyzer')
+    parser.add_argument('def_file', nargs='?', help='Analyzer .def file')
+    parser.add_argument('-o', '--output-dir', default='.',
+                        help='Directory for lexer.l and parser.y (default: current directory)')
+    parser.add_argument('--no-tokens', action='store_true',
+                        help='Skip generating *_tokens.txt example files')
+    parser.add_argument('--reentrant', action='store_true',
+                        help='Generate a reentrant scanner and pure parser with the '
+                             'analyzer.h library API (for libanalyzer.so)')
+    parser.add_argument('--tables', choices=sorted(TABLE_MODES),
+                        help='Flex table representation (overrides %%tables)')
+    parser.add_argument('--flex-option', action='append', default=[], metavar='NAME',
+                        help='Extra Flex %%option, e.g. never-interactive or 8bit (repeatable)')
+    parser.add_argument('--buffer-size', type=int, metavar='BYTES',
+                        help='Scanner input buffer size, YY_BUF_SIZE (overrides %%bufsize)')
+    parser.add_argument('--harvest', action='append', default=[], metavar='PATTERN',
+                        help='Sample tokens from these files or globs instead of the '
+                             'analyzer\'s input file (repeatable)')
+    parser.add_argument('-j', '--jobs', type=int, default=0,
+                        help='Worker processes for --harvest (default: number of cores)')
+    parser.add_argument('--stack-limit', type=int, metavar='ENTRIES',
+                        help=f'Parser stack limit, YYMAXDEPTH (overrides %%stack; '
+                             f'bison default: {BISON_MAXDEPTH})')
+    parser.add_argument('--report', action='store_true',
+                        help='Print the grammar analysis report (FIRST/FOLLOW, recursion, '
+                             'conflicts, stack and tree depth)')
+    parser.add_argument('--strict', action='store_true',
+                        help='Fail if the grammar analysis finds problems')
+    parser.add_argument('--report-tables', metavar='BINARY',
+                        help='Print the size of the scanner tables linked into BINARY and exit')
+
+    args = parser.parse_args()
+
+    if args.report_tables:
+        tables = report_scanner_tables(args.report_tables)
+        if not tables:
+            print(f'No Flex tables found in {args.report_tables}')
+            return
+        for name, size in sorted(tables.items(), key=lambda item: -item[1]):
+            print(f'  {name:<24} {size:>10,} bytes')
+        print(f'Scanner tables: {sum(tables.values()):,} bytes')
+        return
+    if not args.def_file:
+        parser.error('a .def file is required')
+
+    def_file = args.def_file
+    output_dir = Path(args.output_dir)
+    output_dir.mkdir(parents=True, exist_ok=True)
     
     print(f'Parsing {def_file}...')
-    lex_rules, grammar_rules = parse_def_file(def_file)
+    lex_rules, grammar_rules, options = parse_def_file(def_file)
+    if args.tables:
+        options.tables = args.tables
+    options.scanner_options.extend(args.flex_option)
+    if args.buffer_size:
+        options.buffer_size = args.buffer_size
+    if args.stack_limit:
+        options.stack_limit = args.stack_limit
     
     print(f'Found {len(lex_rules)} lexer rules and {len(grammar_rules)} grammar rules')
+    node_types = collect_node_types(lex_rules, grammar_rules)
+
+    # Problems bison would report late (or not at all) and stack overflows
+    import grammar_report
+    report = grammar_report.analyze(lex_rules, grammar_rules, options)
+    if args.report:
+        print(report.text())
+    else:
+        for warning in report.warnings():
+            print(f'Warning: {warning}')
+    if args.strict and report.warnings():
+        print(f'Error: {def_file} has grammar problems (--strict)')
+        sys.exit(1)
     
-    print('Generating lexer.l...')
-    generate_lexer(lex_rules, 'lexer.l')
+    print(f'Generating {output_dir / "lexer.l"}...')
+    generate_lexer(lex_rules, str(output_dir / 'lexer.l'), node_types, args.reentrant, options)
     
-    print('Generating parser.y...')
-    generate_parser(lex_rules, grammar_rules, 'parser.y')
+    print(f'Generating {output_dir / "parser.y"}...')
+    generate_parser(lex_rules, grammar_rules, str(output_dir / 'parser.y'), node_types, options,
+                    args.reentrant)
     
-    print('Generating token example files...')
-    generate_token_files(lex_rules, def_file)
+    if not args.no_tokens:
+        print('Generating token example files...')
+        if args.harvest:
+            import token_harvest
+            token_harvest.harvest_token_files(lex_rules, def_file, args.harvest, args.jobs)
+        else:
+            generate_token_files(lex_rules, def_file)
     
     print('Generation complete!')
 
@@ -0,0 +1,571 @@
+#!/usr/bin/env python3
+"""
+grammar_report.py
+-----------------
+Static analysis of a ``.def`` grammar before it is handed to bison.
+
+`generator.generate_parser` copies the productions into ``parser.y`` as they
+are, and bison's conflict warnings then refer to a generated file. Worse,
+nothing warns about grammars that parse the samples fine but fail on large
+inputs. A right-recursive list (``list -> item list``) keeps every item on
+the parser stack until the last one is read. Once the stack reaches
+``YYMAXDEPTH`` entries (10,000 by default) the parse stops with "memory
+exhausted". This module checks the grammar up front:
+
+- FIRST and FOLLOW sets, nullable nonterminals
+- symbols that are neither tokens nor nonterminals, nonterminals that cannot
+  be reached from the start symbol or derive no finite input
+- recursive rules, classified as left (the recursive symbol comes first),
+  right (it comes last) or nested (in between)
+- LALR(1) conflicts (from `lalr.build_tables`), located by the shortest
+  symbol sequence leading to the conflicting state
+- worst-case parser stack and tree depth per nonterminal, either a constant
+  or "grows" when it depends on the input. Only left recursion keeps the
+  stack bounded; every recursion through a rule that builds a node deepens
+  the tree.
+
+``generator.py`` prints the problems as warnings on every run, the full
+report with ``--report``, and fails with ``--strict``. The stack limit is set
+with ``%stack N`` or ``--stack-limit N``.
+
+Important functions:
+- `analyze(lex_rules, grammar_rules, options)` - a `GrammarReport`
+- `GrammarReport.warnings()` - one line per problem
+- `GrammarReport.text()` - the full report
+"""
+
+import sys
+from typing import Dict, FrozenSet, Iterable, List, Optional, Sequence, Set, Tuple
+
+import generator
+import lalr
+
+# value(lhs) = max(base, offset + value(symbol) for each term); see _longest
+DepthRule = Tuple[str, int, List[Tuple[int, str]]]
+
+
+class Recursion:
+    def __init__(self, rule: int, position: int, kind: str, stack_growth: int, tree_growth: int):
+        self.rule = rule
+        self.position = position
+        self.kind = kind
+        self.stack_growth = stack_growth
+        self.tree_growth = tree_growth
+
+    # ``Recursion`` is one recursive occurrence: the symbol at ``position``
+    # (0-based) of rule ``rule`` derives the rule's own left-hand side again.
+    # ``kind`` is ``'left'``, ``'right'`` or ``'nested'``. Every repetition
+    # leaves ``stack_growth`` more entries on the parser stack (the symbols
+    # before the occurrence) and ``tree_growth`` more levels in the tree (1
+    # when the rule builds a node over that symbol).
+
+
+class GrammarReport:
+    def __init__(self, tokens: List[str], stack_limit: int):
+        self.tokens = tokens
+        self.stack_limit = stack_limit
+        self.productions: List[Tuple[str, Tuple[str, ...]]] = []
+        self.nonterminals: List[str] = []
+        self.records: List[str] = []
+        self.errors: List[str] = []
+        self.first: Dict[str, Set[str]] = {}
+        self.follow: Dict[str, FrozenSet[str]] = {}
+        self.nullable: Set[str] = set()
+        self.unreachable: List[str] = []
+        self.unproductive: List[str] = []
+        self.recursions: List[Recursion] = []
+        self.stack_depth: Dict[str, Optional[int]] = {}
+        self.tree_depth: Dict[str, Optional[int]] = {}
+        self.tables: Optional[lalr.LalrTables] = None
+        self.state_paths: Dict[int, List[str]] = {}
+
+    # ``GrammarReport`` holds the results of `analyze`. ``productions`` are
+    # numbered as in bison (0 is ``$accept -> start``) and ``nonterminals``
+    # excludes ``$accept``; ``records`` are the ``%record`` nonterminals.
+    # ``errors`` are problems bison rejects outright; when there are any, the
+    # tables are not built. Depths are ``None`` when they grow with the
+    # input: ``stack_depth`` counts parser stack entries while a nonterminal
+    # is parsed, ``tree_depth`` the levels of the tree it yields (0 for
+    # NULL). ``state_paths`` maps every conflicting state to the shortest
+    # symbol sequence reaching it.
+
+    def rule_text(self, rule: int) -> str:
+        lhs, rhs = self.productions[rule]
+        return f'{lhs} -> {" ".join(rhs)}' if rhs else f'{lhs} -> /* empty */'
+
+    def parser_stack(self) -> Optional[int]:
+        """Worst-case stack entries of a whole parse (including state 0)."""
+
+        depth = self.stack_depth.get(lalr.ACCEPT)
+        return None if depth is None else depth + 1
+
+    def warnings(self) -> List[str]:
+        problems = list(self.errors)
+        problems += [f'nonterminal {name} derives no finite input' for name in self.unproductive]
+        problems += [f'nonterminal {name} is unreachable from {self.productions[0][1][0]}'
+                     for name in self.unreachable]
+        for conflict in self.tables.conflicts if self.tables else ():
+            problems.append(self._conflict_text(conflict))
+        for recursion in self.recursions:
+            # Nested recursion grows with the nesting depth only; repetitions
+            # that keep entries grow with the input
+            if recursion.kind == 'nested' or not recursion.stack_growth:
+                continue
+            entries = 'entry' if recursion.stack_growth == 1 else 'entries'
+            advice = ('use left recursion' if recursion.kind == 'right'
+                      else 'drop the nullable symbols before the recursion')
+            problems.append(
+                f'rule {recursion.rule} ({self.rule_text(recursion.rule)}) is {recursion.kind}-recursive '
+                f'but keeps {recursion.stack_growth} parser stack {entries} per repetition, so about '
+                f'{self.stack_limit // recursion.stack_growth:,} repetitions exceed the stack limit '
+                f'of {self.stack_limit:,}; {advice} or raise %stack')
+        return problems
+
+    def _conflict_text(self, conflict: lalr.Conflict) -> str:
+        path = self.state_paths.get(conflict.state, [])
+        where = f'after "{" ".join(path)}"' if path else 'at the start'
+        if conflict.kind == 'shift/reduce':
+            outcome = f'rule {conflict.rejected} ({self.rule_text(conflict.rejected)}) is not reduced'
+        else:
+            outcome = (f'rule {conflict.chosen} ({self.rule_text(conflict.chosen)}) is reduced '
+                       f'instead of rule {conflict.rejected} ({self.rule_text(conflict.rejected)})')
+        return f'{conflict.kind} conflict {where} on {conflict.symbol}: {outcome}'
+
+    def text(self) -> str:
+        lines = []
+        summary = (f'{len(self.tokens)} tokens, {len(self.nonterminals)} nonterminals, '
+                   f'{max(len(self.productions) - 1, 0)} rules')
+        if self.tables:
+            summary += f', {len(self.tables.action)} LALR(1) states'
+        lines += ['Grammar report: ' + summary, '']
+
+        lines.append('Rules')
+        width = len(str(len(self.productions)))
+        for rule in range(1, len(self.productions)):
+            lines.append(f'  {rule:>{width}}  {self.rule_text(rule)}')
+        lines.append('')
+
+        def depth(value):
+            return 'grows' if value is None else str(value)
+
+        if self.stack_depth:
+            name_width = max(len(name) for name in self.nonterminals + ['Nonterminal'])
+            lines.append(f'  {"Nonterminal":<{name_width}}  nullable  {"stack":>5}  {"tree":>5}')
+            for name in self.nonterminals:
+                lines.append(f'  {name:<{name_width}}  {"yes" if name in self.nullable else "no":<8}  '
+                             f'{depth(self.stack_depth[name]):>5}  {depth(self.tree_depth[name]):>5}')
+            lines.append('')
+
+            lines.append('FIRST and FOLLOW')
+            for name in self.nonterminals:
+                lines.append(f'  {name}')
+                lines.append(f'    FIRST   {" ".join(sorted(self.first[name])) or "-"}')
+                lines.append(f'    FOLLOW  {" ".join(sorted(self.follow[name])) or "-"}')
+            lines.append('')
+
+        if self.recursions:
+            lines.append('Recursion')
+            for recursion in self.recursions:
+                unit = 'level' if recursion.kind == 'nested' else 'repetition'
+                stack = (f'stack +{recursion.stack_growth} per {unit}'
+                         if recursion.stack_growth else 'stack bounded')
+                tree = (f'tree +{recursion.tree_growth} per {unit}'
+                        if recursion.tree_growth else 'tree bounded')
+                lines.append(f'  rule {recursion.rule:>{width}}  {recursion.kind:<6}  {stack}, {tree}  '
+                             f'({self.rule_text(recursion.rule)})')
+            lines.append('')
+
+        if self.stack_depth:
+            limit = f'limit {self.stack_limit:,}'
+            if self.stack_limit == generator.BISON_MAXDEPTH:
+                limit += ', the bison default'
+            stack = self.parser_stack()
+            stack = 'grows with the input' if stack is None else f'{stack} entries'
+            lines.append(f'Worst-case parser stack: {stack} ({limit})')
+            if self.records:
+                # Only the record trees are ever built
+                depths = [self.tree_depth[name] for name in self.records]
+                tree = None if None in depths else max(depths)
+                lines.append(f'Worst-case tree depth (per record): {depth(tree)}')
+            else:
+                tree = self.tree_depth[self.productions[0][1][0]]
+                lines.append(f'Worst-case tree depth: {depth(tree)}')
+            if tree is None:
+                lines.append('  (text output indents every level, so its size grows with the '
+                             'square of the depth)')
+            lines.append('')
+
+        if self.tables:
+            lines.append(f'Conflicts: {len(self.tables.conflicts)}')
+            for conflict in self.tables.conflicts:
+                lines.append(f'  state {conflict.state}: {self._conflict_text(conflict)}')
+            lines.append('')
+
+        problems = self.warnings()
+        lines.append(f'Problems: {len(problems)}')
+        lines += [f'  - {problem}' for problem in problems]
+        return '\n'.join(lines)
+
+
+def follow_sets(productions: Sequence[Tuple[str, Sequence[str]]], first: Dict[str, Set[str]],
+                nullable: Set[str]) -> Dict[str, FrozenSet[str]]:
+    """FOLLOW set of every nonterminal; production 0 must be the ``$accept`` rule.
+
+    The sets are computed as bitsets, one bit per terminal, and nonterminals
+    with equal FOLLOW sets share one frozenset: in a large grammar many
+    nonterminals are followed by the same thousands of tokens.
+    """
+
+    bit: Dict[str, int] = {}
+
+    def bits(symbols: Iterable[str]) -> int:
+        mask = 0
+        for symbol in symbols:
+            if symbol not in bit:
+                bit[symbol] = 1 << len(bit)
+            mask |= bit[symbol]
+        return mask
+
+    first_bits = {name: bits(symbols) for name, symbols in first.items()}
+    follow = {lhs: 0 for lhs, _ in productions}
+    follow[productions[0][0]] = bits([lalr.END])
+    # FIRST of what comes after each occurrence goes in directly; where that
+    # can be empty, FOLLOW of the left-hand side is passed on below
+    inherits: Dict[str, List[str]] = {lhs: [] for lhs in follow}
+    for lhs, rhs in productions:
+        found = 0
+        transparent = True
+        for symbol in reversed(rhs):
+            if symbol in follow:
+                follow[symbol] |= found
+                if transparent and symbol != lhs:
+                    inherits[lhs].append(symbol)
+            if symbol in first:
+                found = found | first_bits[symbol] if symbol in nullable else first_bits[symbol]
+                transparent = transparent and symbol in nullable
+            else:
+                found = bits([symbol])
+                transparent = False
+
+    work = list(follow)
+    while work:
+        lhs = work.pop()
+        for symbol in inherits[lhs]:
+            if follow[lhs] | follow[symbol] != follow[symbol]:
+                follow[symbol] |= follow[lhs]
+                work.append(symbol)
+
+    shared: Dict[int, FrozenSet[str]] = {}
+    for mask in follow.values():
+        if mask not in shared:
+            shared[mask] = frozenset(symbol for symbol, flag in bit.items() if mask & flag)
+    return {name: shared[mask] for name, mask in follow.items()}
+
+
+def _components(edges: Dict[str, Iterable[str]]) -> Dict[str, int]:
+    """Strongly connected component of each node (Tarjan's algorithm).
+
+    Components are numbered in reverse topological order: every edge leads
+    to a component with the same or a smaller number. Two nodes reach each
+    other exactly when they share a component, so a node is on a cycle
+    through ``target`` if it has an edge to ``target`` in its own component.
+    """
+
+    index: Dict[str, int] = {}
+    low: Dict[str, int] = {}
+    component: Dict[str, int] = {}
+    stack: List[str] = []
+    count = 0
+    for root in edges:
+        if root in index:
+            continue
+        index[root] = low[root] = len(index)
+        stack.append(root)
+        work = [(root, iter(edges[root]))]
+        while work:
+            node, targets = work[-1]
+            for target in targets:
+                if target not in edges:
+                    continue
+                if target not in index:
+                    index[target] = low[target] = len(index)
+                    stack.append(target)
+                    work.append((target, iter(edges[target])))
+                    break
+                if target not in component:
+                    low[node] = min(low[node], index[target])
+            else:
+                work.pop()
+                if work:
+                    parent = work[-1][0]
+                    low[parent] = min(low[parent], low[node])
+                if low[node] == index[node]:
+                    while True:
+                        member = stack.pop()
+                        component[member] = count
+                        if member == node:
+                            break
+                    count += 1
+    return component
+
+
+def _reachable(edges: Dict[str, Iterable[str]], start: str) -> Set[str]:
+    """Nodes reachable from ``start`` in one or more steps."""
+
+    seen = set()
+    stack = list(edges[start])
+    while stack:
+        node = stack.pop()
+        if node not in seen:
+            seen.add(node)
+            stack.extend(edges.get(node, ()))
+    return seen
+
+
+def _longest(rules: List[DepthRule], nonterminals: Iterable[str]) -> Dict[str, Optional[int]]:
+    """Solve ``value(lhs) = max(base, offset + value(symbol))`` over ``rules``.
+
+    Symbols that are not nonterminals are worth 1. A nonterminal on (or
+    leading to) a cycle with a positive offset grows without bound and gets
+    ``None``; zero-offset cycles (left recursion) leave values finite.
+
+    Nonterminals on a zero-offset cycle all have the same value, so each
+    strongly connected component is solved once, after the components it
+    leads to.
+    """
+
+    edges = {name: [] for name in nonterminals}
+    for lhs, _, terms in rules:
+        edges[lhs] += [symbol for _, symbol in terms if symbol in edges]
+    component = _components(edges)
+    grouped: List[List[DepthRule]] = [[] for _ in range(max(component.values(), default=-1) + 1)]
+    for rule in rules:
+        grouped[component[rule[0]]].append(rule)
+
+    values: List[Optional[int]] = []
+    for number, group in enumerate(grouped):
+        value: Optional[int] = 0
+        for lhs, base, terms in group:
+            value = max(value, base)
+            for offset, symbol in terms:
+                if symbol not in component:
+                    value = max(value, offset + 1)
+                elif component[symbol] != number:
+                    inner = values[component[symbol]]
+                    if inner is None:
+                        break
+                    value = max(value, offset + inner)
+                elif offset > 0:
+                    break
+            else:
+                continue
+            value = None
+            break
+        values.append(value)
+    return {name: values[component[name]] for name in edges}
+
+
+def _collapsed(productions, shapes, records: Set[str]) -> Set[str]:
+    """Nonterminals whose value is always NULL in a streaming parser.
+
+    With ``%record``, record subtrees are emitted and replaced by NULL, and a
+    node whose children are all NULL collapses to NULL (``ast_collapse_empty``),
+    so the list rules above the records build nothing.
+    """
+
+    if not records:
+        return set()
+    collapsed = {lhs for lhs, _ in productions[1:]} - records
+    # Rules to check again once a nonterminal they keep turns out non-NULL
+    users: Dict[str, List[int]] = {}
+    for index, ((_, rhs), (_, refs)) in enumerate(zip(productions, shapes)):
+        for ref in refs:
+            users.setdefault(rhs[ref], []).append(index)
+
+    work = list(range(len(productions)))
+    while work:
+        index = work.pop()
+        (lhs, rhs), (creates, refs) = productions[index], shapes[index]
+        if lhs not in collapsed:
+            continue
+        null = all(rhs[ref] in records or rhs[ref] in collapsed for ref in refs)
+        if not null or (creates and not refs):
+            collapsed.discard(lhs)
+            work += users.get(lhs, ())
+    return collapsed
+
+
+def _state_paths(tables: lalr.LalrTables, states: Iterable[int]) -> Dict[int, List[str]]:
+    """Shortest symbol sequence from the start state to each of ``states``."""
+
+    wanted = set(states)
+    # state -> (previous state, symbol) on a shortest path
+    parents: Dict[int, Optional[Tuple[int, str]]] = {0: None}
+    queue = [0]
+    for state in queue:
+        if wanted <= parents.keys():
+            break
+        moves = [(symbol, target) for symbol, target in tables.action[state].items() if target >= 0]
+        moves += list(tables.goto[state].items())
+        for symbol, target in moves:
+            if target not in parents:
+                parents[target] = (state, symbol)
+                queue.append(target)
+
+    paths = {}
+    for state in wanted:
+        if state not in parents:
+            continue
+        path = []
+        step = parents[state]
+        while step is not None:
+            path.append(step[1])
+            step = parents[step[0]]
+        paths[state] = path[::-1]
+    return paths
+
+
+def analyze(lex_rules: List[generator.LexRule], grammar_rules: List[generator.GrammarRule],
+            options: Optional[generator.DefOptions] = None) -> GrammarReport:
+    """Analyze a parsed ``.def`` grammar; see the module docstring."""
+
+    options = options or generator.DefOptions()
+    tokens = list(dict.fromkeys(rule.token_name for rule in lex_rules
+                                if rule.token_name != 'WHITESPACE'))
+    report = GrammarReport(tokens, options.stack_limit or generator.BISON_MAXDEPTH)
+    if not grammar_rules:
+        report.errors.append(f'the {generator.YACC_MARKER} section has no rules')
+        return report
+
+    productions = report.productions = lalr.grammar_productions(grammar_rules)
+    names = list(dict.fromkeys(lhs for lhs, _ in productions))
+    report.nonterminals = names[1:]
+    defined = set(tokens) | set(names)
+    undefined = dict.fromkeys(symbol for _, rhs in productions for symbol in rhs if symbol not in defined)
+    report.errors += [f'symbol {symbol} is used, but is not defined as a token and has no rules'
+                      for symbol in undefined]
+
+    first, nullable = lalr.first_sets(productions, names)
+    report.first, report.nullable = first, nullable
+    report.follow = follow_sets(productions, first, nullable)
+
+    # A rule is productive once all the nonterminals in it are; count down
+    # the ones still missing
+    missing = [sum(symbol in first for symbol in rhs) for _, rhs in productions]
+    occurrences: Dict[str, List[int]] = {}
+    for index, (_, rhs) in enumerate(productions):
+        for symbol in rhs:
+            if symbol in first:
+                occurrences.setdefault(symbol, []).append(index)
+    productive = set()
+    work = [index for index, count in enumerate(missing) if not count]
+    while work:
+        lhs = productions[work.pop()][0]
+        if lhs in productive:
+            continue
+        productive.add(lhs)
+        for index in occurrences.get(lhs, ()):
+            missing[index] -= 1
+            if not missing[index]:
+                work.append(index)
+    report.unproductive = [name for name in report.nonterminals if name not in productive]
+
+    uses = {name: [] for name in names}
+    for lhs, rhs in productions:
+        uses[lhs] += [symbol for symbol in rhs if symbol in uses]
+    component = _components(uses)
+    reached = _reachable(uses, lalr.ACCEPT)
+    report.unreachable = [name for name in report.nonterminals if name not in reached]
+
+    # Stack: while the symbol at ``position`` is parsed, the ones before it
+    # stay on the stack. Tree: a rule building a node adds one level above
+    # the children it keeps; records and collapsed lists leave NULL behind.
+    report.records = [name for name in dict.fromkeys(options.records) if name in uses]
+    records = set(report.records)
+    shapes = [(False, [0])] + [
+        lalr.action_shape(rule.action, len(rule.rhs.split())) if rule.action
+        else (False, [0] if rule.rhs.split() else [])
+        for rule in grammar_rules
+    ]
+    collapsed = _collapsed(productions, shapes, records)
+    stack_rules: List[DepthRule] = []
+    tree_rules: List[DepthRule] = []
+    for (lhs, rhs), (creates, refs) in zip(productions, shapes):
+        if not all(symbol in productive or symbol not in first for symbol in rhs):
+            continue
+        stack_rules.append((lhs, 1, list(enumerate(rhs))))
+        if lhs in collapsed:
+            continue
+        level = 1 if creates else 0
+        kept = [rhs[ref] for ref in refs if rhs[ref] not in records and rhs[ref] not in collapsed]
+        tree_rules.append((lhs, level, [(level, symbol) for symbol in kept]))
+    report.stack_depth = _longest(stack_rules, names)
+    report.tree_depth = _longest(tree_rules, names)
+
+    # Left (right) recursion comes back to the rule only through symbols with
+    # a nullable prefix (suffix); anything else is bracketed by other input
+    # and grows with the nesting depth rather than with the number of items
+    def nullable_around(rhs):
+        """Per position: can everything before it, and after it, derive empty?"""
+        before = [True] * len(rhs)
+        after = [True] * len(rhs)
+        for position in range(1, len(rhs)):
+            before[position] = before[position - 1] and rhs[position - 1] in nullable
+        for position in range(len(rhs) - 2, -1, -1):
+            after[position] = after[position + 1] and rhs[position + 1] in nullable
+        return before, after
+
+    around = [nullable_around(rhs) for _, rhs in productions]
+    leftmost = {name: [] for name in names}
+    rightmost = {name: [] for name in names}
+    for (lhs, rhs), (before, after) in zip(productions, around):
+        for position, symbol in enumerate(rhs):
+            if symbol in uses and before[position]:
+                leftmost[lhs].append(symbol)
+            if symbol in uses and after[position]:
+                rightmost[lhs].append(symbol)
+    left_component = _components(leftmost)
+    right_component = _components(rightmost)
+
+    for rule, ((lhs, rhs), (creates, refs)) in enumerate(zip(productions, shapes)):
+        before, after = around[rule]
+        for position, symbol in enumerate(rhs):
+            if symbol not in uses or component[symbol] != component[lhs]:
+                continue
+            if before[position] and left_component[symbol] == left_component[lhs]:
+                kind = 'left'
+            elif after[position] and right_component[symbol] == right_component[lhs]:
+                kind = 'right'
+            else:
+                kind = 'nested'
+            builds = (creates and position in refs and lhs not in collapsed
+                      and symbol not in records and symbol not in collapsed)
+            report.recursions.append(Recursion(rule, position, kind, position, 1 if builds else 0))
+
+    if not undefined:
+        report.tables = lalr.build_tables(tokens, grammar_rules)
+        report.state_paths = _state_paths(report.tables,
+                                          (conflict.state for conflict in report.tables.conflicts))
+    return report
+
+
+def main():
+    import argparse
+
+    parser = argparse.ArgumentParser(description='Static analysis report for a .def grammar')
+    parser.add_argument('def_file', help='Analyzer .def file')
+    parser.add_argument('--stack-limit', type=int, metavar='ENTRIES',
+                        help='Parser stack limit to check against (overrides %%stack)')
+
+    args = parser.parse_args()
+
+    lex_rules, grammar_rules, options = generator.parse_def_file(args.def_file)
+    if args.stack_limit:
+        options.stack_limit = args.stack_limit
+    report = analyze(lex_rules, grammar_rules, options)
+    print(report.text())
+    return 1 if report.warnings() else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
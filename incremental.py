@@ -0,0 +1,180 @@
+#!/usr/bin/env python3
+"""
+incremental.py
+--------------
+Re-parse only the edited records of a record-oriented document.
+
+Analyzers with ``%record`` print a forest: one tree per record (see Streaming
+Records in the README). When such a document is edited, most records are
+unchanged, so this module parses it record by record and remembers each
+record's trees:
+
+- the document is split into records at line ends, as `shard_parse` does
+  for line-oriented analyzers, so every line must parse on its own
+- a cache maps a hash of each record's bytes to the trees a resident
+  ``custom_compiler --server`` (`compiler_client.CompilerServer`) produced
+  for it
+- an update compares the new records with the previous ones. Only the
+  differing middle is hashed and looked up, and only records never seen
+  before go to the server; the unchanged prefix and suffix are not touched
+- the middle's trees are spliced into the displayed `TreeModel` in place
+  with `TreeModel.splice`
+
+Editing one line of a large pasted log therefore costs one server round
+trip plus a splice, whatever the size of the document.
+
+Important functions:
+- `split_records(data)` - the line records of a document
+- `is_record_grammar(def_text)` - whether an analyzer streams records
+- `IncrementalParser(binary).update(data)` - the document's `TreeModel`
+"""
+
+import hashlib
+import re
+import sys
+import time
+from collections import OrderedDict
+from typing import List, Optional, Tuple
+
+import generator
+import tree_binary
+from compiler_client import CompilerServer
+from tree_model import TreeModel
+
+# Distinct records whose trees are kept (least recently used go first)
+RECORD_CACHE_ENTRIES = 200000
+
+_RECORD = re.compile(rb'[^\n]*\n|[^\n]+')
+
+
+def split_records(data: bytes) -> List[bytes]:
+    """Split ``data`` into lines, each keeping its newline."""
+
+    return _RECORD.findall(data)
+
+
+def record_key(record: bytes) -> bytes:
+    return hashlib.blake2b(record, digest_size=16).digest()
+
+
+def is_record_grammar(def_text: str) -> bool:
+    """True if the analyzer declares a ``%record`` nonterminal."""
+
+    _, grammar_rules, options = generator.parse_def_text(def_text)
+    return bool(set(options.records) & {rule.lhs for rule in grammar_rules})
+
+
+class IncrementalParser:
+    """A document kept parsed across edits, one cached record at a time.
+
+    ``binary`` must be built from a ``%record`` analyzer. `update` returns the
+    same `TreeModel` object every time, modified in place.
+    """
+
+    def __init__(self, binary: str = './custom_compiler', cache_entries: int = RECORD_CACHE_ENTRIES):
+        self.server = CompilerServer(binary, 'binary')
+        self.cache_entries = cache_entries
+        # record key -> (status, trees or error message, node count)
+        self.cache: 'OrderedDict[bytes, Tuple[int, bytes, int]]' = OrderedDict()
+        self.model = TreeModel()
+        self.records: List[bytes] = []
+        self.sizes: List[int] = []
+        self.errors: List[Optional[str]] = []
+        self.parsed = 0
+
+    def _record(self, key: bytes, record: bytes) -> Tuple[int, bytes, int]:
+        result = self.cache.get(key)
+        if result is not None:
+            self.cache.move_to_end(key)
+            return result
+
+        status, payload = self.server.parse(record)
+        size = sum(len(tree) for tree in tree_binary.iter_trees(payload)) if status == 0 else 0
+        result = self.cache[key] = (status, payload, size)
+        self.parsed += 1
+        while len(self.cache) > self.cache_entries:
+            self.cache.popitem(last=False)
+        return result
+
+    def update(self, data: bytes) -> TreeModel:
+        """Bring the model up to date with ``data``, the whole edited document.
+
+        ``parsed`` tells how many records had to be sent to the compiler.
+        """
+
+        records = split_records(data)
+        old = self.records
+        limit = min(len(old), len(records))
+        prefix = 0
+        while prefix < limit and old[prefix] == records[prefix]:
+            prefix += 1
+        suffix = 0
+        while suffix < limit - prefix and old[-1 - suffix] == records[-1 - suffix]:
+            suffix += 1
+
+        self.parsed = 0
+        results = [self._record(record_key(record), record)
+                   for record in records[prefix:len(records) - suffix]]
+        middle = TreeModel.from_binary(b''.join(payload for status, payload, _ in results if status == 0))
+
+        start = sum(self.sizes[:prefix])
+        stop = start + sum(self.sizes[prefix:len(old) - suffix])
+        self.model.splice(start, stop, middle)
+        self.sizes[prefix:len(old) - suffix] = [size for _, _, size in results]
+        self.errors[prefix:len(old) - suffix] = [
+            None if status == 0 else payload.decode('utf-8', 'replace').strip()
+            for status, payload, _ in results
+        ]
+        self.records = records
+        return self.model
+
+    def messages(self) -> List[str]:
+        """Errors of the records that did not parse, by line number."""
+
+        return [f'line {line}: {error}' for line, error in enumerate(self.errors, 1) if error]
+
+    def close(self):
+        self.server.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+
+def main():
+    import argparse
+
+    parser = argparse.ArgumentParser(description='Parse a record-oriented input, then re-parse edits')
+    parser.add_argument('binary', help='custom_compiler built from a %%record analyzer')
+    parser.add_argument('input', help='Input document')
+    parser.add_argument('--edit', action='append', default=[], metavar='LINE:TEXT',
+                        help='Replace line LINE (1-based) with TEXT and update (repeatable)')
+
+    args = parser.parse_args()
+
+    with open(args.input, 'rb') as f:
+        data = f.read()
+    with IncrementalParser(args.binary) as document:
+        started = time.perf_counter()
+        model = document.update(data)
+        print(f'parsed {document.parsed} record(s), {len(model)} nodes '
+              f'in {time.perf_counter() - started:.3f}s')
+
+        lines = split_records(data)
+        for edit in args.edit:
+            line, _, text = edit.partition(':')
+            lines[int(line) - 1] = text.encode('utf-8') + b'\n'
+            started = time.perf_counter()
+            model = document.update(b''.join(lines))
+            print(f'edit line {line}: parsed {document.parsed} record(s), {len(model)} nodes '
+                  f'in {time.perf_counter() - started:.3f}s')
+
+        for message in document.messages():
+            print(message, file=sys.stderr)
+    return 1 if document.messages() else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,661 @@
+#!/usr/bin/env python3
+"""
+lalr.py
+-------
+Pure-Python LALR(1) engine for previewing ``.def`` analyzers without a build.
+
+A native analyzer goes through generator.py, flex, bison and gcc before it
+can parse anything. This module builds the LALR(1) tables straight from the
+parsed `LexRule` / `GrammarRule` lists, tokenizes with
+`generator.TokenScanner` and runs the grammar actions itself. The tree is
+the one ``custom_compiler`` prints for the same input:
+
+- conflicts are resolved as bison does without precedence declarations:
+  shift/reduce in favour of the shift, reduce/reduce in favour of the
+  earlier rule
+- the supported actions are the ones the generator itself understands:
+  ``$$ = create_node("label", N, $1, ...)``, ``$$ = create_leaf_node("label",
+  "value")``, ``$$ = $k`` and ``$$ = NULL``; a rule without an action
+  passes ``$1`` up
+- the root is the value of the first grammar rule, and ``%record`` and
+  ``%novalue`` behave as in the generated parser
+
+Tables depend only on the token names and the productions, so they are kept
+in an in-memory cache keyed by a hash of those. Editing an action or a lexer
+pattern, or reopening an analyzer, reuses them; a preview then costs one
+pass over the input.
+
+Important functions:
+- `build_tables(tokens, productions)` - LALR(1) tables, cached by `grammar_hash`
+- `Parser(lex_rules, grammar_rules, options).parse(text)` - a `ParseResult`
+- `load_parser(def_file)` / `parser_from_text(content)` - parser for a ``.def``
+"""
+
+import gc
+import hashlib
+import json
+import re
+import sys
+from collections import OrderedDict
+from typing import Callable, Dict, FrozenSet, Iterator, List, Mapping, Optional, Sequence, Tuple
+
+import generator
+from tree_model import TREE_MARKER, TreeModel
+
+END = '$end'
+ACCEPT = '$accept'
+
+# Tables kept in memory, least recently used first
+TABLE_CACHE_ENTRIES = 32
+
+# Reduce-only states with at least this many lookaheads get a `ReduceRow`;
+# smaller rows stay dicts, which are faster to look up
+SHARED_ROW_LOOKAHEADS = 64
+
+# A node is (type name, value or None, children); children may hold None,
+# which is skipped like a NULL child in ast.c
+Node = Tuple[str, Optional[str], tuple]
+
+
+class GrammarError(ValueError):
+    """Raised for a grammar bison would reject (or actions we cannot run)."""
+
+
+class Conflict:
+    def __init__(self, state: int, symbol: str, kind: str, chosen: int, rejected: int):
+        self.state = state
+        self.symbol = symbol
+        self.kind = kind
+        self.chosen = chosen
+        self.rejected = rejected
+
+    # ``Conflict`` records one LALR(1) conflict resolved by default: ``kind``
+    # is ``'shift/reduce'`` or ``'reduce/reduce'``, ``symbol`` the lookahead
+    # terminal, and ``chosen`` / ``rejected`` production numbers (``-1`` for
+    # the shift). Production numbers count the ``%%YACC`` rules from 1, as
+    # in bison's reports.
+
+
+class LalrTables:
+    def __init__(self, productions: List[Tuple[str, Tuple[str, ...]]], action: List[Mapping[str, int]],
+                 goto: List[Dict[str, int]], conflicts: List[Conflict]):
+        self.productions = productions
+        self.action = action
+        self.goto = goto
+        self.conflicts = conflicts
+
+    # ``LalrTables`` holds the parse tables of one grammar. ``productions[0]``
+    # is ``$accept -> start``. ``action[state][terminal]`` is a state to shift
+    # to when ``>= 0`` and production ``-value - 1`` to reduce by otherwise;
+    # reducing production 0 accepts. ``goto[state][nonterminal]`` is the state
+    # entered after a reduction. Rows of states that only reduce are
+    # `ReduceRow` objects rather than dicts.
+
+
+class ReduceRow(Mapping):
+    """Action row of a state whose only action is one reduction.
+
+    Most states of a large grammar are like this, and their lookahead sets
+    repeat, so the set is shared instead of being copied into every row.
+    """
+
+    def __init__(self, lookaheads: FrozenSet[str], value: int):
+        self.lookaheads = lookaheads
+        self.value = value
+
+    def __getitem__(self, symbol: str) -> int:
+        if symbol in self.lookaheads:
+            return self.value
+        raise KeyError(symbol)
+
+    def get(self, symbol: str, default: Optional[int] = None) -> Optional[int]:
+        return self.value if symbol in self.lookaheads else default
+
+    def __iter__(self) -> Iterator[str]:
+        return iter(self.lookaheads)
+
+    def __len__(self) -> int:
+        return len(self.lookaheads)
+
+
+def grammar_hash(tokens: Sequence[str], productions: Sequence[Tuple[str, Sequence[str]]]) -> str:
+    """Hash of everything the tables depend on."""
+
+    canonical = json.dumps([list(tokens), [[lhs, list(rhs)] for lhs, rhs in productions]])
+    return hashlib.sha256(canonical.encode('utf-8')).hexdigest()
+
+
+def first_sets(productions, nonterminals) -> Tuple[Dict[str, set], set]:
+    """FIRST set of every nonterminal and the set of nullable nonterminals."""
+
+    nullable = set()
+    first = {name: set() for name in nonterminals}
+    # Productions to revisit when a nonterminal's FIRST set or nullability
+    # changes, so long chains of nonterminals take one pass, not one each
+    users: Dict[str, List[int]] = {name: [] for name in nonterminals}
+    for index, (_, rhs) in enumerate(productions):
+        for symbol in dict.fromkeys(rhs):
+            if symbol in users:
+                users[symbol].append(index)
+
+    work = list(range(len(productions)))
+    queued = [True] * len(productions)
+    while work:
+        index = work.pop()
+        queued[index] = False
+        lhs, rhs = productions[index]
+        before = len(first[lhs])
+        changed = False
+        for symbol in rhs:
+            if symbol in first:
+                first[lhs] |= first[symbol]
+                if symbol not in nullable:
+                    break
+            else:
+                first[lhs].add(symbol)
+                break
+        else:
+            if lhs not in nullable:
+                nullable.add(lhs)
+                changed = True
+        if changed or len(first[lhs]) != before:
+            for user in users[lhs]:
+                if not queued[user]:
+                    queued[user] = True
+                    work.append(user)
+    return first, nullable
+
+
+def first_of(symbols, first, nullable) -> Tuple[set, bool]:
+    """FIRST of a symbol string and whether all of it can derive empty."""
+
+    result = set()
+    for symbol in symbols:
+        if symbol not in first:
+            result.add(symbol)
+            return result, False
+        result |= first[symbol]
+        if symbol not in nullable:
+            return result, False
+    return result, True
+
+
+def _build(tokens: Sequence[str], productions: List[Tuple[str, Tuple[str, ...]]]) -> LalrTables:
+    nonterminals = list(dict.fromkeys(lhs for lhs, _ in productions))
+    by_lhs: Dict[str, List[int]] = {name: [] for name in nonterminals}
+    for index, (lhs, _) in enumerate(productions):
+        by_lhs[lhs].append(index)
+    first, nullable = first_sets(productions, nonterminals)
+
+    def closure0(kernel: FrozenSet[Tuple[int, int]]) -> List[Tuple[int, int]]:
+        items = list(kernel)
+        seen = set(kernel)
+        for production, dot in items:
+            rhs = productions[production][1]
+            if dot < len(rhs) and rhs[dot] in by_lhs:
+                for added in by_lhs[rhs[dot]]:
+                    if (added, 0) not in seen:
+                        seen.add((added, 0))
+                        items.append((added, 0))
+        return items
+
+    # LR(0) automaton; states are numbered in discovery order
+    kernels = [frozenset([(0, 0)])]
+    state_of = {kernels[0]: 0}
+    transitions: List[Dict[str, int]] = []
+    for kernel in kernels:
+        moves: Dict[str, set] = {}
+        for production, dot in sorted(closure0(kernel)):
+            rhs = productions[production][1]
+            if dot < len(rhs):
+                moves.setdefault(rhs[dot], set()).add((production, dot + 1))
+        edges = {}
+        for symbol, items in moves.items():
+            target = frozenset(items)
+            if target not in state_of:
+                state_of[target] = len(kernels)
+                kernels.append(target)
+            edges[symbol] = state_of[target]
+        transitions.append(edges)
+
+    # Lookahead sets are bitsets: bit i stands for terminals[i], and the bit
+    # after the last terminal is the propagation probe
+    terminals = list(dict.fromkeys([*tokens, END]))
+    bit = {symbol: 1 << index for index, symbol in enumerate(terminals)}
+    probe = 1 << len(terminals)
+    first_bits = {name: sum(bit[symbol] for symbol in symbols) for name, symbols in first.items()}
+    follow_cache: Dict[Tuple[int, int], Tuple[int, bool]] = {}
+
+    def follow_of(production: int, dot: int) -> Tuple[int, bool]:
+        """FIRST of what follows the symbol after the dot, and whether it is nullable."""
+
+        result = follow_cache.get((production, dot))
+        if result is None:
+            bits = 0
+            for symbol in productions[production][1][dot + 1:]:
+                if symbol not in first_bits:
+                    bits |= bit[symbol]
+                    break
+                bits |= first_bits[symbol]
+                if symbol not in nullable:
+                    break
+            else:
+                result = follow_cache[(production, dot)] = (bits, True)
+                return result
+            result = follow_cache[(production, dot)] = (bits, False)
+        return result
+
+    def closure1(items: Dict[Tuple[int, int], int]) -> Dict[Tuple[int, int], int]:
+        """LR(1) closure; lookaheads are merged per LR(0) item."""
+
+        result = dict(items)
+        work = list(result)
+        while work:
+            production, dot = work.pop()
+            rhs = productions[production][1]
+            if dot >= len(rhs) or rhs[dot] not in by_lhs:
+                continue
+            follow, transparent = follow_of(production, dot)
+            if transparent:
+                follow |= result[(production, dot)]
+            for added in by_lhs[rhs[dot]]:
+                lookaheads = result.get((added, 0), 0)
+                if follow | lookaheads != lookaheads:
+                    result[(added, 0)] = follow | lookaheads
+                    work.append((added, 0))
+        return result
+
+    # Lookaheads by spontaneous generation and propagation (Dragon book 4.7.5)
+    lookaheads = [dict.fromkeys(kernel, 0) for kernel in kernels]
+    lookaheads[0][(0, 0)] = bit[END]
+    propagate: Dict[Tuple[int, Tuple[int, int]], List[Tuple[int, Tuple[int, int]]]] = {}
+    for state, kernel in enumerate(kernels):
+        for item in kernel:
+            for (production, dot), found in closure1({item: probe}).items():
+                rhs = productions[production][1]
+                if dot >= len(rhs):
+                    continue
+                target_state, target_item = transitions[state][rhs[dot]], (production, dot + 1)
+                if found & probe:
+                    propagate.setdefault((state, item), []).append((target_state, target_item))
+                lookaheads[target_state][target_item] |= found & ~probe
+    # Propagate along the edges until nothing changes, revisiting only the
+    # items whose lookaheads grew
+    work = list(propagate)
+    while work:
+        state, item = work.pop()
+        source = lookaheads[state][item]
+        for target in propagate[(state, item)]:
+            destination = lookaheads[target[0]][target[1]]
+            if source | destination != destination:
+                lookaheads[target[0]][target[1]] = source | destination
+                if target in propagate:
+                    work.append(target)
+
+    symbols_of: Dict[int, List[str]] = {}
+    shared: Dict[int, FrozenSet[str]] = {}
+    action: List[Mapping[str, int]] = []
+    goto: List[Dict[str, int]] = []
+    conflicts: List[Conflict] = []
+    for state, kernel in enumerate(kernels):
+        row = {symbol: target for symbol, target in transitions[state].items() if symbol in bit}
+        goto.append({symbol: target for symbol, target in transitions[state].items()
+                     if symbol not in bit})
+        row_bits = sum(bit[symbol] for symbol in row)
+        items = closure1(lookaheads[state])
+        reductions = [((production, dot), found) for (production, dot), found in sorted(items.items())
+                      if dot == len(productions[production][1])]
+        if not row and len(reductions) == 1 and reductions[0][1].bit_count() >= SHARED_ROW_LOOKAHEADS:
+            (production, _), found = reductions[0]
+            if found not in shared:
+                shared[found] = frozenset(symbol for symbol in terminals if found & bit[symbol])
+            action.append(ReduceRow(shared[found], -production - 1))
+            continue
+        for (production, dot), found in reductions:
+            symbols = symbols_of.get(found)
+            if symbols is None:
+                symbols = symbols_of[found] = sorted(symbol for symbol in terminals if found & bit[symbol])
+            if not found & row_bits:
+                row.update(dict.fromkeys(symbols, -production - 1))
+                row_bits |= found
+                continue
+            for symbol in symbols:
+                current = row.get(symbol)
+                if current is None:
+                    row[symbol] = -production - 1
+                elif current >= 0:
+                    conflicts.append(Conflict(state, symbol, 'shift/reduce', -1, production))
+                else:
+                    kept, dropped = sorted((-current - 1, production))
+                    row[symbol] = -kept - 1
+                    conflicts.append(Conflict(state, symbol, 'reduce/reduce', kept, dropped))
+            row_bits |= found
+        action.append(row)
+
+    return LalrTables(productions, action, goto, conflicts)
+
+
+_table_cache: 'OrderedDict[str, LalrTables]' = OrderedDict()
+
+
+def grammar_productions(grammar_rules: Sequence[generator.GrammarRule]) -> List[Tuple[str, Tuple[str, ...]]]:
+    """``$accept -> start`` followed by the rules, numbered as in bison."""
+
+    productions = [(ACCEPT, (grammar_rules[0].lhs,))]
+    productions += [(rule.lhs, tuple(rule.rhs.split())) for rule in grammar_rules]
+    return productions
+
+
+def build_tables(tokens: Sequence[str], grammar_rules: Sequence[generator.GrammarRule]) -> LalrTables:
+    """LALR(1) tables for ``grammar_rules`` over the terminal ``tokens``.
+
+    Raises `GrammarError` if the grammar is empty or uses a symbol that is
+    neither a token nor a nonterminal. Tables are cached by `grammar_hash`.
+    """
+
+    if not grammar_rules:
+        raise GrammarError('the %%YACC section has no rules')
+    productions = grammar_productions(grammar_rules)
+
+    key = grammar_hash(tokens, productions)
+    tables = _table_cache.get(key)
+    if tables is not None:
+        _table_cache.move_to_end(key)
+        return tables
+
+    defined = set(tokens) | {lhs for lhs, _ in productions}
+    for lhs, rhs in productions:
+        for symbol in rhs:
+            if symbol not in defined:
+                raise GrammarError(f'symbol {symbol} is used, but is not defined as a token '
+                                   f'and has no rules')
+    # The build allocates millions of small containers but no reference
+    # cycles; with the cycle collector running it would rescan them over
+    # and over
+    collecting = gc.isenabled()
+    gc.disable()
+    try:
+        tables = _build(tokens, productions)
+    finally:
+        if collecting:
+            gc.enable()
+    _table_cache[key] = tables
+    while len(_table_cache) > TABLE_CACHE_ENTRIES:
+        _table_cache.popitem(last=False)
+    return tables
+
+
+# Statements of a grammar action (see rewrite_action for the label syntax)
+_STRING = r'"((?:[^"\\]|\\.)*)"'
+_CREATE_NODE = re.compile(r'\$\$\s*=\s*create_node\s*\(\s*' + _STRING + r'\s*,\s*\d+\s*((?:,\s*(?:\$\d+|NULL)\s*)*)\)$')
+_CREATE_LEAF = re.compile(r'\$\$\s*=\s*create_leaf_node\s*\(\s*' + _STRING + r'\s*,\s*' + _STRING + r'\s*\)$')
+_COPY = re.compile(r'\$\$\s*=\s*(\$(\d+)|NULL)$')
+
+
+def action_statements(action: str) -> List[str]:
+    """The statements of an action, split at semicolons, without comments."""
+
+    statements = []
+    current = []
+    last = 0
+    for match in generator.ACTION_PART_PATTERN.finditer(action):
+        current.append(action[last:match.start()])
+        part = match.group()
+        if part == ';':
+            statements.append(''.join(current).strip())
+            current = []
+        elif not part.startswith('/'):
+            current.append(part)
+        last = match.end()
+    current.append(action[last:])
+    statements.append(''.join(current).strip())
+    return [statement for statement in statements if statement]
+
+
+def _c_string(text: str) -> str:
+    return text.encode('latin-1', 'backslashreplace').decode('unicode_escape')
+
+
+def compile_action(action: str, length: int, collapse: bool = False) -> Callable[[list], Optional[Node]]:
+    """Turn the C action of a rule with ``length`` symbols into a function.
+
+    The function takes the list of right-hand side values and returns
+    ``$$``. With ``collapse`` (streaming parsers), a node whose children are
+    all NULL is NULL itself, as with ``ast_collapse_empty``.
+    """
+
+    def reference(text: str) -> Optional[int]:
+        if text == 'NULL':
+            return None
+        position = int(text[1:])
+        if not 1 <= position <= length:
+            raise GrammarError(f'${position} of action {{ {action} }} is out of range')
+        return position - 1
+
+    def make_node(label: str, refs: List[Optional[int]]) -> Callable[[list], Optional[Node]]:
+        def node(values):
+            children = tuple(None if ref is None else values[ref] for ref in refs)
+            if collapse and children and not any(child is not None for child in children):
+                return None
+            return (label, None, children)
+        return node
+
+    def make_leaf(leaf: Node) -> Callable[[list], Optional[Node]]:
+        return lambda values: leaf
+
+    def pass_through(ref: Optional[int]) -> Callable[[list], Optional[Node]]:
+        if ref is None:
+            return lambda values: None
+        return lambda values: values[ref]
+
+    # Without an action bison's default $$ = $1 applies
+    chosen = pass_through(0 if length else None)
+    for statement in action_statements(action):
+        match = _CREATE_NODE.match(statement)
+        if match:
+            refs = [reference(arg.strip()) for arg in match.group(2).split(',')[1:]]
+            chosen = make_node(_c_string(match.group(1)), refs)
+            continue
+        match = _CREATE_LEAF.match(statement)
+        if match:
+            chosen = make_leaf((_c_string(match.group(1)), _c_string(match.group(2)), ()))
+            continue
+        match = _COPY.match(statement)
+        if match:
+            chosen = pass_through(reference(match.group(1)))
+            continue
+        raise GrammarError(f'unsupported action statement: {statement}')
+    return chosen
+
+
+def action_shape(action: str, length: int) -> Tuple[bool, List[int]]:
+    """Whether an action builds a node and which ``$k`` (0-based) it keeps.
+
+    Used to estimate tree depth; an action `compile_action` cannot run is
+    taken to build a node over every symbol.
+    """
+
+    shape = (False, [0] if length else [])
+    for statement in action_statements(action):
+        node = _CREATE_NODE.match(statement)
+        copy = _COPY.match(statement)
+        if node:
+            refs = [arg.strip() for arg in node.group(2).split(',')[1:]]
+            shape = (True, [int(ref[1:]) - 1 for ref in refs if ref != 'NULL'])
+        elif copy:
+            shape = (False, [int(copy.group(2)) - 1] if copy.group(2) else [])
+        elif _CREATE_LEAF.match(statement):
+            shape = (True, [])
+        else:
+            return True, list(range(length))
+    return shape[0], [ref for ref in shape[1] if 0 <= ref < length]
+
+
+class ParseResult:
+    def __init__(self, trees: List[Node], error: Optional[str], messages: List[str]):
+        self.trees = trees
+        self.error = error
+        self.messages = messages
+
+    # ``ParseResult`` is the outcome of one `Parser.parse`: the printed trees
+    # (one, or one per ``%record`` for streaming grammars), the syntax error
+    # if the input was rejected, and the scanner's messages about unexpected
+    # characters. Like ``custom_compiler``, a rejected input has no tree
+    # unless records were emitted before the error.
+
+    def rows(self) -> Iterator[Tuple[str, Optional[str], int]]:
+        """Preorder ``(type, value, depth)`` rows; NULL children are skipped."""
+
+        for tree in self.trees:
+            stack = [(tree, 0)]
+            while stack:
+                (name, value, children), depth = stack.pop()
+                yield name, value, depth
+                stack.extend((child, depth + 1) for child in reversed(children) if child is not None)
+
+    def model(self) -> Optional[TreeModel]:
+        return TreeModel.from_rows(self.rows()) if self.trees else None
+
+    def text(self) -> str:
+        """The tree as ``custom_compiler`` prints it in text format."""
+
+        lines = ['', TREE_MARKER]
+        for name, value, depth in self.rows():
+            lines.append('  ' * depth + (f'{name}: {value}' if value is not None else name))
+        return '\n'.join(lines) + '\n'
+
+
+class Parser:
+    """LALR(1) parser and scanner for one analyzer."""
+
+    def __init__(self, lex_rules: List[generator.LexRule], grammar_rules: List[generator.GrammarRule],
+                 options: Optional[generator.DefOptions] = None):
+        options = options or generator.DefOptions()
+        self.tokens = list(dict.fromkeys(rule.token_name for rule in lex_rules
+                                         if rule.token_name != 'WHITESPACE'))
+        self.tables = build_tables(self.tokens, grammar_rules)
+        self.scanner = generator.TokenScanner(lex_rules)
+        self.novalue = set(options.novalue)
+        nonterminals = {rule.lhs for rule in grammar_rules}
+        self.records = {name for name in options.records if name in nonterminals}
+        self.actions = [None] + [
+            compile_action(rule.action, len(rule.rhs.split()), bool(self.records))
+            if rule.action else (lambda values: values[0] if values else None)
+            for rule in grammar_rules
+        ]
+
+    def parse(self, text: str) -> ParseResult:
+        productions = self.tables.productions
+        action = self.tables.action
+        goto = self.tables.goto
+        records = self.records
+        messages = []
+
+        def tokens():
+            line = 1
+            for name, value in self.scanner.scan(text):
+                if name is None:
+                    if value != '\n':
+                        messages.append(f'Unexpected character: {value}')
+                elif name != 'WHITESPACE':
+                    yield name, (None if name in self.novalue else value), line
+                line += value.count('\n')
+            yield END, None, line
+
+        emitted: List[Node] = []
+        root = None
+        states = [0]
+        values: list = []
+        stream = tokens()
+        token, value, line = next(stream)
+        while True:
+            move = action[states[-1]].get(token)
+            if move is None:
+                expected = ', '.join(sorted(action[states[-1]]))
+                found = 'end of input' if token == END else token
+                error = f'syntax error on line {line}: unexpected {found}, expecting {expected}'
+                return ParseResult(emitted, error, messages)
+            if move >= 0:
+                states.append(move)
+                values.append((token, value, ()))
+                token, value, line = next(stream)
+                continue
+
+            production = -move - 1
+            if production == 0:
+                if root is not None:
+                    emitted.append(root)
+                return ParseResult(emitted, None, messages)
+            lhs, rhs = productions[production]
+            count = len(rhs)
+            arguments = values[len(values) - count:]
+            result = self.actions[production](arguments)
+            if lhs in records:
+                if result is not None:
+                    emitted.append(result)
+                result = None
+            if production == 1:
+                root = result
+            if count:
+                del states[-count:]
+                del values[-count:]
+            states.append(goto[states[-1]][lhs])
+            values.append(result)
+
+
+def parser_from_text(content: str, filename: str = '<def>') -> Parser:
+    """Parser for the text of a ``.def`` file (e.g. one being edited)."""
+
+    lex_rules, grammar_rules, options = generator.parse_def_text(content, filename)
+    return Parser(lex_rules, grammar_rules, options)
+
+
+def load_parser(def_file: str) -> Parser:
+    with open(def_file, 'r') as f:
+        return parser_from_text(f.read(), def_file)
+
+
+def main():
+    import argparse
+
+    parser = argparse.ArgumentParser(description='Parse input with a .def analyzer, no build needed')
+    parser.add_argument('def_file', help='Analyzer .def file')
+    parser.add_argument('input', nargs='?', help='Input file (default: stdin)')
+    parser.add_argument('--conflicts', action='store_true',
+                        help='List the LALR(1) conflicts and how they were resolved')
+
+    args = parser.parse_args()
+
+    try:
+        analyzer = load_parser(args.def_file)
+    except (GrammarError, ValueError) as exc:
+        print(f'{args.def_file}: {exc}', file=sys.stderr)
+        return 2
+
+    if args.conflicts:
+        productions = analyzer.tables.productions
+        for conflict in analyzer.tables.conflicts:
+            rejected = productions[conflict.rejected]
+            print(f'state {conflict.state}: {conflict.kind} conflict on {conflict.symbol}, '
+                  f'not reducing rule {conflict.rejected}: {rejected[0]} -> {" ".join(rejected[1])}')
+        print(f'{len(analyzer.tables.conflicts)} conflict(s)', file=sys.stderr)
+        return 0
+
+    if args.input:
+        with open(args.input, 'r') as f:
+            text = f.read()
+    else:
+        text = sys.stdin.read()
+    result = analyzer.parse(text)
+    for message in result.messages:
+        print(message, file=sys.stderr)
+    if result.trees or analyzer.records:
+        sys.stdout.write(result.text())
+    if result.error:
+        print(f'Parse error: {result.error}', file=sys.stderr)
+        return 1
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
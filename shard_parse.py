@@ -0,0 +1,271 @@
+#!/usr/bin/env python3
+"""
+shard_parse.py
+--------------
+Parse one large line-oriented input with several compiler processes.
+
+Analyzers whose records end with ``NEWLINE`` can parse any run of whole lines
+on its own. The input is memory-mapped, cut into shards at line boundaries
+(only byte offsets are computed; nothing is copied), and each shard is parsed
+by its own ``custom_compiler --range START:END`` process, which maps the same
+file. The shard outputs are then joined in input order:
+
+- as a record stream: one tree (or ``%record`` stream) per shard, back to back
+- with ``--single-root``: the children of every shard's root under one root,
+  i.e. one logical tree for the whole input; not for ``%record`` analyzers,
+  whose shards hold one tree per record
+
+Important functions:
+- `shard_ranges(buffer, shards)` - byte ranges ending on record boundaries
+- `run_shards(binary, path, ranges, jobs)` - parse shards in parallel
+- `merge_text(results, out)` / `merge_binary(results, out)` - join outputs
+"""
+
+import mmap
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+from concurrent.futures import ThreadPoolExecutor
+from typing import BinaryIO, Iterator, List, Sequence, Tuple
+
+import tree_binary
+from tree_model import TREE_MARKER
+
+# yy_scan_bytes takes an int length, so no shard may reach 2 GiB
+MAX_SHARD_BYTES = 1 << 30
+
+RECORD_SEPARATOR = b'\n'
+
+
+def shard_ranges(buffer, shards: int, separator: bytes = RECORD_SEPARATOR,
+                 max_bytes: int = MAX_SHARD_BYTES) -> List[Tuple[int, int]]:
+    """Split ``buffer`` into about ``shards`` ranges that end after ``separator``.
+
+    More shards are used when needed to keep each one under ``max_bytes``.
+    A record longer than a shard is never split, so ranges can be uneven.
+    """
+
+    size = len(buffer)
+    count = max(shards, -(-size // max_bytes), 1)
+    ranges = []
+    start = 0
+    for shard in range(1, count):
+        target = shard * size // count
+        if target <= start:
+            continue
+        cut = buffer.find(separator, target)
+        if cut == -1:
+            break
+        cut += len(separator)
+        if cut >= size:
+            break
+        ranges.append((start, cut))
+        start = cut
+    ranges.append((start, size))
+    return ranges
+
+
+class ShardResult:
+    def __init__(self, start: int, end: int, returncode: int, stderr: bytes, output: BinaryIO):
+        self.start = start
+        self.end = end
+        self.returncode = returncode
+        self.stderr = stderr
+        self.output = output
+
+    # ``ShardResult`` holds one compiler run over bytes ``[start, end)``. The
+    # tree is spooled to an unnamed temporary file (``output``, rewound), so
+    # only the shard being merged is ever read back.
+
+
+def _parse_shard(binary: str, path: str, output_format: str, start: int, end: int,
+                 zero_copy: bool = False) -> ShardResult:
+    output = tempfile.TemporaryFile()
+    command = [str(binary), '--format', output_format, '--range', f'{start}:{end}']
+    if zero_copy:
+        command.append('--mmap')
+    process = subprocess.run(
+        command + [str(path)],
+        stdout=output,
+        stderr=subprocess.PIPE,
+    )
+    output.seek(0)
+    return ShardResult(start, end, process.returncode, process.stderr, output)
+
+
+def run_shards(binary: str, path: str, ranges: Sequence[Tuple[int, int]], jobs: int = 0,
+               output_format: str = 'binary', zero_copy: bool = False) -> Iterator[ShardResult]:
+    """Parse every range of ``path``, ``jobs`` processes at a time.
+
+    Results are yielded in input order as soon as each is available; close
+    their ``output`` files once merged. ``zero_copy`` runs the compilers with
+    ``--mmap`` so shards are scanned in place.
+    """
+
+    jobs = jobs or os.cpu_count() or 1
+    with ThreadPoolExecutor(max_workers=jobs) as executor:
+        futures = [
+            executor.submit(_parse_shard, binary, path, output_format, start, end, zero_copy)
+            for start, end in ranges
+        ]
+        for future in futures:
+            yield future.result()
+
+
+def _check_single_tree(result: ShardResult, trees: int):
+    if trees > 1:
+        raise ValueError(f'shard {result.start}:{result.end} holds {trees} trees; a single root '
+                         f'needs one tree per shard, which %record analyzers do not produce')
+
+
+def _text_roots(output: BinaryIO) -> int:
+    """Number of trees (unindented lines) in the tree section of ``output``.
+
+    Leaves ``output`` rewound.
+    """
+
+    marker = TREE_MARKER.encode()
+    roots = 0
+    lines = iter(output)
+    for line in lines:
+        if marker in line:
+            break
+    for line in lines:
+        if line.strip() and not line[:1].isspace():
+            roots += 1
+    output.seek(0)
+    return roots
+
+
+def merge_text(results: Iterator[ShardResult], out: BinaryIO, single_root: bool = False) -> int:
+    """Join text outputs under a single ``=== Parse Tree ===`` header.
+
+    With ``single_root`` the root line of every shard after the first is
+    dropped, so later children continue under the first root. Returns the
+    number of failed shards. Raises ``ValueError`` with ``single_root`` if a
+    shard holds several trees (a ``%record`` stream); output stops there.
+    """
+
+    marker = TREE_MARKER.encode()
+    failures = 0
+    header_written = False
+    for result in results:
+        with result.output:
+            if result.returncode != 0:
+                failures += 1
+                continue
+            if single_root:
+                _check_single_tree(result, _text_roots(result.output))
+            lines = iter(result.output)
+            for line in lines:
+                if marker in line:
+                    break
+            if not header_written:
+                out.write(b'\n' + marker + b'\n')
+                header_written = True
+                shutil.copyfileobj(result.output, out)
+                continue
+            if single_root:
+                next(lines, None)
+            for line in lines:
+                out.write(line)
+    return failures
+
+
+def merge_binary(results: Iterator[ShardResult], out: BinaryIO, single_root: bool = False) -> int:
+    """Join binary outputs as a document stream or, with ``single_root``, one tree.
+
+    Returns the number of failed shards. Raises ``ValueError`` with
+    ``single_root`` if a shard holds several trees (a ``%record`` stream);
+    nothing is written then.
+    """
+
+    failures = 0
+    if not single_root:
+        for result in results:
+            with result.output:
+                if result.returncode != 0:
+                    failures += 1
+                    continue
+                shutil.copyfileobj(result.output, out)
+        return failures
+
+    # The merged header needs every shard's counts, so wait for all of them
+    outputs = []
+    trees = []
+    try:
+        for result in results:
+            outputs.append(result.output)
+            if result.returncode != 0:
+                failures += 1
+                continue
+            if os.fstat(result.output.fileno()).st_size:
+                data = mmap.mmap(result.output.fileno(), 0, access=mmap.ACCESS_READ)
+                shard_trees = list(tree_binary.iter_trees(data))
+                _check_single_tree(result, len(shard_trees))
+                trees.extend(shard_trees)
+        if trees:
+            tree_binary.write_merged_tree(trees, out)
+    finally:
+        trees.clear()
+        for output in outputs:
+            output.close()
+    return failures
+
+
+def main():
+    import argparse
+
+    parser = argparse.ArgumentParser(description='Parse one large input with parallel compilers')
+    parser.add_argument('input', help='Line-oriented input file')
+    parser.add_argument('--compiler', default='./custom_compiler',
+                        help='Compiler executable (default: ./custom_compiler)')
+    parser.add_argument('-j', '--jobs', type=int, default=0,
+                        help='Parallel compilers (default: number of cores)')
+    parser.add_argument('--shards', type=int, default=0,
+                        help='Number of shards (default: one per job)')
+    parser.add_argument('--format', choices=['text', 'binary'], default='text',
+                        help='Tree format (default: text)')
+    parser.add_argument('--single-root', action='store_true',
+                        help='Merge all shards under one root instead of one tree per shard')
+    parser.add_argument('-o', '--output', help='Write the merged tree here instead of stdout')
+    parser.add_argument('--mmap', action='store_true',
+                        help='Have each compiler scan its shard in place (--mmap)')
+
+    args = parser.parse_args()
+
+    jobs = args.jobs or os.cpu_count() or 1
+    with open(args.input, 'rb') as f:
+        size = os.fstat(f.fileno()).st_size
+        if size:
+            with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as data:
+                ranges = shard_ranges(data, args.shards or jobs)
+        else:
+            ranges = [(0, 0)]
+
+    def report(results):
+        for result in results:
+            if result.returncode != 0:
+                sys.stderr.write(f'shard {result.start}:{result.end}: '
+                                 f'{result.stderr.decode("utf-8", "replace")}')
+            yield result
+
+    results = report(run_shards(args.compiler, args.input, ranges, jobs, args.format, args.mmap))
+    merge = merge_binary if args.format == 'binary' else merge_text
+    try:
+        if args.output:
+            with open(args.output, 'wb') as out:
+                failures = merge(results, out, args.single_root)
+        else:
+            failures = merge(results, sys.stdout.buffer, args.single_root)
+            sys.stdout.buffer.flush()
+    except ValueError as exc:
+        print(f'Error: {exc}', file=sys.stderr)
+        return 1
+    return 1 if failures else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
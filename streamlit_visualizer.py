@@ -13,20 +13,40 @@ structures suitable for display.
 
 Key functions:
 - `get_available_analyzers()` - enumerates .def files in the repo and samples
-- `build_compiler(def_file)` - runs `make` to regenerate the compiler for a
-    specific analyzer
+- `build_compiler(def_file)` - restores the compiler for a specific analyzer
+    from the build cache, running `make` only on a cache miss
 - `run_compiler(input_file)` - runs `./custom_compiler` and captures output
-- `create_graphviz_tree(nodes)` - converts parsed nodes into a Graphviz Digraph
+- `get_analysis(def_file, input_data)` - memoized build + run + parse, keyed
+    by the analyzer's build key and a hash of the input, in a `ResultCache`
+    bounded by the size of the cached trees
+- `get_preview(def_text, input_data)` - the same tree from the pure-Python
+    LALR engine (`lalr.py`), without flex, bison or gcc
+- `get_incremental(def_file)` - this session's `incremental.IncrementalParser`
+    for a `%record` analyzer, so edited custom input re-parses changed lines only
+- `parse_compiler_output(output)` - decodes binary (or text) tree output into
+    a `tree_model.TreeModel`
+- `create_graphviz_tree(model, expanded)` - converts the visible part of a
+    tree model into a Graphviz Digraph, folding large subtrees into summaries
 """
 
 import streamlit as st
 import subprocess
 import os
 import json
+import hashlib
+import threading
+from collections import OrderedDict
+from concurrent.futures import Future
 from pathlib import Path
 import graphviz
 import re
 
+import build_cache
+import incremental
+import lalr
+import tree_stats
+from tree_model import TreeModel
+
 # Page config
 st.set_page_config(
     page_title="Parse Tree Visualizer",
@@ -62,18 +82,6 @@ st.markdown("""
 </style>
 """, unsafe_allow_html=True)
 
-class ParseTreeNode:
-    def __init__(self, node_type, value=None, indent_level=0):
-        self.node_type = node_type
-        self.value = value
-        self.indent_level = indent_level
-        self.children = []
-        
-    def __repr__(self):
-        if self.value:
-            return f"{self.node_type}: {self.value}"
-        return self.node_type
-
 def get_available_analyzers():
     """Get list of available .def files"""
     analyzers = []
@@ -114,152 +122,314 @@ def get_input_file(def_file):
     return input_path if input_path.exists() else None
 
 def build_compiler(def_file):
-    """Build the compiler with the specified .def file"""
+    """Build the compiler with the specified .def file.
+
+    Binaries are reused from the content-addressed build cache so switching
+    between analyzers does not rerun flex, bison and gcc.
+    """
     try:
-        # Clean
-        subprocess.run(['make', 'clean'], capture_output=True, check=True)
-        
-        # Build
-        result = subprocess.run(
-            ['make', f'DEF_FILE={def_file}'],
-            capture_output=True,
-            text=True,
-            check=True
-        )
-        
+        key, hit = build_cache.ensure_compiler(def_file)
+        if hit:
+            return True, f"Build successful! (cached {key[:12]})"
         return True, "Build successful!"
-    except subprocess.CalledProcessError as e:
-        return False, f"Build failed:\n{e.stderr}"
+    except build_cache.BuildError as e:
+        return False, f"Build failed:\n{e}"
 
 def run_compiler(input_file):
-    """Run the compiler and get parse tree output"""
+    """Run the compiler and get parse tree output.
+
+    The compiler is asked for the binary tree format, so stdout is returned as
+    bytes; pass it to `parse_compiler_output`.
+    """
     try:
-        with open(input_file, 'r') as f:
+        with open(input_file, 'rb') as f:
             input_data = f.read()
         
-        result = subprocess.run(
-            ['./custom_compiler'],
-            input=input_data,
-            capture_output=True,
-            text=True,
-            timeout=5
-        )
-        
-        return result.stdout, result.stderr
+        return execute_compiler(input_data)
     except subprocess.TimeoutExpired:
         return None, "Execution timeout"
     except Exception as e:
         return None, str(e)
 
-def parse_tree_output(output):
-    """Parse the tree output into structured nodes"""
-    lines = output.split('\n')
-    nodes = []
-    
-    for line in lines:
-        if not line.strip():
-            continue
-        
-        # Calculate indent level
-        indent = len(line) - len(line.lstrip())
-        content = line.strip()
-        
-        # Check if it has a value (contains :)
-        if ': ' in content:
-            parts = content.split(': ', 1)
-            node_type = parts[0]
-            value = parts[1]
-            nodes.append(ParseTreeNode(node_type, value, indent))
+def execute_compiler(input_data, binary='./custom_compiler'):
+    """Feed `input_data` (bytes) to the compiler in binary output mode."""
+    result = subprocess.run(
+        [str(binary), '--format', 'binary'],
+        input=input_data,
+        capture_output=True,
+        timeout=5
+    )
+    
+    return result.stdout, result.stderr.decode('utf-8', 'replace')
+
+def parse_compiler_output(output):
+    """Parse compiler stdout (binary or text tree) into a TreeModel.
+
+    Streaming analyzers (%record) emit one tree per record; they become the
+    roots of a forest.
+    """
+    return TreeModel.from_output(output)
+
+# Bytes of analyses kept in memory, shared by all sessions (least recently
+# used go first)
+RESULT_CACHE_BYTES = 512 << 20
+# Rendered graphs kept per analysis, one per distinct view
+GRAPH_CACHE_ENTRIES = 16
+
+class AnalysisResult:
+    """Outcome of running one analyzer binary on one input.
+
+    Instances are shared between sessions through `get_analysis`, so they are
+    never modified after creation apart from the memoized statistics and
+    rendered graphs.
+    """
+
+    def __init__(self, model, stderr):
+        self.model = model
+        self.stderr = stderr
+        self._base_size = (model.nbytes() if model is not None else 0) + len(stderr)
+        self._stats = None
+        self._graphs = OrderedDict()
+
+    @property
+    def size(self):
+        """Approximate bytes held: tree, stderr and the rendered graphs."""
+        return self._base_size + sum(len(source) for source in list(self._graphs.values()))
+
+    @property
+    def stats(self):
+        if self._stats is None:
+            self._stats = calculate_statistics(self.model)
+        return self._stats
+
+    def graph_source(self, expanded, threshold, max_nodes):
+        """DOT source for one level-of-detail view, rendered at most once."""
+        key = (frozenset(expanded), threshold, max_nodes)
+        source = self._graphs.get(key)
+        if source is None:
+            graph = create_graphviz_tree(self.model, expanded, threshold, max_nodes)
+            source = graph.source if graph else ''
+            self._graphs[key] = source
+            while len(self._graphs) > GRAPH_CACHE_ENTRIES:
+                self._graphs.popitem(last=False)
         else:
-            nodes.append(ParseTreeNode(content, None, indent))
-    
-    return nodes
+            self._graphs.move_to_end(key)
+        return source
+
+class ResultCache:
+    """AnalysisResults by key, least recently used first, within a byte budget.
+
+    The budget counts `AnalysisResult.size`, i.e. the tree columns and text
+    plus the rendered graphs, so a few huge trees evict as much as many small
+    ones. The most recent result is always kept, even when it alone exceeds
+    the budget. Concurrent misses on one key compute it once; the other
+    callers wait for that result.
+    """
+
+    def __init__(self, budget):
+        self.budget = budget
+        self.size = 0
+        self._results = OrderedDict()
+        self._pending = {}
+        self._lock = threading.Lock()
+
+    def _evict(self):
+        # Results grow as graphs are rendered, so the total is recounted
+        size = sum(result.size for result in self._results.values())
+        while size > self.budget and len(self._results) > 1:
+            _, evicted = self._results.popitem(last=False)
+            size -= evicted.size
+        self.size = size
+
+    def get(self, key, compute):
+        """Return the result for `key`, calling `compute()` on a miss.
+
+        An exception from `compute()` reaches every caller waiting on it and
+        nothing is cached.
+        """
+        with self._lock:
+            result = self._results.get(key)
+            if result is not None:
+                self._results.move_to_end(key)
+                self._evict()
+                return result
+            pending = self._pending.get(key)
+            if pending is None:
+                pending = self._pending[key] = Future()
+                owner = True
+            else:
+                owner = False
+        if not owner:
+            return pending.result()
+
+        try:
+            result = compute()
+        except BaseException as exc:
+            with self._lock:
+                del self._pending[key]
+            pending.set_exception(exc)
+            raise
+        with self._lock:
+            del self._pending[key]
+            self._results[key] = result
+            self._evict()
+        pending.set_result(result)
+        return result
+
+@st.cache_resource(show_spinner=False)
+def _result_cache():
+    """The ResultCache shared by every session and script rerun."""
+    return ResultCache(RESULT_CACHE_BYTES)
+
+def _run_analysis(build_key, def_file, input_data):
+    """Build (or restore) the analyzer, run it and parse its output."""
+    build_cache.ensure_compiler(def_file)
+    # Run the cached binary itself: ./custom_compiler may be replaced by
+    # another session at any moment
+    stdout, stderr = execute_compiler(input_data, build_cache.cached_binary(build_key))
+    return AnalysisResult(parse_compiler_output(stdout) if stdout else None, stderr)
+
+def get_analysis(def_file, input_data):
+    """Return the AnalysisResult for `input_data` (bytes) under `def_file`.
 
-def create_graphviz_tree(nodes):
-    """Create a graphviz tree from nodes"""
-    if not nodes:
+    Repeat requests for the same analyzer build and input are answered from
+    memory without building, forking the compiler or parsing again. Raises
+    `build_cache.BuildError` if the analyzer cannot be built.
+    """
+    build_key = build_cache.compute_build_key(def_file)
+    input_hash = hashlib.sha256(input_data).hexdigest()
+    return _result_cache().get(('analysis', build_key, input_hash),
+                               lambda: _run_analysis(build_key, def_file, input_data))
+
+def _run_preview(def_text, input_data):
+    """Parse with the Python engine."""
+    result = lalr.parser_from_text(def_text).parse(input_data.decode('utf-8', 'replace'))
+    messages = result.messages + ([f"Parse error: {result.error}"] if result.error else [])
+    return AnalysisResult(result.model(), '\n'.join(messages))
+
+def get_preview(def_text, input_data):
+    """Return an AnalysisResult for `input_data` under the .def text `def_text`.
+
+    Nothing is generated or compiled: the grammar tables come from
+    `lalr.build_tables` (cached per grammar), so previews of an edited
+    grammar are immediate. Raises `ValueError` for a grammar the engine
+    cannot handle.
+    """
+    def_hash = hashlib.sha256(def_text.encode('utf-8')).hexdigest()
+    input_hash = hashlib.sha256(input_data).hexdigest()
+    return _result_cache().get(('preview', def_hash, input_hash),
+                               lambda: _run_preview(def_text, input_data))
+
+def get_incremental(def_file):
+    """Return this session's IncrementalParser for `def_file`.
+
+    The parser talks to a resident compiler process, so it is kept per
+    session rather than in the shared caches, and replaced (its server
+    closed) when the analyzer or its build changes. When Streamlit drops an
+    ended session's state the parser is collected and its `CompilerServer`
+    stops the process (see `compiler_client.CompilerServer`).
+    """
+    build_key = build_cache.compute_build_key(def_file)
+    current = st.session_state.get('incremental')
+    if current and current[0] == build_key:
+        return current[1]
+    if current:
+        current[1].close()
+    build_cache.ensure_compiler(def_file)
+    parser = incremental.IncrementalParser(build_cache.cached_binary(build_key))
+    st.session_state.incremental = (build_key, parser)
+    return parser
+
+def analyze_incremental(def_file, input_data):
+    """AnalysisResult for edited custom input, re-parsing changed records only.
+
+    The returned model is the session parser's own, updated in place by the
+    next call; a new AnalysisResult is made each time so no statistics or
+    graphs of the previous text are reused.
+    """
+    parser = get_incremental(def_file)
+    model = parser.update(input_data)
+    return AnalysisResult(model if len(model) else None, '\n'.join(parser.messages()))
+
+def node_color(node_type, value):
+    """Fill color for a graph node"""
+    node_type_lower = node_type.lower()
+    
+    # Special colors for detected patterns
+    if 'email' in node_type_lower:
+        return '#ffccff'
+    elif 'phone' in node_type_lower:
+        return '#ccffff'
+    elif 'url' in node_type_lower or 'website' in node_type_lower:
+        return '#ffffcc'
+    elif 'currency' in node_type_lower or 'dollar' in node_type_lower:
+        return '#ccffcc'
+    elif 'urgent' in node_type_lower:
+        return '#ffaaaa'
+    
+    # Terminal vs non-terminal
+    return '#ffcccc' if value else '#cce5ff'
+
+def create_graphviz_tree(model, expanded=(), threshold=50, max_nodes=300):
+    """Create a graphviz tree from the visible frontier of a TreeModel.
+
+    Subtrees larger than `threshold` nodes, and anything past `max_nodes`,
+    are drawn as one dashed summary node with its size and most common node
+    types unless their root is in `expanded`; children that do not fit are
+    counted in a "… N more" note. Only the frontier is sent to
+    Graphviz, so the chart stays small however large the tree is.
+    """
+    if not model:
         return None
     
+    view = model.frontier(expanded, threshold, max_nodes)
+    
     dot = graphviz.Digraph(comment='Parse Tree')
     dot.attr(rankdir='TB')
     dot.attr('node', shape='box', style='rounded,filled')
     
-    # Node styling
-    node_counter = [0]
-    node_map = {}
-    
-    def add_node(node, parent_id=None):
-        node_id = f"node_{node_counter[0]}"
-        node_counter[0] += 1
+    for index in view.nodes:
+        node_type = model.type_name(index)
+        value = model.value(index)
+        color = node_color(node_type, value)
         
-        # Determine color based on node type
-        if node.value:
-            # Terminal
-            color = '#ffcccc'
-            label = f"{node.node_type}\n{node.value}"
+        if index in view.collapsed:
+            mix = ', '.join(f"{name}×{count}" for name, count in model.subtree_type_mix(index))
+            label = f"{node_type} [#{index}]\n+{model.subtree_size[index] - 1} nodes\n{mix}"
+            dot.node(f"node_{index}", label, fillcolor=color, style='rounded,filled,dashed')
+        elif value:
+            dot.node(f"node_{index}", f"{node_type}\n{value}", fillcolor=color)
         else:
-            # Non-terminal
-            color = '#cce5ff'
-            label = node.node_type
-        
-        # Special colors for detected patterns
-        if 'email' in node.node_type.lower():
-            color = '#ffccff'
-        elif 'phone' in node.node_type.lower():
-            color = '#ccffff'
-        elif 'url' in node.node_type.lower() or 'website' in node.node_type.lower():
-            color = '#ffffcc'
-        elif 'currency' in node.node_type.lower() or 'dollar' in node.node_type.lower():
-            color = '#ccffcc'
-        elif 'urgent' in node.node_type.lower():
-            color = '#ffaaaa'
+            dot.node(f"node_{index}", node_type, fillcolor=color)
         
-        dot.node(node_id, label, fillcolor=color)
-        node_map[node_id] = (node, parent_id)
-        
-        return node_id
+        # Parent links come straight from the model
+        parent = model.parent[index]
+        if parent >= 0:
+            dot.edge(f"node_{parent}", f"node_{index}")
     
-    # Build tree structure
-    stack = []
-    for i, node in enumerate(nodes):
-        node_id = add_node(node)
-        
-        # Find parent based on indentation
-        while stack and stack[-1][1] >= node.indent_level:
-            stack.pop()
-        
-        if stack:
-            parent_id = stack[-1][0]
-            dot.edge(parent_id, node_id)
-        
-        stack.append((node_id, node.indent_level))
+    for index, hidden in view.hidden_children.items():
+        dot.node(f"more_{index}", f"… {hidden} more", shape='note', fillcolor='#eeeeee')
+        dot.edge(f"node_{index}", f"more_{index}", style='dashed')
+    
+    if view.hidden_roots:
+        dot.node('hidden_roots', f"… {view.hidden_roots} more trees", shape='note', fillcolor='#eeeeee')
     
     return dot
 
-def calculate_statistics(nodes):
-    """Calculate statistics from parse tree"""
-    total = len(nodes)
-    terminals = sum(1 for n in nodes if n.value)
-    nonterminals = total - terminals
-    
-    # Detect patterns
-    patterns = {}
-    for node in nodes:
-        if 'found' in node.node_type.lower() or 'detected' in node.node_type.lower():
-            key = node.node_type
-            patterns[key] = patterns.get(key, 0) + 1
-        elif node.value and node.node_type.isupper():
-            # Count token types
-            if '_' in node.node_type:
-                base_type = node.node_type.lower()
-                patterns[base_type] = patterns.get(base_type, 0) + 1
-    
-    return {
-        'total': total,
-        'terminals': terminals,
-        'nonterminals': nonterminals,
-        'patterns': patterns
-    }
+def calculate_statistics(model):
+    """Calculate statistics from parse tree in a single pass (see tree_stats)"""
+    stats = tree_stats.from_model(model).to_dict()
+    
+    # Detected patterns plus token types with compound names, decided once
+    # per distinct type rather than per node
+    patterns = dict(stats['detected'])
+    for node_type in stats['value_cardinality']:
+        if node_type not in patterns and node_type.isupper() and '_' in node_type:
+            patterns[node_type.lower()] = stats['type_counts'][node_type]
+    
+    stats['total'] = stats['nodes']
+    stats['patterns'] = patterns
+    return stats
 
 # Main UI
 st.title("🌲 Parse Tree Visualizer")
@@ -297,16 +467,28 @@ with st.sidebar:
     # Visualization options
     st.subheader("📊 Display Options")
     show_graph = st.checkbox("Show Graph View", value=True)
+    collapse_threshold = st.number_input("Collapse subtrees larger than", min_value=1, value=50, step=10)
+    max_graph_nodes = st.number_input("Max graph nodes", min_value=10, value=300, step=50)
     show_text = st.checkbox("Show Text View", value=True)
     show_stats = st.checkbox("Show Statistics", value=True)
     show_input = st.checkbox("Show Input Text", value=False)
+    instant_preview = st.checkbox(
+        "⚡ Instant preview (Python parser)", value=False,
+        help="Parse with the pure-Python LALR engine instead of building the "
+             "analyzer; the grammar can then be edited in place"
+    )
 
 # Main content
 if 'current_analyzer' not in st.session_state:
     st.session_state.current_analyzer = None
     st.session_state.nodes = None
+    st.session_state.result = None
     st.session_state.input_content = None
 
+# Subtrees the user expanded in the graph view
+if 'expanded' not in st.session_state:
+    st.session_state.expanded = set()
+
 # Update if new analyzer selected
 if selected_analyzer:
     st.session_state.current_analyzer = selected_analyzer
@@ -317,6 +499,28 @@ if st.session_state.current_analyzer:
     
     st.info(f"**Selected Analyzer:** `{def_file}`")
     
+    # Grammar text used by the instant preview; edits never touch the file
+    def_text = None
+    if instant_preview:
+        with st.expander("🧩 Edit Grammar", expanded=False):
+            with open(def_file, 'r') as f:
+                def_text = st.text_area("Analyzer definition:", f.read(), height=300,
+                                        key=f"def_text:{def_file}")
+    
+    def analyze(input_data):
+        if def_text is not None:
+            return get_preview(def_text, input_data)
+        # Build, run and parse; served from memory when repeated
+        return get_analysis(def_file, input_data)
+    
+    # Record analyzers parse each line on its own, so edits of the custom
+    # input only re-parse the lines that changed
+    with open(def_file, 'r') as f:
+        try:
+            streams_records = incremental.is_record_grammar(f.read())
+        except ValueError:
+            streams_records = False
+    
     # Build button
     col1, col2, col3 = st.columns([1, 1, 3])
     with col1:
@@ -334,25 +538,26 @@ if st.session_state.current_analyzer:
                 st.error("Input file not found!")
             else:
                 with st.spinner("Running compiler..."):
-                    # First build
-                    success, build_msg = build_compiler(def_file)
-                    if not success:
-                        st.error(f"Build failed: {build_msg}")
+                    try:
+                        with open(input_file, 'rb') as f:
+                            input_data = f.read()
+                        result = analyze(input_data)
+                    except build_cache.BuildError as e:
+                        st.error(f"Build failed: {e}")
+                    except ValueError as e:
+                        st.error(f"Grammar error: {e}")
+                    except subprocess.TimeoutExpired:
+                        st.error("Execution timeout")
                     else:
-                        # Then run
-                        stdout, stderr = run_compiler(input_file)
-                        
-                        if stderr:
+                        if result.stderr:
                             with st.expander("⚠️ Compiler Messages", expanded=False):
-                                st.text(stderr)
+                                st.text(result.stderr)
                         
-                        if stdout:
-                            # Parse output
-                            st.session_state.nodes = parse_tree_output(stdout)
-                            
-                            # Read input
-                            with open(input_file, 'r') as f:
-                                st.session_state.input_content = f.read()
+                        if result.model:
+                            st.session_state.result = result
+                            st.session_state.nodes = result.model
+                            st.session_state.expanded = set()
+                            st.session_state.input_content = input_data.decode('utf-8', 'replace')
                             
                             st.success("✅ Parse tree generated!")
                         else:
@@ -369,32 +574,32 @@ if st.session_state.current_analyzer:
         if st.button("Run with Custom Input"):
             if custom_input:
                 with st.spinner("Running..."):
-                    # Build first
-                    success, build_msg = build_compiler(def_file)
-                    if success:
-                        # Run with custom input
-                        try:
-                            result = subprocess.run(
-                                ['./custom_compiler'],
-                                input=custom_input,
-                                capture_output=True,
-                                text=True,
-                                timeout=5
-                            )
-                            
-                            if result.stderr:
-                                with st.expander("⚠️ Messages"):
-                                    st.text(result.stderr)
-                            
-                            if result.stdout:
-                                st.session_state.nodes = parse_tree_output(result.stdout)
-                                st.session_state.input_content = custom_input
-                                st.success("✅ Parse tree generated!")
-                        except Exception as e:
-                            st.error(f"Error: {e}")
+                    try:
+                        if def_text is None and streams_records:
+                            result = analyze_incremental(def_file, custom_input.encode('utf-8'))
+                        else:
+                            result = analyze(custom_input.encode('utf-8'))
+                        
+                        if result.stderr:
+                            with st.expander("⚠️ Messages"):
+                                st.text(result.stderr)
+                        
+                        if result.model:
+                            st.session_state.result = result
+                            st.session_state.nodes = result.model
+                            st.session_state.expanded = set()
+                            st.session_state.input_content = custom_input
+                            st.success("✅ Parse tree generated!")
+                    except Exception as e:
+                        st.error(f"Error: {e}")
     
     # Display results
     if st.session_state.nodes:
+        # Statistics and graphs are memoized on the (shared) analysis result
+        result = st.session_state.get('result')
+        if result is None or result.model is not st.session_state.nodes:
+            result = st.session_state.result = AnalysisResult(st.session_state.nodes, '')
+        
         st.divider()
         
         # Input text
@@ -404,16 +609,18 @@ if st.session_state.current_analyzer:
         
         # Statistics
         if show_stats:
-            stats = calculate_statistics(st.session_state.nodes)
+            stats = result.stats
             
             st.subheader("📊 Statistics")
-            col1, col2, col3 = st.columns(3)
+            col1, col2, col3, col4 = st.columns(4)
             with col1:
                 st.metric("Total Nodes", stats['total'])
             with col2:
                 st.metric("Terminals", stats['terminals'])
             with col3:
                 st.metric("Non-terminals", stats['nonterminals'])
+            with col4:
+                st.metric("Max Depth", stats['max_depth'])
             
             if stats['patterns']:
                 st.markdown("**Detected Patterns:**")
@@ -421,13 +628,55 @@ if st.session_state.current_analyzer:
                 for i, (pattern, count) in enumerate(sorted(stats['patterns'].items())):
                     with cols[i % 4]:
                         st.metric(pattern.replace('_', ' ').title(), count)
+            
+            with st.expander("📈 Tree Shape", expanded=False):
+                col1, col2 = st.columns(2)
+                with col1:
+                    st.markdown("**Nodes per depth**")
+                    st.bar_chart(stats['depth_histogram'])
+                with col2:
+                    st.markdown("**Children per node**")
+                    st.bar_chart({int(k): v for k, v in stats['branching'].items()})
+                st.markdown("**Subtree size**")
+                st.json(stats['subtree_size'])
+                st.markdown("**Node types / distinct token values**")
+                st.dataframe(
+                    [{'type': name, 'count': count,
+                      'distinct values': stats['value_cardinality'].get(name, 0)}
+                     for name, count in stats['type_counts'].items()]
+                )
+                st.download_button("Download statistics JSON", json.dumps(stats, indent=2),
+                                   file_name="tree_stats.json", mime="application/json")
         
         st.divider()
         
         # Graph view
         if show_graph:
             st.subheader("🔍 Graph View")
-            graph = create_graphviz_tree(st.session_state.nodes)
+            model = st.session_state.nodes
+            expanded = st.session_state.expanded
+            view = model.frontier(expanded, collapse_threshold, max_graph_nodes)
+            
+            # Dashed nodes are collapsed subtrees; pick one to expand it
+            if view.collapsed:
+                col1, col2, col3 = st.columns([3, 1, 1])
+                with col1:
+                    target = st.selectbox(
+                        "Collapsed subtrees",
+                        sorted(view.collapsed),
+                        format_func=lambda i: f"#{i} {model.type_name(i)} ({model.subtree_size[i]} nodes)"
+                    )
+                with col2:
+                    if st.button("➕ Expand"):
+                        expanded.add(target)
+                        st.rerun()
+                with col3:
+                    if st.button("↺ Reset view", disabled=not expanded):
+                        expanded.clear()
+                        st.rerun()
+                st.caption(f"Showing {len(view.nodes)} of {len(model)} nodes")
+            
+            graph = result.graph_source(expanded, collapse_threshold, max_graph_nodes)
             if graph:
                 st.graphviz_chart(graph)
             else:
@@ -439,12 +688,12 @@ if st.session_state.current_analyzer:
             
             # Create formatted text
             text_output = []
-            for node in st.session_state.nodes:
-                indent = '  ' * (node.indent_level // 2)
-                if node.value:
-                    text_output.append(f"{indent}🔹 {node.node_type}: {node.value}")
+            for node_type, value, depth in st.session_state.nodes.rows():
+                indent = '  ' * depth
+                if value:
+                    text_output.append(f"{indent}🔹 {node_type}: {value}")
                 else:
-                    text_output.append(f"{indent}📦 {node.node_type}")
+                    text_output.append(f"{indent}📦 {node_type}")
             
             st.text('\n'.join(text_output))
 
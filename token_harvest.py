@@ -0,0 +1,243 @@
+#!/usr/bin/env python3
+"""
+token_harvest.py
+----------------
+Harvest ``*_tokens.txt`` samples from many input files in parallel.
+
+`generator.generate_token_files` samples the single input found next to the
+``.def`` file and keeps the first unique matches, so its samples come from
+the start of that file. This module takes any number of files or glob
+patterns instead (say, a day of logs). Each file is memory-mapped and cut
+into chunks at line boundaries, and a process pool tokenizes the chunks with
+the same Flex-like scanner (`generator.TokenScanner`).
+
+Per token, every worker keeps a bottom-k sketch: the ``k`` distinct values
+with the smallest 64-bit hashes. A bottom-k sketch is a uniform random sample
+of the distinct values, and it also estimates how many distinct values there
+were (the KMV estimator). Sketches merge by keeping the ``k`` smallest hashes
+of their union, so the result does not depend on how the input was chunked
+or how many workers ran.
+
+Important functions:
+- `expand_inputs(patterns)` - files named by paths and globs
+- `harvest(lex_rules, paths, jobs)` - ``{token: TokenSketch}`` over all inputs
+- `harvest_token_files(lex_rules, def_file, patterns, jobs)` - write the files
+"""
+
+import glob
+import hashlib
+import heapq
+import mmap
+import os
+import sys
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+from typing import Dict, Iterable, Iterator, List, Optional, Tuple
+
+import generator
+from shard_parse import shard_ranges
+
+# Bytes of input per task; chunks end after a newline
+CHUNK_BYTES = 8 << 20
+
+# Hashes kept per token: samples are drawn from these, and the distinct
+# count estimate has a relative error of about 1/sqrt(SKETCH_SIZE - 2)
+SKETCH_SIZE = 1024
+
+_HASH_RANGE = float(1 << 64)
+
+
+def value_hash(value: str) -> int:
+    """Stable 64-bit hash of a token value (the same in every process)."""
+
+    return int.from_bytes(hashlib.blake2b(value.encode('utf-8', 'surrogatepass'),
+                                          digest_size=8).digest(), 'little')
+
+
+class TokenSketch:
+    """Occurrence count and bottom-k sketch of one token's values."""
+
+    def __init__(self, size: int = SKETCH_SIZE):
+        self.size = size
+        self.count = 0
+        self.entries: Dict[int, str] = {}
+
+    def add_values(self, values: Iterable[str], count: int):
+        """Add distinct ``values`` seen ``count`` times in total."""
+
+        self.count += count
+        self._keep(list(self.entries.items()) + [(value_hash(value), value) for value in values])
+
+    def merge(self, other: 'TokenSketch'):
+        self.count += other.count
+        self._keep(list(self.entries.items()) + list(other.entries.items()))
+
+    def _keep(self, entries: List[Tuple[int, str]]):
+        if len(entries) > self.size:
+            entries = heapq.nsmallest(self.size, entries)
+        self.entries = dict(entries)
+
+    def samples(self, limit: int) -> List[str]:
+        """Up to ``limit`` distinct values, uniformly sampled, in hash order."""
+
+        return [self.entries[key] for key in sorted(self.entries)[:limit]]
+
+    def distinct(self) -> int:
+        """Number of distinct values: exact below ``size``, else a KMV estimate."""
+
+        if len(self.entries) < self.size:
+            return len(self.entries)
+        return round((self.size - 1) * _HASH_RANGE / (max(self.entries) + 1))
+
+
+def expand_inputs(patterns: Iterable[str]) -> List[str]:
+    """Expand paths and glob patterns (``**`` included) into existing files.
+
+    Files come back sorted and without duplicates; patterns that match
+    nothing are reported.
+    """
+
+    paths = []
+    for pattern in patterns:
+        matches = [path for path in glob.glob(pattern, recursive=True) if os.path.isfile(path)]
+        if not matches:
+            print(f'Warning: no input files match {pattern}')
+        paths.extend(matches)
+    return sorted(set(paths))
+
+
+def plan_chunks(paths: Iterable[str], chunk_bytes: int = CHUNK_BYTES) -> Iterator[Tuple[str, int, int]]:
+    """Yield ``(path, start, end)`` chunks of every non-empty file."""
+
+    for path in paths:
+        with open(path, 'rb') as f:
+            if not os.fstat(f.fileno()).st_size:
+                continue
+            with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as data:
+                ranges = shard_ranges(data, 1, max_bytes=chunk_bytes)
+        for start, end in ranges:
+            yield path, start, end
+
+
+# Scanner of the current process, built once by _init_worker
+_scanner: Optional[generator.TokenScanner] = None
+_tokens = frozenset()
+
+
+def _init_worker(lex_rules: List[generator.LexRule], tokens: List[str]):
+    global _scanner, _tokens
+    _scanner = generator.TokenScanner(lex_rules)
+    _tokens = frozenset(tokens)
+
+
+def _scan_chunk(chunk: Tuple[str, int, int]) -> Dict[str, TokenSketch]:
+    path, start, end = chunk
+    with open(path, 'rb') as f:
+        with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as data:
+            text = data[start:end].decode('utf-8', 'replace')
+
+    tokens = _tokens
+    # Duplicates are dropped here so each distinct value is hashed once
+    values: Dict[str, Dict[str, None]] = {token: {} for token in tokens}
+    counts = dict.fromkeys(tokens, 0)
+    for token_name, value in _scanner.scan(text):
+        if token_name in tokens:
+            values[token_name][value] = None
+            counts[token_name] += 1
+
+    sketches = {}
+    for token, seen in values.items():
+        if counts[token]:
+            sketch = sketches[token] = TokenSketch()
+            sketch.add_values(seen, counts[token])
+    return sketches
+
+
+def harvest(lex_rules: List[generator.LexRule], paths: Iterable[str], jobs: int = 0,
+            chunk_bytes: int = CHUNK_BYTES) -> Dict[str, TokenSketch]:
+    """Sketch the values of every sampled token over all of ``paths``.
+
+    Tokens in `generator.SKIP_TOKEN_SAMPLES` are scanned but not sketched.
+    ``jobs`` worker processes are used (default: one per core); with one job
+    everything runs in this process.
+    """
+
+    tokens = list(dict.fromkeys(
+        rule.token_name for rule in lex_rules
+        if rule.token_name.upper() not in generator.SKIP_TOKEN_SAMPLES))
+    chunks = plan_chunks(paths, chunk_bytes)
+    jobs = jobs or os.cpu_count() or 1
+
+    merged = {token: TokenSketch() for token in tokens}
+
+    def merge(results):
+        for sketches in results:
+            for token, sketch in sketches.items():
+                merged[token].merge(sketch)
+
+    if jobs == 1:
+        _init_worker(lex_rules, tokens)
+        merge(map(_scan_chunk, chunks))
+    else:
+        with ProcessPoolExecutor(max_workers=jobs, initializer=_init_worker,
+                                 initargs=(lex_rules, tokens)) as executor:
+            merge(executor.map(_scan_chunk, chunks))
+    return merged
+
+
+def harvest_token_files(lex_rules: List[generator.LexRule], def_file: str,
+                        patterns: Iterable[str], jobs: int = 0,
+                        max_samples: int = generator.MAX_TOKEN_SAMPLES,
+                        output_dir: Optional[str] = None) -> int:
+    """Replace the analyzer's ``*_tokens.txt`` with samples from ``patterns``.
+
+    Files go next to ``def_file`` unless ``output_dir`` is given. Prints the
+    occurrence and distinct-value count of each token and returns the number
+    of files written.
+    """
+
+    paths = expand_inputs(patterns)
+    if not paths:
+        print('No input files to harvest; skipping token generation.')
+        return 0
+
+    sketches = harvest(lex_rules, paths, jobs)
+    output_dir = Path(output_dir) if output_dir else Path(def_file).parent
+    generator.remove_token_files(output_dir)
+
+    files_created = 0
+    for token, sketch in sketches.items():
+        if not sketch.count:
+            continue
+        print(f'  {token:<24} {sketch.count:>12,} occurrences {sketch.distinct():>10,} distinct')
+        if generator.write_token_file(output_dir, token, sketch.samples(max_samples)):
+            files_created += 1
+
+    print(f'Generated {files_created} token example file(s) in {output_dir} '
+          f'from {len(paths)} input file(s)')
+    return files_created
+
+
+def main():
+    import argparse
+
+    parser = argparse.ArgumentParser(description='Harvest token samples from many inputs')
+    parser.add_argument('def_file', help='Analyzer .def file')
+    parser.add_argument('inputs', nargs='+', help='Input files or glob patterns (quote them)')
+    parser.add_argument('-j', '--jobs', type=int, default=0,
+                        help='Worker processes (default: number of cores)')
+    parser.add_argument('--samples', type=int, default=generator.MAX_TOKEN_SAMPLES,
+                        help=f'Samples per token (default: {generator.MAX_TOKEN_SAMPLES})')
+    parser.add_argument('-o', '--output-dir',
+                        help='Directory for the token files (default: next to the .def file)')
+
+    args = parser.parse_args()
+
+    lex_rules, _, _ = generator.parse_def_file(args.def_file)
+    files = harvest_token_files(lex_rules, args.def_file, args.inputs, args.jobs,
+                                args.samples, args.output_dir)
+    return 0 if files else 1
+
+
+if __name__ == '__main__':
+    sys.exit(main())
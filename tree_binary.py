@@ -0,0 +1,268 @@
+#!/usr/bin/env python3
+"""
+tree_binary.py
+--------------
+Reader for the compact binary parse-tree format written by
+``custom_compiler --format binary`` (see ``write_ast_binary`` in ``ast.c``).
+
+The whole document is decoded from a single ``memoryview``: node records are
+exposed as an unsigned-int view over the original buffer and values are only
+decoded when asked for, so no per-line or per-node strings are created up
+front. Files are memory-mapped rather than read.
+
+Analyzers with ``%record`` rules stream one document per record, so a file
+may hold several trees back to back; `iter_trees` walks them in order.
+
+Important functions:
+- `is_binary_tree(data)` - cheap magic-number check
+- `BinaryTree` - random access to node types, child counts and values
+- `iter_trees(data)` - every tree in a stream of concatenated documents
+- `read_trees(stream)` - read documents from a pipe one at a time
+- `load_binary_tree(path)` - memory-map a file and wrap it in `BinaryTree`
+- `load_binary_trees(path)` - memory-map a file holding one or more trees
+- `write_merged_tree(trees, out)` - join several trees under one root
+"""
+
+import mmap
+import struct
+import sys
+from array import array
+from typing import BinaryIO, Iterator, List, Optional, Sequence, Tuple
+
+
+MAGIC = b'CFGT'
+VERSION = 1
+NO_VALUE = 0xFFFFFFFF
+
+HEADER = struct.Struct('<4sIIII')
+RECORD_WORDS = 4
+
+
+def is_binary_tree(data) -> bool:
+    """Return True if ``data`` starts with the binary tree magic number."""
+
+    return bytes(data[:len(MAGIC)]) == MAGIC
+
+
+def document_size(header) -> int:
+    """Return the total byte size of the document whose header is ``header``."""
+
+    magic, version, type_count, node_count, strings_size = HEADER.unpack_from(header, 0)
+    return HEADER.size + node_count * RECORD_WORDS * 4 + type_count * 8 + strings_size
+
+
+def _u32_view(buffer: memoryview):
+    """View little-endian u32 data as integers without copying when possible."""
+
+    if sys.byteorder == 'little':
+        return buffer.cast('I')
+    # Big-endian hosts need a byteswapped copy
+    words = array('I', bytes(buffer))
+    words.byteswap()
+    return words
+
+
+class BinaryTree:
+    """Random-access view over one binary parse tree.
+
+    Node ``i`` is the i-th node in preorder. ``type_names`` is the (small)
+    decoded type name table; everything else stays inside the buffer.
+    """
+
+    def __init__(self, data):
+        self.buffer = memoryview(data)
+        if len(self.buffer) < HEADER.size or not is_binary_tree(self.buffer):
+            raise ValueError('not a binary parse tree')
+
+        magic, version, type_count, node_count, strings_size = HEADER.unpack_from(self.buffer, 0)
+        if version != VERSION:
+            raise ValueError(f'unsupported binary tree version {version}')
+
+        records_start = HEADER.size
+        types_start = records_start + node_count * RECORD_WORDS * 4
+        strings_start = types_start + type_count * 8
+        self.size = strings_start + strings_size
+        if len(self.buffer) < self.size:
+            raise ValueError('truncated binary parse tree')
+
+        self.node_count = node_count
+        self.records = _u32_view(self.buffer[records_start:types_start])
+        self.strings = self.buffer[strings_start:self.size]
+
+        type_table = _u32_view(self.buffer[types_start:strings_start])
+        self.type_names = [
+            str(self.strings[type_table[2 * i]:type_table[2 * i] + type_table[2 * i + 1]], 'utf-8')
+            for i in range(type_count)
+        ]
+
+    def __len__(self) -> int:
+        return self.node_count
+
+    def type_id(self, index: int) -> int:
+        return self.records[index * RECORD_WORDS]
+
+    def type_name(self, index: int) -> str:
+        return self.type_names[self.records[index * RECORD_WORDS]]
+
+    def num_children(self, index: int) -> int:
+        return self.records[index * RECORD_WORDS + 1]
+
+    def value_span(self, index: int) -> Optional[Tuple[int, int]]:
+        """Return ``(offset, length)`` of the value in ``strings`` or None."""
+
+        offset = self.records[index * RECORD_WORDS + 2]
+        if offset == NO_VALUE:
+            return None
+        return offset, self.records[index * RECORD_WORDS + 3]
+
+    def value(self, index: int) -> Optional[str]:
+        span = self.value_span(index)
+        if span is None:
+            return None
+        offset, length = span
+        return str(self.strings[offset:offset + length], 'utf-8', 'replace')
+
+    def iter_nodes(self) -> Iterator[Tuple[str, Optional[str], int]]:
+        """Yield ``(type_name, value, depth)`` for every node in preorder."""
+
+        records = self.records
+        names = self.type_names
+        strings = self.strings
+        # Remaining children to visit for every open ancestor
+        pending = []
+
+        for index in range(self.node_count):
+            base = index * RECORD_WORDS
+            depth = len(pending)
+            offset = records[base + 2]
+            value = None
+            if offset != NO_VALUE:
+                value = str(strings[offset:offset + records[base + 3]], 'utf-8', 'replace')
+            yield names[records[base]], value, depth
+
+            if pending:
+                pending[-1] -= 1
+            children = records[base + 1]
+            if children:
+                pending.append(children)
+            else:
+                while pending and pending[-1] == 0:
+                    pending.pop()
+
+
+def iter_trees(data) -> Iterator[BinaryTree]:
+    """Yield each tree of a buffer holding one or more documents back to back."""
+
+    buffer = memoryview(data)
+    offset = 0
+    while offset < len(buffer):
+        tree = BinaryTree(buffer[offset:])
+        yield tree
+        offset += tree.size
+
+
+def read_trees(stream: BinaryIO, head: bytes = b'') -> Iterator[BinaryTree]:
+    """Yield trees read one document at a time from ``stream``.
+
+    ``head`` holds bytes already consumed from the stream (e.g. while sniffing
+    the magic number). Only one document is held in memory at a time, so a
+    streaming analyzer can be followed as it writes.
+    """
+
+    pending = head
+    while True:
+        pending += stream.read(HEADER.size - len(pending))
+        if not pending:
+            return
+        if len(pending) < HEADER.size or not is_binary_tree(pending):
+            raise ValueError('not a binary parse tree')
+        size = document_size(pending)
+        data = pending + stream.read(size - len(pending))
+        yield BinaryTree(data)
+        pending = b''
+
+
+def _map_file(path: str):
+    with open(path, 'rb') as f:
+        return mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+
+def load_binary_tree(path: str) -> BinaryTree:
+    """Memory-map ``path`` and return the (first) tree it contains."""
+
+    return BinaryTree(_map_file(path))
+
+
+def load_binary_trees(path: str) -> List[BinaryTree]:
+    """Memory-map ``path`` and return every tree it contains."""
+
+    return list(iter_trees(_map_file(path)))
+
+
+def _to_le(words: array) -> bytes:
+    if sys.byteorder != 'little':
+        words = array('I', words)
+        words.byteswap()
+    return words.tobytes()
+
+
+def write_merged_tree(trees: Sequence[BinaryTree], out: BinaryIO) -> int:
+    """Write ``trees`` as one document whose root adopts every tree's children.
+
+    The root takes the type and value of the first tree's root; the other
+    roots are dropped and their children follow in order. Type ids are
+    remapped onto the union of the type tables and value offsets are shifted
+    into the combined string section. Returns the number of bytes written.
+    Record roots of a ``%record`` stream would be lost this way, so callers
+    pass one tree per parsed input (see ``shard_parse.merge_binary``).
+    """
+
+    if not trees:
+        raise ValueError('no trees to merge')
+
+    type_names: List[str] = []
+    type_ids = {}
+    for tree in trees:
+        for name in tree.type_names:
+            if name not in type_ids:
+                type_ids[name] = len(type_names)
+                type_names.append(name)
+    encoded_names = [name.encode('utf-8') for name in type_names]
+
+    first = trees[0]
+    node_count = 1 + sum(len(tree) - 1 for tree in trees)
+    strings_size = sum(len(tree.strings) for tree in trees) + sum(map(len, encoded_names))
+    out.write(HEADER.pack(MAGIC, VERSION, len(type_names), node_count, strings_size))
+
+    # Node records: the shared root, then every tree minus its root
+    root = array('I', first.records[:RECORD_WORDS])
+    root[0] = type_ids[first.type_names[root[0]]]
+    root[1] = sum(tree.num_children(0) for tree in trees if len(tree))
+    out.write(_to_le(root))
+
+    string_base = 0
+    for tree in trees:
+        records = array('I', tree.records[RECORD_WORDS:])
+        remap = [type_ids[name] for name in tree.type_names]
+        if remap != list(range(len(remap))):
+            records[0::RECORD_WORDS] = array('I', map(remap.__getitem__, records[0::RECORD_WORDS]))
+        if string_base:
+            records[2::RECORD_WORDS] = array('I', (
+                offset if offset == NO_VALUE else offset + string_base
+                for offset in records[2::RECORD_WORDS]
+            ))
+        out.write(_to_le(records))
+        string_base += len(tree.strings)
+
+    # Type names go after every tree's strings so value offsets stay valid
+    table = array('I')
+    name_offset = string_base
+    for name in encoded_names:
+        table.extend((name_offset, len(name)))
+        name_offset += len(name)
+    out.write(_to_le(table))
+    for tree in trees:
+        out.write(tree.strings)
+    for name in encoded_names:
+        out.write(name)
+    return HEADER.size + node_count * RECORD_WORDS * 4 + len(table) * 4 + strings_size
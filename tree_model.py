@@ -0,0 +1,411 @@
+#!/usr/bin/env python3
+"""
+tree_model.py
+-------------
+Array-backed parse tree shared by the terminal and web visualizers.
+
+A tree is stored column-wise: one ``array`` per attribute (type id, value
+span, depth, parent, first child, next sibling, subtree size) instead of one
+Python object per node. A node is just an index in preorder, so a tree with
+millions of nodes costs a few dozen bytes per node, and parent, child and
+sibling queries are single array lookups. Token values are concatenated into
+one string and addressed by offset and length.
+
+Several top-level trees (e.g. one per ``%record`` of a streaming analyzer)
+form a forest: roots have parent -1 and are chained through ``next_sibling``.
+
+`TreeModel.splice` replaces some top-level trees of a forest in place, with
+whole-column operations, so one re-parsed record of a large document is
+swapped in without rebuilding the model.
+
+Large trees are drawn at a level of detail: `TreeModel.frontier` picks the
+nodes to show and the subtrees to fold into summary nodes, so a renderer
+only ever receives a bounded number of nodes.
+
+Important functions:
+- `iter_tree_section(lines)` - lines after the ``=== Parse Tree ===`` marker
+- `iter_text_rows(lines)` - ``(type, value, indent)`` rows from indented text
+- `TreeModel.from_text(lines)` / `from_binary(data)` / `from_rows(rows)`
+- `TreeModel.splice(start, stop, other)` - replace top-level trees in place
+- `TreeModel.frontier(expanded)` - visible nodes for level-of-detail drawing
+"""
+
+from array import array
+from collections import Counter, deque
+from typing import Collection, Iterable, Iterator, List, Optional, Tuple
+
+import tree_binary
+
+
+TREE_MARKER = '=== Parse Tree ==='
+
+NO_NODE = -1
+
+# Children always shown when a node is opened explicitly, even over budget
+MIN_OPEN_CHILDREN = 20
+
+
+def iter_tree_section(lines: Iterable[str]) -> Iterator[str]:
+    """Yield the lines of the parse-tree section of compiler output.
+
+    Lines after the `=== Parse Tree ===` marker are passed through as they
+    arrive. Lines seen before the marker are held back; if the input ends
+    without a marker they are yielded instead, treating all input as tree.
+    """
+
+    lines = iter(lines)
+    preamble = []
+    for line in lines:
+        if TREE_MARKER in line:
+            break
+        if line.strip():
+            preamble.append(line)
+    else:
+        yield from preamble
+        return
+
+    preamble.clear()
+    yield from lines
+
+
+def iter_text_rows(lines: Iterable[str]) -> Iterator[Tuple[str, Optional[str], int]]:
+    """Parse ``print_ast()`` lines into ``(type, value, indent)`` rows.
+
+    Each line is either ``Nonterminal`` or ``TOKEN: value``; leading spaces
+    give the nesting. Blank lines are skipped.
+    """
+
+    for line in lines:
+        line = line.rstrip('\n')
+        content = line.strip()
+        if not content:
+            continue
+
+        indent = len(line) - len(line.lstrip())
+        if ': ' in content:
+            node_type, value = content.split(': ', 1)
+            yield node_type, value, indent
+        else:
+            yield content, None, indent
+
+
+def _shifted(column: array, offset: int) -> array:
+    """Copy of ``column`` with ``offset`` added to every entry but `NO_NODE`."""
+
+    if not offset:
+        return array('i', column)
+    # keep.get(entry, entry + offset), element-wise without a Python loop
+    keep = {NO_NODE: NO_NODE}
+    return array('i', map(keep.get, column, map(offset.__add__, column)))
+
+
+class Frontier:
+    def __init__(self):
+        self.nodes: List[int] = []
+        self.collapsed = set()
+        self.hidden_children = {}
+        self.hidden_roots = 0
+
+    # ``Frontier`` is the visible part of a tree: ``nodes`` in breadth-first
+    # order, the subset of them drawn as summaries of their ``collapsed``
+    # subtrees, how many children of an opened node did not fit
+    # (``hidden_children``) and how many top-level trees were left out.
+
+
+class TreeModel:
+    """A parse tree (or forest) stored as parallel arrays indexed by node.
+
+    Columns, all ``array('i')`` of length ``len(model)``:
+
+    - ``types`` - index into ``type_names``
+    - ``value_start`` / ``value_length`` - span in ``values``; start is -1
+      for nodes without a value
+    - ``depth`` - 0 for roots
+    - ``parent``, ``first_child``, ``next_sibling`` - node indices or -1
+    - ``subtree_size`` - number of nodes in the subtree, including the node
+    """
+
+    def __init__(self):
+        self.type_names: List[str] = []
+        self.type_ids = {}
+        self.values = ''
+        self.types = array('i')
+        self.value_start = array('i')
+        self.value_length = array('i')
+        self.depth = array('i')
+        self.parent = array('i')
+        self.first_child = array('i')
+        self.next_sibling = array('i')
+        self.subtree_size = array('i')
+
+    @classmethod
+    def from_rows(cls, rows: Iterable[Tuple[str, Optional[str], int]]) -> 'TreeModel':
+        """Build a model from preorder ``(type, value, level)`` rows.
+
+        ``level`` may be a depth or a text indent: a node's parent is the
+        closest preceding node with a strictly smaller level. This is the
+        single pass that fills every column except ``subtree_size``, which is
+        accumulated bottom-up afterwards.
+        """
+
+        model = cls()
+        type_ids = model.type_ids
+        type_names = model.type_names
+        types = model.types
+        value_start = model.value_start
+        value_length = model.value_length
+        depth = model.depth
+        parent = model.parent
+        first_child = model.first_child
+        next_sibling = model.next_sibling
+
+        value_parts = []
+        value_end = 0
+        # Open ancestors as (index, level) and the last child seen under each
+        open_nodes: List[Tuple[int, int]] = []
+        last_child = {NO_NODE: NO_NODE}
+
+        for index, (node_type, value, level) in enumerate(rows):
+            type_id = type_ids.get(node_type)
+            if type_id is None:
+                type_id = type_ids[node_type] = len(type_names)
+                type_names.append(node_type)
+            types.append(type_id)
+
+            if value is None:
+                value_start.append(NO_NODE)
+                value_length.append(0)
+            else:
+                value_start.append(value_end)
+                value_length.append(len(value))
+                value_parts.append(value)
+                value_end += len(value)
+
+            while open_nodes and open_nodes[-1][1] >= level:
+                del last_child[open_nodes.pop()[0]]
+            parent_index = open_nodes[-1][0] if open_nodes else NO_NODE
+
+            depth.append(len(open_nodes))
+            parent.append(parent_index)
+            first_child.append(NO_NODE)
+            next_sibling.append(NO_NODE)
+
+            previous = last_child[parent_index]
+            if previous == NO_NODE:
+                if parent_index != NO_NODE:
+                    first_child[parent_index] = index
+            else:
+                next_sibling[previous] = index
+            last_child[parent_index] = index
+
+            open_nodes.append((index, level))
+            last_child[index] = NO_NODE
+
+        model.values = ''.join(value_parts)
+
+        # Children follow their parent in preorder, so one reverse sweep
+        # finishes every subtree before its parent is reached.
+        sizes = array('i', [1]) * len(types)
+        for index in range(len(types) - 1, -1, -1):
+            parent_index = parent[index]
+            if parent_index != NO_NODE:
+                sizes[parent_index] += sizes[index]
+        model.subtree_size = sizes
+        return model
+
+    @classmethod
+    def from_text(cls, lines: Iterable[str]) -> 'TreeModel':
+        """Build a model from ``print_ast()`` text (marker optional)."""
+
+        return cls.from_rows(iter_text_rows(iter_tree_section(lines)))
+
+    @classmethod
+    def from_binary(cls, data) -> 'TreeModel':
+        """Build a model from one or more concatenated binary documents."""
+
+        return cls.from_rows(
+            row
+            for tree in tree_binary.iter_trees(data)
+            for row in tree.iter_nodes()
+        )
+
+    @classmethod
+    def from_output(cls, output) -> 'TreeModel':
+        """Build a model from compiler stdout in either format."""
+
+        if tree_binary.is_binary_tree(output):
+            return cls.from_binary(output)
+        if isinstance(output, (bytes, bytearray, memoryview)):
+            output = bytes(output).decode('utf-8', 'replace')
+        return cls.from_text(output.splitlines())
+
+    def __len__(self) -> int:
+        return len(self.types)
+
+    def nbytes(self) -> int:
+        """Approximate memory held by the columns and the value text."""
+
+        columns = (self.types, self.value_start, self.value_length, self.depth,
+                   self.parent, self.first_child, self.next_sibling, self.subtree_size)
+        return sum(column.itemsize * len(column) for column in columns) + len(self.values)
+
+    def type_name(self, index: int) -> str:
+        return self.type_names[self.types[index]]
+
+    def value(self, index: int) -> Optional[str]:
+        start = self.value_start[index]
+        if start == NO_NODE:
+            return None
+        return self.values[start:start + self.value_length[index]]
+
+    def is_last_child(self, index: int) -> bool:
+        return self.next_sibling[index] == NO_NODE
+
+    def children(self, index: int) -> Iterator[int]:
+        child = self.first_child[index]
+        while child != NO_NODE:
+            yield child
+            child = self.next_sibling[child]
+
+    def roots(self) -> Iterator[int]:
+        root = 0 if len(self) else NO_NODE
+        while root != NO_NODE:
+            yield root
+            root = self.next_sibling[root]
+
+    def rows(self) -> Iterator[Tuple[str, Optional[str], int]]:
+        """Yield ``(type, value, depth)`` for every node in preorder."""
+
+        for index in range(len(self)):
+            yield self.type_name(index), self.value(index), self.depth[index]
+
+    def _value_offset(self, index: int) -> int:
+        """Offset in ``values`` where the text of nodes ``index..`` begins."""
+
+        value_start = self.value_start
+        for position in range(index, len(value_start)):
+            if value_start[position] != NO_NODE:
+                return value_start[position]
+        return len(self.values)
+
+    def splice(self, start: int, stop: int, other: 'TreeModel'):
+        """Replace the top-level trees in nodes ``[start, stop)`` by the forest ``other``.
+
+        ``start`` and ``stop`` must each be a root or ``len(self)``. The
+        columns are rewritten with slice assignments and element-wise
+        ``map``: the cost grows with the node count, but at C speed, and the
+        Python-level work is proportional to ``other`` alone.
+        """
+
+        size = len(self)
+        count = len(other)
+        delta = count - (stop - start)
+        value_from = self._value_offset(start)
+        value_to = self._value_offset(stop)
+        value_delta = len(other.values) - (value_to - value_from)
+
+        # New index of the first tree after the splice, and the root before it
+        after = start + count if stop < size else NO_NODE
+        previous = start - 1 if start else NO_NODE
+        while previous != NO_NODE and self.parent[previous] != NO_NODE:
+            previous = self.parent[previous]
+
+        type_ids = []
+        for name in other.type_names:
+            type_id = self.type_ids.get(name)
+            if type_id is None:
+                type_id = self.type_ids[name] = len(self.type_names)
+                self.type_names.append(name)
+            type_ids.append(type_id)
+        next_sibling = _shifted(other.next_sibling, start)
+        if count:
+            last_root = count - 1
+            while other.parent[last_root] != NO_NODE:
+                last_root = other.parent[last_root]
+            next_sibling[last_root] = after
+
+        self.types[start:stop] = array('i', map(type_ids.__getitem__, other.types))
+        self.value_length[start:stop] = other.value_length
+        self.depth[start:stop] = other.depth
+        self.subtree_size[start:stop] = other.subtree_size
+        self.value_start[start:] = (_shifted(other.value_start, value_from)
+                                    + _shifted(self.value_start[stop:], value_delta))
+        self.parent[start:] = _shifted(other.parent, start) + _shifted(self.parent[stop:], delta)
+        self.first_child[start:] = (_shifted(other.first_child, start)
+                                    + _shifted(self.first_child[stop:], delta))
+        self.next_sibling[start:] = next_sibling + _shifted(self.next_sibling[stop:], delta)
+        self.values = self.values[:value_from] + other.values + self.values[value_to:]
+        if previous != NO_NODE:
+            self.next_sibling[previous] = start if count else after
+
+    def subtree_type_mix(self, index: int, top: int = 3) -> List[Tuple[str, int]]:
+        """Return the ``top`` most common types below ``index``.
+
+        A subtree is a contiguous preorder range, so this is one slice of the
+        ``types`` column counted in C.
+        """
+
+        start = index + 1
+        counts = Counter(self.types[start:index + self.subtree_size[index]])
+        return [(self.type_names[type_id], count) for type_id, count in counts.most_common(top)]
+
+    def frontier(self, expanded: Collection[int] = (), threshold: int = 50,
+                 max_nodes: int = 300) -> Frontier:
+        """Choose the nodes to draw for a level-of-detail view.
+
+        Nodes are opened breadth-first. Nodes whose subtree has at most
+        ``threshold`` nodes are opened while the view stays within
+        ``max_nodes``; every other node with children is shown collapsed.
+        Roots and nodes in ``expanded`` are always opened, so the user can
+        drill into any summary, but they show at most the remaining budget
+        (and no fewer than `MIN_OPEN_CHILDREN`) of their children; the rest
+        are counted in ``hidden_children``.
+        """
+
+        view = Frontier()
+        queue = deque()
+        shown = 0
+        for root in self.roots():
+            if shown >= max_nodes:
+                view.hidden_roots += 1
+                continue
+            queue.append(root)
+            shown += 1
+
+        first_child = self.first_child
+        next_sibling = self.next_sibling
+        subtree_size = self.subtree_size
+        parent = self.parent
+        while queue:
+            index = queue.popleft()
+            view.nodes.append(index)
+            child = first_child[index]
+            if child == NO_NODE:
+                continue
+
+            forced = index in expanded or parent[index] == NO_NODE
+            if forced:
+                room = max(max_nodes - shown, MIN_OPEN_CHILDREN)
+            elif subtree_size[index] <= threshold:
+                room = max_nodes - shown
+            else:
+                room = 0
+
+            # Open only if every child fits, unless the user asked for it
+            children = []
+            while child != NO_NODE and len(children) < room:
+                children.append(child)
+                child = next_sibling[child]
+            hidden = 0
+            while child != NO_NODE:
+                hidden += 1
+                child = next_sibling[child]
+
+            if hidden and not forced:
+                view.collapsed.add(index)
+                continue
+            if hidden:
+                view.hidden_children[index] = hidden
+            queue.extend(children)
+            shown += len(children)
+        return view
@@ -0,0 +1,164 @@
+#!/usr/bin/env python3
+"""
+tree_stats.py
+-------------
+Single-pass statistics over a parse tree, shared by both visualizers.
+
+`TreeStats` consumes preorder ``(type, value, level)`` rows, the same rows
+produced by `tree_model.iter_text_rows`, the binary reader and
+`TreeModel.rows`, and updates every counter as each node goes by. Work per
+node is a handful of dictionary and list updates; anything that depends on
+the type name only (such as "detected" pattern classification) is decided
+once per distinct type when the report is produced.
+
+Reported figures:
+- node, terminal, non-terminal and root counts, maximum depth
+- per-type node counts and "detected"/"found" pattern counts
+- depth histogram and branching-factor (children per node) distribution
+- subtree-size mean and percentiles
+- distinct token values per token type
+
+Important functions:
+- `TreeStats.add(type, value, level)` / `observe(rows)` - feed rows
+- `collect(rows)` / `from_model(model)` - build a finished `TreeStats`
+- `TreeStats.to_dict()` - JSON-ready report
+"""
+
+from array import array
+from typing import Dict, Iterable, Iterator, Optional, Tuple
+
+PERCENTILES = (50, 90, 99)
+
+
+def is_detected_type(node_type: str) -> bool:
+    """True for node types that report a detected pattern."""
+
+    lowered = node_type.lower()
+    return 'detected' in lowered or 'found' in lowered
+
+
+class TreeStats:
+    """Running statistics for one tree or forest fed in preorder."""
+
+    def __init__(self):
+        self.node_count = 0
+        self.terminal_count = 0
+        self.root_count = 0
+        self.type_counts: Dict[str, int] = {}
+        self.depth_histogram = array('q')
+        self.branching: Dict[int, int] = {}
+        self.subtree_sizes = array('i')
+        self.values_by_type: Dict[str, set] = {}
+        # Open ancestors as [level, preorder index, child count]
+        self._open = []
+
+    def add(self, node_type: str, value: Optional[str], level: int):
+        """Account for the next node in preorder.
+
+        ``level`` is a depth or a text indent; the parent is the closest open
+        node with a smaller level, as in `tree_model.TreeModel.from_rows`.
+        """
+
+        stack = self._open
+        while stack and stack[-1][0] >= level:
+            self._close(stack.pop())
+        if stack:
+            stack[-1][2] += 1
+        else:
+            self.root_count += 1
+
+        depth = len(stack)
+        histogram = self.depth_histogram
+        while len(histogram) <= depth:
+            histogram.append(0)
+        histogram[depth] += 1
+
+        counts = self.type_counts
+        counts[node_type] = counts.get(node_type, 0) + 1
+        if value:
+            self.terminal_count += 1
+            values = self.values_by_type.get(node_type)
+            if values is None:
+                values = self.values_by_type[node_type] = set()
+            values.add(value)
+
+        stack.append([level, self.node_count, 0])
+        self.node_count += 1
+
+    def _close(self, frame):
+        level, start, children = frame
+        self.subtree_sizes.append(self.node_count - start)
+        self.branching[children] = self.branching.get(children, 0) + 1
+
+    def finish(self) -> 'TreeStats':
+        """Close the nodes still open at the end of input."""
+
+        while self._open:
+            self._close(self._open.pop())
+        return self
+
+    def observe(self, rows: Iterable[Tuple[str, Optional[str], int]]) -> Iterator[Tuple[str, Optional[str], int]]:
+        """Pass ``rows`` through unchanged, counting each one."""
+
+        for row in rows:
+            self.add(*row)
+            yield row
+        self.finish()
+
+    @property
+    def nonterminal_count(self) -> int:
+        return self.node_count - self.terminal_count
+
+    @property
+    def max_depth(self) -> int:
+        return len(self.depth_histogram) - 1
+
+    def detected(self) -> Dict[str, int]:
+        """Counts of "detected"/"found" pattern node types."""
+
+        return {name: count for name, count in sorted(self.type_counts.items())
+                if is_detected_type(name)}
+
+    def subtree_size_summary(self) -> Dict[str, float]:
+        sizes = sorted(self.subtree_sizes)
+        if not sizes:
+            return {}
+        summary = {'mean': round(sum(sizes) / len(sizes), 3)}
+        for percentile in PERCENTILES:
+            rank = max(0, -(-percentile * len(sizes) // 100) - 1)
+            summary[f'p{percentile}'] = sizes[rank]
+        summary['max'] = sizes[-1]
+        return summary
+
+    def to_dict(self) -> dict:
+        """Return the full report as plain JSON-serialisable data."""
+
+        self.finish()
+        return {
+            'nodes': self.node_count,
+            'terminals': self.terminal_count,
+            'nonterminals': self.nonterminal_count,
+            'roots': self.root_count,
+            'max_depth': self.max_depth,
+            'type_counts': dict(sorted(self.type_counts.items(), key=lambda item: (-item[1], item[0]))),
+            'detected': self.detected(),
+            'depth_histogram': list(self.depth_histogram),
+            'branching': {str(children): count for children, count in sorted(self.branching.items())},
+            'subtree_size': self.subtree_size_summary(),
+            'value_cardinality': {name: len(values) for name, values in sorted(self.values_by_type.items())},
+        }
+
+
+def collect(rows: Iterable[Tuple[str, Optional[str], int]]) -> TreeStats:
+    """Compute statistics for preorder ``(type, value, level)`` rows."""
+
+    stats = TreeStats()
+    for node_type, value, level in rows:
+        stats.add(node_type, value, level)
+    return stats.finish()
+
+
+def from_model(model) -> TreeStats:
+    """Compute statistics for a `tree_model.TreeModel`."""
+
+    return collect(model.rows())
@@ -5,21 +5,40 @@ visualize_tree.py
 Command-line parse-tree visualizer used by `make run`.
 
 This script reads parse-tree textual output produced by the compiler
-executable (it looks for the marker `=== Parse Tree ===` by default) and
-renders a colorized, human-readable representation in the terminal. It
+executable (it looks for the marker `=== Parse Tree ===` by default), or the
+binary format from `custom_compiler --format binary`, and renders a colorized, human-readable representation in the terminal. It
 supports three styles (fancy, simple, compact) and a statistics mode.
 
+Input is processed as a stream: lines are read, parsed into nodes and
+rendered one at a time, and output is written in batches. Piping a large
+tree from `custom_compiler` therefore shows output immediately and runs in
+constant memory. The fancy style guesses whether a node is the last child of
+its parent from the next line; `--exact` instead loads the whole tree into
+the compact `tree_model.TreeModel` first and uses its real sibling links.
+
 Important functions:
-- `parse_tree_output` - converts indented text lines into internal nodes
-- `visualize_tree_*` - the presentation functions for different styles
-- `show_statistics` - computes and prints tree statistics
+- `iter_tree_nodes` - lazily converts indented text lines into nodes
+- `iter_binary_nodes` - lazily converts decoded binary trees into nodes
+- `render_*` / `visualize_tree_*` - the presentation functions for each style
+- `show_statistics` - prints tree statistics gathered by `tree_stats`
 """
 
 import sys
-import re
-from typing import List, Tuple, Optional
+import json
+import time
+from itertools import chain
+from typing import Iterable, Iterator, List, Tuple, Optional
+
+import tree_binary
+import tree_stats
+from tree_model import TreeModel, iter_text_rows, iter_tree_section
 
 
+# Rendered lines are written in batches of this many lines, or sooner when
+# input is slow to arrive (see `write_lines`).
+OUTPUT_BATCH_LINES = 512
+OUTPUT_FLUSH_SECONDS = 0.1
+
 # ANSI color codes
 class Colors:
     # Node type colors
@@ -45,45 +64,56 @@ class Colors:
     DIM = '\033[2m'
 
 class TreeNode:
+    __slots__ = ('node_type', 'value', 'indent_level')
+
     def __init__(self, node_type: str, value: Optional[str] = None, indent_level: int = 0):
         self.node_type = node_type
         self.value = value
         self.indent_level = indent_level
-        self.children = []
         
     def __repr__(self):
         if self.value:
             return f"{self.node_type}: {self.value}"
         return self.node_type
 
-def parse_tree_output(lines: List[str]) -> List[TreeNode]:
-    """Parse a list of lines into TreeNode objects.
+def iter_tree_nodes(lines: Iterable[str]) -> Iterator[TreeNode]:
+    """Lazily parse indented lines into TreeNode objects.
 
     Input format expected is the same as `print_ast()` output from `ast.c`:
     each line is either `Nonterminal` or `TOKEN: value` and indentation (spaces)
-    denotes tree nesting. This function is intentionally tolerant of small
-    formatting differences but assumes a consistent indent step.
+    denotes tree nesting (see `tree_model.iter_text_rows`).
     """
-    nodes = []
-    
-    for line in lines:
-        if not line.strip():
-            continue
-            
-        # Calculate indent level
-        indent = len(line) - len(line.lstrip())
-        content = line.strip()
-        
-        # Check if it has a value (contains :)
-        if ': ' in content:
-            parts = content.split(': ', 1)
-            node_type = parts[0]
-            value = parts[1]
-            nodes.append(TreeNode(node_type, value, indent))
-        else:
-            nodes.append(TreeNode(content, None, indent))
-    
-    return nodes
+    for node_type, value, indent in iter_text_rows(lines):
+        yield TreeNode(node_type, value, indent)
+
+def parse_tree_output(lines: List[str]) -> List[TreeNode]:
+    """Parse a list of lines into TreeNode objects (see `iter_tree_nodes`)."""
+    return list(iter_tree_nodes(lines))
+
+def iter_binary_rows(trees: Iterable[tree_binary.BinaryTree]) -> Iterator[Tuple[str, Optional[str], int]]:
+    """Yield `(type, value, indent)` rows from decoded binary parse trees.
+
+    Depth is converted to the two-spaces-per-level indent used by the text
+    format so every renderer works unchanged. Several trees (one per streamed
+    record) are listed one after another, each starting at depth 0.
+    """
+    for tree in trees:
+        for node_type, value, depth in tree.iter_nodes():
+            yield node_type, value, depth * 2
+
+def iter_binary_nodes(trees: Iterable[tree_binary.BinaryTree]) -> Iterator[TreeNode]:
+    """Lazily build TreeNode objects from decoded binary parse trees."""
+    for node_type, value, indent in iter_binary_rows(trees):
+        yield TreeNode(node_type, value, indent)
+
+def parse_binary_tree(trees: List[tree_binary.BinaryTree]) -> List[TreeNode]:
+    """Build a list of TreeNode objects from binary trees (see `iter_binary_nodes`)."""
+    return list(iter_binary_nodes(trees))
+
+def iter_model_nodes(model: TreeModel) -> Iterator[TreeNode]:
+    """Yield a TreeNode for every node of `model` in preorder."""
+    for node_type, value, depth in model.rows():
+        yield TreeNode(node_type, value, depth * 2)
 
 def get_node_color(node: TreeNode) -> str:
     """Return an ANSI color code string for a given node.
@@ -129,13 +159,34 @@ def get_tree_chars(is_last: bool, has_children: bool) -> Tuple[str, str]:
     else:
         return '├──', '│  '
 
-def visualize_tree_simple(nodes: List[TreeNode]):
+def write_lines(lines: Iterable[str], out=None):
+    """Write rendered lines to `out` (default stdout) in batches.
+
+    A batch is flushed once it holds `OUTPUT_BATCH_LINES` lines or when
+    `OUTPUT_FLUSH_SECONDS` have passed since the last flush, so slow producers
+    still see their output promptly.
+    """
+    out = out or sys.stdout
+    batch = []
+    last_flush = time.monotonic()
+    for line in lines:
+        batch.append(line)
+        if len(batch) >= OUTPUT_BATCH_LINES or time.monotonic() - last_flush >= OUTPUT_FLUSH_SECONDS:
+            out.write('\n'.join(batch) + '\n')
+            out.flush()
+            batch.clear()
+            last_flush = time.monotonic()
+    if batch:
+        out.write('\n'.join(batch) + '\n')
+    out.flush()
+
+def render_simple(nodes: Iterable[TreeNode]) -> Iterator[str]:
     """Simple colorful visualization"""
-    print(f"\n{Colors.HEADER}{'='*70}{Colors.RESET}")
-    print(f"{Colors.HEADER}{Colors.BOLD}  Parse Tree Visualization{Colors.RESET}")
-    print(f"{Colors.HEADER}{'='*70}{Colors.RESET}\n")
+    yield f"\n{Colors.HEADER}{'='*70}{Colors.RESET}"
+    yield f"{Colors.HEADER}{Colors.BOLD}  Parse Tree Visualization{Colors.RESET}"
+    yield f"{Colors.HEADER}{'='*70}{Colors.RESET}\n"
     
-    for i, node in enumerate(nodes):
+    for node in nodes:
         # Calculate tree structure
         indent_str = '  ' * (node.indent_level // 2)
         
@@ -145,95 +196,123 @@ def visualize_tree_simple(nodes: List[TreeNode]):
         # Build the line
         if node.value:
             # Terminal with value
-            line = f"{Colors.PIPE}{indent_str}{color}{node.node_type}{Colors.RESET} {Colors.ARROW}→{Colors.RESET} {Colors.VALUE}{node.value}{Colors.RESET}"
+            yield f"{Colors.PIPE}{indent_str}{color}{node.node_type}{Colors.RESET} {Colors.ARROW}→{Colors.RESET} {Colors.VALUE}{node.value}{Colors.RESET}"
         else:
             # Non-terminal
-            line = f"{Colors.PIPE}{indent_str}{color}{node.node_type}{Colors.RESET}"
-        
-        print(line)
+            yield f"{Colors.PIPE}{indent_str}{color}{node.node_type}{Colors.RESET}"
     
-    print(f"\n{Colors.HEADER}{'='*70}{Colors.RESET}\n")
+    yield f"\n{Colors.HEADER}{'='*70}{Colors.RESET}\n"
 
-def visualize_tree_fancy(nodes: List[TreeNode]):
-    """Fancy tree visualization with box drawing characters"""
-    print(f"\n{Colors.HEADER}╔{'═'*68}╗{Colors.RESET}")
-    print(f"{Colors.HEADER}║{Colors.BOLD}  Parse Tree Visualization{' '*43}║{Colors.RESET}")
-    print(f"{Colors.HEADER}╚{'═'*68}╝{Colors.RESET}\n")
+def render_fancy_line(node: TreeNode, is_last: bool) -> str:
+    """Render one node of the fancy style"""
+    # Calculate tree structure
+    base_indent = '  ' * (node.indent_level // 2)
     
-    # Build tree structure
-    for i, node in enumerate(nodes):
-        # Calculate tree structure
-        base_indent = '  ' * (node.indent_level // 2)
-        
-        # Determine if this is the last at its level (simple heuristic)
-        is_last = (i == len(nodes) - 1) or (i + 1 < len(nodes) and nodes[i + 1].indent_level <= node.indent_level)
-        
-        # Get tree characters
-        if node.indent_level > 0:
-            if is_last:
-                branch = '└─ '
-            else:
-                branch = '├─ '
-        else:
-            branch = ''
-        
-        # Get color
-        color = get_node_color(node)
-        
-        # Build the line
-        if node.value:
-            # Terminal with value
-            node_text = f"{color}{node.node_type}{Colors.RESET}"
-            value_text = f"{Colors.VALUE}{node.value}{Colors.RESET}"
-            line = f"{Colors.PIPE}{base_indent}{Colors.PIPE}{branch}{node_text} {Colors.ARROW}➜{Colors.RESET} {value_text}"
+    # Get tree characters
+    if node.indent_level > 0:
+        if is_last:
+            branch = '└─ '
         else:
-            # Non-terminal
-            node_text = f"{color}{node.node_type}{Colors.RESET}"
-            line = f"{Colors.PIPE}{base_indent}{Colors.PIPE}{branch}{node_text}"
-        
-        print(line)
+            branch = '├─ '
+    else:
+        branch = ''
+    
+    # Get color
+    color = get_node_color(node)
+    
+    # Build the line
+    node_text = f"{color}{node.node_type}{Colors.RESET}"
+    if node.value:
+        # Terminal with value
+        value_text = f"{Colors.VALUE}{node.value}{Colors.RESET}"
+        return f"{Colors.PIPE}{base_indent}{Colors.PIPE}{branch}{node_text} {Colors.ARROW}➜{Colors.RESET} {value_text}"
+    # Non-terminal
+    return f"{Colors.PIPE}{base_indent}{Colors.PIPE}{branch}{node_text}"
+
+def render_fancy(nodes: Iterable[TreeNode]) -> Iterator[str]:
+    """Fancy tree visualization with box drawing characters"""
+    yield f"\n{Colors.HEADER}╔{'═'*68}╗{Colors.RESET}"
+    yield f"{Colors.HEADER}║{Colors.BOLD}  Parse Tree Visualization{' '*43}║{Colors.RESET}"
+    yield f"{Colors.HEADER}╚{'═'*68}╝{Colors.RESET}\n"
+    
+    # Whether a node is the last at its level is guessed from the next node
+    # (simple heuristic), so rendering lags the input by one node.
+    previous = None
+    for node in nodes:
+        if previous is not None:
+            yield render_fancy_line(previous, node.indent_level <= previous.indent_level)
+        previous = node
+    if previous is not None:
+        yield render_fancy_line(previous, True)
     
-    print(f"\n{Colors.DIM}{'─'*70}{Colors.RESET}\n")
+    yield f"\n{Colors.DIM}{'─'*70}{Colors.RESET}\n"
 
-def visualize_tree_compact(nodes: List[TreeNode]):
+def render_fancy_model(model: TreeModel) -> Iterator[str]:
+    """Fancy visualization using the real sibling links of a TreeModel"""
+    yield f"\n{Colors.HEADER}╔{'═'*68}╗{Colors.RESET}"
+    yield f"{Colors.HEADER}║{Colors.BOLD}  Parse Tree Visualization{' '*43}║{Colors.RESET}"
+    yield f"{Colors.HEADER}╚{'═'*68}╝{Colors.RESET}\n"
+    
+    for index, node in enumerate(iter_model_nodes(model)):
+        yield render_fancy_line(node, model.is_last_child(index))
+    
+    yield f"\n{Colors.DIM}{'─'*70}{Colors.RESET}\n"
+
+def render_compact(nodes: Iterable[TreeNode]) -> Iterator[str]:
     """Compact visualization showing only important nodes"""
-    print(f"\n{Colors.HEADER}┌{'─'*68}┐{Colors.RESET}")
-    print(f"{Colors.HEADER}│{Colors.BOLD}  Parse Tree (Compact View){' '*42}│{Colors.RESET}")
-    print(f"{Colors.HEADER}└{'─'*68}┘{Colors.RESET}\n")
+    yield f"\n{Colors.HEADER}┌{'─'*68}┐{Colors.RESET}"
+    yield f"{Colors.HEADER}│{Colors.BOLD}  Parse Tree (Compact View){' '*42}│{Colors.RESET}"
+    yield f"{Colors.HEADER}└{'─'*68}┘{Colors.RESET}\n"
     
-    # Filter out some common non-informative nodes
-    filtered_nodes = []
     for node in nodes:
         # Keep detected patterns, terminals with values, and top-level nodes
-        if (node.value or 
-            'detected' in node.node_type.lower() or 
-            'found' in node.node_type.lower() or
-            node.indent_level == 0):
-            filtered_nodes.append(node)
-    
-    for node in filtered_nodes:
+        if not (node.value or 
+                'detected' in node.node_type.lower() or 
+                'found' in node.node_type.lower() or
+                node.indent_level == 0):
+            continue
+        
         indent_str = '  ' * (node.indent_level // 2)
         color = get_node_color(node)
         
         if node.value:
-            print(f"{indent_str}{color}▸ {node.node_type}{Colors.RESET}: {Colors.VALUE}{node.value}{Colors.RESET}")
+            yield f"{indent_str}{color}▸ {node.node_type}{Colors.RESET}: {Colors.VALUE}{node.value}{Colors.RESET}"
         else:
-            print(f"{indent_str}{color}▪ {node.node_type}{Colors.RESET}")
+            yield f"{indent_str}{color}▪ {node.node_type}{Colors.RESET}"
     
-    print(f"\n{Colors.DIM}{'─'*70}{Colors.RESET}\n")
+    yield f"\n{Colors.DIM}{'─'*70}{Colors.RESET}\n"
 
-def show_statistics(nodes: List[TreeNode]):
-    """Show statistics about the parse tree"""
-    total_nodes = len(nodes)
-    terminals = sum(1 for n in nodes if n.value)
-    nonterminals = total_nodes - terminals
-    
-    # Count detected patterns
-    detected = {}
-    for node in nodes:
-        if 'detected' in node.node_type.lower() or 'found' in node.node_type.lower():
-            key = node.node_type
-            detected[key] = detected.get(key, 0) + 1
+RENDERERS = {
+    'simple': render_simple,
+    'fancy': render_fancy,
+    'compact': render_compact,
+}
+
+def visualize_tree_simple(nodes: Iterable[TreeNode]):
+    write_lines(render_simple(nodes))
+
+def visualize_tree_fancy(nodes):
+    if isinstance(nodes, TreeModel):
+        write_lines(render_fancy_model(nodes))
+    else:
+        write_lines(render_fancy(nodes))
+
+def visualize_tree_compact(nodes: Iterable[TreeNode]):
+    write_lines(render_compact(nodes))
+
+def show_statistics(stats):
+    """Show statistics about the parse tree.
+
+    `stats` is a `tree_stats.TreeStats` (typically filled while the tree was
+    rendered) or an iterable of TreeNode objects.
+    """
+    if not isinstance(stats, tree_stats.TreeStats):
+        stats = tree_stats.collect((node.node_type, node.value, node.indent_level) for node in stats)
+    total_nodes = stats.node_count
+    terminals = stats.terminal_count
+    nonterminals = stats.nonterminal_count
+    max_depth = stats.max_depth
+    detected = stats.detected()
     
     print(f"{Colors.HEADER}╔{'═'*68}╗{Colors.RESET}")
     print(f"{Colors.HEADER}║{Colors.BOLD}  Statistics{' '*57}║{Colors.RESET}")
@@ -241,6 +320,7 @@ def show_statistics(nodes: List[TreeNode]):
     print(f"{Colors.HEADER}║{Colors.RESET}  Total Nodes: {Colors.BOLD}{total_nodes}{Colors.RESET}{' ' * (56 - len(str(total_nodes)))}║")
     print(f"{Colors.HEADER}║{Colors.RESET}  Terminals: {Colors.BOLD}{terminals}{Colors.RESET}{' ' * (58 - len(str(terminals)))}║")
     print(f"{Colors.HEADER}║{Colors.RESET}  Non-terminals: {Colors.BOLD}{nonterminals}{Colors.RESET}{' ' * (54 - len(str(nonterminals)))}║")
+    print(f"{Colors.HEADER}║{Colors.RESET}  Max Depth: {Colors.BOLD}{max_depth}{Colors.RESET}{' ' * (58 - len(str(max_depth)))}║")
     
     if detected:
         print(f"{Colors.HEADER}║{Colors.RESET}  {Colors.BOLD}Detected Patterns:{Colors.RESET}{' ' * 49}║")
@@ -251,6 +331,46 @@ def show_statistics(nodes: List[TreeNode]):
     
     print(f"{Colors.HEADER}╚{'═'*68}╝{Colors.RESET}\n")
 
+def visualize_rows(rows, args):
+    """Render `(type, value, indent)` rows as `main` was asked to; returns the exit code."""
+    if args.stats_json:
+        json.dump(tree_stats.collect(rows).to_dict(), sys.stdout, indent=2)
+        sys.stdout.write('\n')
+        return 0
+    
+    # Statistics are gathered in the same pass that renders the tree
+    stats = tree_stats.TreeStats()
+    if args.stats:
+        rows = stats.observe(rows)
+    
+    if args.style == 'fancy' and args.exact:
+        model = TreeModel.from_rows(rows)
+        if not len(model):
+            print(f"{Colors.HEADER}No parse tree found in input{Colors.RESET}")
+            return 1
+        write_lines(render_fancy_model(model))
+        if args.stats:
+            show_statistics(stats)
+        return 0
+    
+    nodes = (TreeNode(node_type, value, indent) for node_type, value, indent in rows)
+    
+    # Wait for the first node so empty input gets a message instead of a frame
+    first = next(nodes, None)
+    if first is None:
+        print(f"{Colors.HEADER}No parse tree found in input{Colors.RESET}")
+        return 1
+    nodes = chain([first], nodes)
+    
+    # Visualize based on style
+    write_lines(RENDERERS[args.style](nodes))
+    
+    # Show statistics if requested
+    if args.stats:
+        show_statistics(stats)
+    
+    return 0
+
 def main():
     import argparse
     
@@ -262,59 +382,41 @@ def main():
                        help='Visualization style (default: fancy)')
     parser.add_argument('--stats', action='store_true',
                        help='Show statistics')
+    parser.add_argument('--stats-json', action='store_true',
+                       help='Print full statistics as JSON instead of drawing the tree')
     parser.add_argument('--no-color', action='store_true',
                        help='Disable colors')
+    parser.add_argument('--exact', action='store_true',
+                       help='Load the whole tree first so the fancy style marks the real last '
+                            'children (memory grows with the tree)')
     
     args = parser.parse_args()
     
-    # Read input
-    if args.input:
-        with open(args.input, 'r') as f:
-            lines = f.readlines()
-    else:
-        lines = sys.stdin.readlines()
-    
     # Disable colors if requested
     if args.no_color:
         for attr in dir(Colors):
             if not attr.startswith('_'):
                 setattr(Colors, attr, '')
     
-    # Find parse tree section
-    tree_lines = []
-    in_tree = False
-    
-    for line in lines:
-        if '=== Parse Tree ===' in line:
-            in_tree = True
-            continue
-        if in_tree:
-            tree_lines.append(line.rstrip('\n'))
-    
-    # If no tree section found, assume all input is tree
-    if not tree_lines:
-        tree_lines = [line.rstrip('\n') for line in lines if line.strip()]
-    
-    # Parse the tree
-    nodes = parse_tree_output(tree_lines)
-    
-    if not nodes:
-        print(f"{Colors.HEADER}No parse tree found in input{Colors.RESET}")
-        return 1
-    
-    # Visualize based on style
-    if args.style == 'simple':
-        visualize_tree_simple(nodes)
-    elif args.style == 'fancy':
-        visualize_tree_fancy(nodes)
-    elif args.style == 'compact':
-        visualize_tree_compact(nodes)
-    
-    # Show statistics if requested
-    if args.stats:
-        show_statistics(nodes)
-    
-    return 0
+    # Binary trees (custom_compiler --format binary) are detected by their
+    # magic number and decoded without going through text
+    if args.input:
+        with open(args.input, 'rb') as f:
+            is_binary = tree_binary.is_binary_tree(f.read(len(tree_binary.MAGIC)))
+        if is_binary:
+            return visualize_rows(iter_binary_rows(tree_binary.load_binary_trees(args.input)), args)
+        with open(args.input, 'r', errors='replace') as source:
+            return visualize_rows(iter_text_rows(iter_tree_section(source)), args)
+    else:
+        stdin = sys.stdin.buffer
+        head = stdin.read(len(tree_binary.MAGIC))
+        if tree_binary.is_binary_tree(head):
+            rows = iter_binary_rows(tree_binary.read_trees(stdin, head))
+        else:
+            first_line = (head + stdin.readline()).decode('utf-8', 'replace')
+            rest = (line.decode('utf-8', 'replace') for line in stdin)
+            rows = iter_text_rows(iter_tree_section(chain([first_line], rest)))
+    return visualize_rows(rows, args)
 
 if __name__ == '__main__':
     sys.exit(main())